@@ -1,9 +1,28 @@
 import json
-from flask import Flask, abort, request
+from flask import Flask, Response, abort, request, stream_with_context
 from flask_cors import CORS
 from .services import *
 from .db.models import *
 from .auth import sign_up, sign_in, logout, get_current_user
+from .utils import format_sse
+from .ingestion import enqueue_messages, get_job_status, derive_idempotency_key, find_existing_job
+from .dedup import filter_duplicate_messages, release_fingerprints
+from .dedup import get_stats as get_dedup_stats
+from .near_dup import group_near_duplicates, forget_messages
+from .near_dup import get_stats as get_near_dup_stats
+from .prefilter import filter_relevant_messages
+from .prefilter import get_stats as get_prefilter_stats
+from .llm_cache import get_stats as get_llm_cache_stats
+from .llm_gateway import get_stats as get_llm_gateway_stats
+from .model_router import get_stats as get_model_router_stats
+from .event_embeddings import backfill_event_embeddings
+from .vector_index import get_stats as get_vector_index_stats
+from .keyword_index import get_stats as get_keyword_index_stats
+from .query_parser import get_stats as get_query_parser_stats
+from .chat_tools import select_chat_engine, run_chat, stream_chat
+from .chat_tools import get_stats as get_chat_engine_stats
+from .query_embeddings import get_stats as get_query_embedding_stats
+from .speculation import get_stats as get_speculation_stats
 
 app = Flask(__name__)
 CORS(app, origins=["*"])
@@ -151,6 +170,24 @@ def get_me():
         }, 500
 
 
+def wants_stream():
+    """True if the client asked for a Server-Sent Events response."""
+    if request.is_json and isinstance(request.json, dict) and request.json.get('stream'):
+        return True
+    if request.args.get('stream', '').lower() in ('1', 'true'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def sse_response(events):
+    """Stream (event, data) pairs as Server-Sent Events."""
+    stream = (format_sse(event, data) for event, data in events)
+    return Response(stream_with_context(stream), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Disable proxy buffering
+    })
+
+
 @app.route('/chat', methods=['POST'])
 def chat():
     if request.method == POST:
@@ -158,7 +195,11 @@ def chat():
             abort(400, description="Expected JSON body")
         try:
             messages = request.json['prompt']
-            return chat_with_gpt(messages)
+            # Per-request engine switch (A/B of the two-stage and tool-calling engines)
+            engine = select_chat_engine(request.json.get('engine') or request.args.get('engine'))
+            if wants_stream():
+                return sse_response(stream_chat(messages, engine))
+            return run_chat(messages, engine)
         except Exception as e:
             print(e)
             abort(400, description=str(e))
@@ -182,11 +223,28 @@ def get_events_by_location(location):
     events_list = query_events_by_location(location)
     print(f"Events found: {len(events_list)}")
 
-    # 2. Generate RAG summary
+    # 2. Generate RAG summary (streamed after the events on request)
+    if wants_stream():
+        return sse_response(stream_summary(events_list, location))
     summary = generate_summary(events_list, location)
     return {"status": "ok", "summary": summary}, 200
 
 
+@app.route('/events/embeddings/backfill', methods=['POST'])
+def backfill_embeddings():
+    """Embed stored events that have no current embedding (at most `limit` per call)."""
+    if request.method != POST:
+        abort(404, description="Expected POST request")
+
+    try:
+        limit = int(request.args.get('limit', 500))
+    except ValueError:
+        abort(400, description="limit must be an integer")
+
+    result = backfill_event_embeddings(limit=limit)
+    return {"status": "ok", **result}, 200
+
+
 
 @app.route('/messages', methods=['POST'])
 def receive_messages():
@@ -197,40 +255,114 @@ def receive_messages():
     if not request.is_json:
         abort(400, description="Expected JSON body")
 
-    try:
-        payload = request.get_json()
-        raw_messages = payload.get("messages", [])
+    payload = request.get_json()
+    raw_messages = payload.get("messages", [])
 
-        if not isinstance(raw_messages, list):
-            abort(400, description="'messages' must be a list")
+    if not isinstance(raw_messages, list):
+        abort(400, description="'messages' must be a list")
 
-        
-        preprocessed_messages = preprocess_msg(raw_messages)
-        analysed_events = analyse_msg(preprocessed_messages)
-        save_result = save_event(analysed_events)
-
-        if save_result and save_result.get('result'):
-            # Create notifications for all active users
-            from .db.models import get_all_active_users, create_notification
-            
-            saved_events = save_result.get('events', [])
-            active_users = get_all_active_users()
-            
-            for event in saved_events:
-                # Only notify for critical or high severity events
-                if event.get('severity') in ['critical', 'high']:
-                    for user_id in active_users:
-                        create_notification(user_id, event)
-            
-            return {"status": "ok", "Message": "Event save successfully"}, 200
-        else:
-            abort(500, description="Event not saved")
+    pipelined = payload.get("pipelined")
+    if pipelined is not None and not isinstance(pipelined, bool):
+        abort(400, description="'pipelined' must be a boolean")
+
+    try:
+        # Webhook retries of the same delivery reuse (or resume) the original job
+        idempotency_key = (
+            request.headers.get('Idempotency-Key')
+            or payload.get('idempotency_key')
+            or derive_idempotency_key(raw_messages)
+        )
+        job_id = find_existing_job(idempotency_key)
+        if job_id:
+            return {
+                "status": "ok",
+                "job_id": job_id,
+                "status_url": f"/messages/jobs/{job_id}",
+                "replayed": True
+            }, 200
+
+        # Copies of already-seen messages only count as extra sources, no LLM call
+        raw_messages, duplicates = filter_duplicate_messages(raw_messages)
+        claimed = raw_messages
+        # Forwarded variants (emoji, "fwd", spelling) collapse into one representative
+        raw_messages, near_duplicates = group_near_duplicates(raw_messages)
+        duplicates += near_duplicates
+        representatives = raw_messages
+
+        # Greetings, memes and chatter never reach the pretriage model
+        raw_messages, dropped = filter_relevant_messages(raw_messages)
+
+        # Folded and dropped messages never reach the job: free their fingerprint claims,
+        # and only representatives that are enqueued stay in the near-duplicate index
+        kept = {id(message) for message in raw_messages}
+        forget_messages([message for message in representatives if id(message) not in kept])
+        release_fingerprints([message for message in claimed if id(message) not in kept])
+
+        # Processing (LLM calls, saving, notifications) happens in the background.
+        # The job is recorded even when nothing is left, so retries stay no-ops.
+        job_id = enqueue_messages(raw_messages, pipelined=pipelined, idempotency_key=idempotency_key)
+        if not raw_messages:
+            return {
+                "status": "ok",
+                "message": "No new relevant messages",
+                "job_id": job_id,
+                "duplicates": duplicates,
+                "dropped": dropped
+            }, 200
+
+        return {
+            "status": "accepted",
+            "job_id": job_id,
+            "status_url": f"/messages/jobs/{job_id}",
+            "duplicates": duplicates,
+            "dropped": dropped
+        }, 202
 
     except Exception as e:
         print("Error:", e)
         abort(500, description=str(e))
 
 
+@app.route('/messages/stats', methods=['GET'])
+def get_message_stats():
+    """Get duplicate suppression and prefilter counters for tuning ingestion."""
+    if request.method != GET:
+        abort(404, description="Expected GET request")
+
+    return {
+        "status": "ok",
+        "exact_duplicates": get_dedup_stats(),
+        "near_duplicates": get_near_dup_stats(),
+        "prefilter": get_prefilter_stats()
+    }, 200
+
+
+@app.route('/messages/jobs/<job_id>', methods=['GET'])
+def get_message_job(job_id):
+    """Get the progress of an ingestion job."""
+    if request.method != GET:
+        abort(404, description="Expected GET request")
+
+    job = get_job_status(job_id)
+    if not job:
+        return {"status": "error", "message": "Job not found"}, 404
+
+    return {"status": "ok", "job": job}, 200
+
+
+@app.route('/llm/stats', methods=['GET'])
+def get_llm_stats():
+    """Get LLM response cache, gateway, model router, chat engine, query parser, speculation, query embedding, vector and keyword index counters."""
+    if request.method != GET:
+        abort(404, description="Expected GET request")
+
+    return {"status": "ok", "cache": get_llm_cache_stats(), "gateway": get_llm_gateway_stats(),
+            "router": get_model_router_stats(), "chat_engines": get_chat_engine_stats(),
+            "query_parser": get_query_parser_stats(), "speculation": get_speculation_stats(),
+            "query_embeddings": get_query_embedding_stats(),
+            "vector_index": get_vector_index_stats(), "keyword_index": get_keyword_index_stats()}, 200
+
+
 # ============================================================================
 # NOTIFICATION ENDPOINTS
 # ============================================================================
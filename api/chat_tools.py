@@ -0,0 +1,289 @@
+import json
+import os
+import random
+import time
+from datetime import datetime, UTC
+from .prompt_registry import get_prompt, get_prompt_hash
+from .model_router import routed_completion, LatencyWindow
+from .llm_cache import cached_completion, cached_stream
+from .context_packer import pack_events_context
+from .query_parser import parse_query
+from .services import (
+    get_events_with_vector_search, get_chat_error_message, chat_with_gpt, stream_chat_with_gpt, model_list
+)
+from .db.models import get_events_for_chat
+
+
+# Default chat engine: "two_stage" (preprocess then answer) or "tools" (one conversation with a search tool)
+CHAT_ENGINE = os.environ.get("CHAT_ENGINE", "two_stage").lower()
+# Share of requests without an explicit engine sent to the tools engine (A/B test)
+CHAT_TOOLS_SHARE = float(os.environ.get("CHAT_TOOLS_SHARE", 0))
+# Tool rounds before the model must answer with what it found
+CHAT_TOOLS_MAX_ROUNDS = int(os.environ.get("CHAT_TOOLS_MAX_ROUNDS", 2))
+
+CHAT_ENGINES = ("two_stage", "tools")
+TOOL_CHAT_SYSTEM_PROMPT = "grok_tool_chat"
+
+SEARCH_EVENTS_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "search_events",
+        "description": "Search verified Patrol-X security and mobility events in Haiti. "
+                       "Returns one line per event, most relevant first, or NO_EVENTS.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {"type": "string", "description": "Short search text describing what the user wants"},
+                "location": {"type": "string", "description": "Standard zone name, omitted if none is mentioned"},
+                "location_is_general": {"type": "boolean", "description": "True for a hierarchical parent zone given alone"},
+                "event_types": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": [
+                        "roadblock", "shooting", "insecurity", "kidnapping", "protest",
+                        "traffic", "accident", "weather", "fire", "other"
+                    ]}
+                },
+                "severity": {"type": "string", "enum": ["critical", "high", "medium", "low"]},
+                "time_range": {"type": "string", "enum": ["today", "yesterday", "last_24h", "last_week", "any"]}
+            },
+            "required": ["query"]
+        }
+    }
+}
+
+latencies = {engine: LatencyWindow() for engine in CHAT_ENGINES}
+stats = {engine: {"requests": 0, "errors": 0, "tool_calls": 0} for engine in CHAT_ENGINES}
+
+
+def select_chat_engine(requested=None):
+    """
+    Pick the chat engine of a request.
+
+    Args:
+        requested (str): Engine asked for by the client, if any
+
+    Returns:
+        str: "two_stage" or "tools"
+    """
+    if requested in CHAT_ENGINES:
+        return requested
+    if CHAT_TOOLS_SHARE and random.random() < CHAT_TOOLS_SHARE:
+        return "tools"
+    return CHAT_ENGINE if CHAT_ENGINE in CHAT_ENGINES else "two_stage"
+
+
+def search_events_tool(arguments, question):
+    """
+    Run a search_events tool call with the retrieval of the two-stage engine.
+
+    Args:
+        arguments (dict): Tool call arguments chosen by the model
+        question (str): Original user question
+
+    Returns:
+        tuple: (events context for the model, number of events found)
+    """
+    query_params = {
+        'query_type': 'general',
+        'location': arguments.get('location') or None,
+        'location_is_general': bool(arguments.get('location_is_general')),
+        'event_types': arguments.get('event_types') or [],
+        'severity': arguments.get('severity') or None,
+        'time_range': arguments.get('time_range') or 'any',
+        'original_question': question
+    }
+    search_text = arguments.get('query') or question
+    if query_params['location']:
+        events = get_events_for_chat(query_params)
+    else:
+        events = get_events_with_vector_search(query_params, search_text)
+    context, _ = pack_events_context(events, query_params, search_text)
+    return context, len(events)
+
+
+def run_tool_rounds(messages, question, max_rounds=CHAT_TOOLS_MAX_ROUNDS):
+    """
+    Let the model call search_events until it answers or runs out of rounds.
+    Tool calls are executed locally and their results appended to messages.
+    These rounds are not cached: the response cache only stores message content.
+
+    Args:
+        messages (list): Conversation so far (updated in place)
+        question (str): Original user question
+        max_rounds (int): Model turns allowed to call tools
+
+    Yields:
+        tuple: ("retrieved", number of events) after each tool call, then
+            ("answer", content) if the model answered, or ("answer", None) if
+            the final answer still has to be generated
+    """
+    for _ in range(max_rounds):
+        response = routed_completion(
+            "chat_tools", model_list[0], messages=messages, tools=[SEARCH_EVENTS_TOOL], tool_choice="auto"
+        )
+        message = response.choices[0].message
+        if not message.tool_calls:
+            yield "answer", message.content
+            return
+
+        messages.append({
+            "role": "assistant",
+            "content": message.content or "",
+            "tool_calls": [
+                {"id": call.id, "type": "function",
+                 "function": {"name": call.function.name, "arguments": call.function.arguments}}
+                for call in message.tool_calls
+            ]
+        })
+        for call in message.tool_calls:
+            stats["tools"]["tool_calls"] += 1
+            try:
+                arguments = json.loads(call.function.arguments or "{}")
+                print(f"Tool call {call.function.name}: {arguments}")
+                if call.function.name != "search_events":
+                    raise ValueError(f"Unknown tool {call.function.name}")
+                content, found = search_events_tool(arguments, question)
+            except Exception as e:
+                print(f"Tool call failed: {e}")
+                content, found = f"ERROR: {e}", 0
+            messages.append({"role": "tool", "tool_call_id": call.id, "content": content})
+            yield "retrieved", found
+    yield "answer", None
+
+
+def build_tool_chat_messages(message):
+    print(f"Answering with {TOOL_CHAT_SYSTEM_PROMPT}@{get_prompt_hash(TOOL_CHAT_SYSTEM_PROMPT)}")
+    return [
+        {"role": "system", "content": get_prompt(TOOL_CHAT_SYSTEM_PROMPT)},
+        {"role": "user", "content": f"{message}\n\nToday's date: {datetime.now(UTC).strftime('%Y-%m-%d')}"}
+    ]
+
+
+def chat_with_tools(message):
+    """
+    Answer a chat question in one conversation: the model picks the search
+    filters itself through the search_events tool.
+
+    Args:
+        message (str): User's question/prompt
+
+    Returns:
+        dict: Response with status and answer
+    """
+    print(f"Chat with Grok (tools): {message}")
+    messages = build_tool_chat_messages(message)
+    try:
+        answer = None
+        for step, value in run_tool_rounds(messages, message):
+            if step == "answer":
+                answer = value
+        if answer is None:
+            # Same response cache as the two-stage answers, so the A/B latencies compare
+            answer = cached_completion(
+                "chat_tools", model=model_list[0], messages=messages, tools=[SEARCH_EVENTS_TOOL], tool_choice="none"
+            )
+        if not answer:
+            raise ValueError("Empty answer")
+        return {"status": "ok", "answer": answer}
+    except Exception as e:
+        print(f"Error in tools chat: {e}")
+        return {"status": "error", "answer": get_chat_error_message(parse_query(message)[0]['language'])}
+
+
+def stream_chat_with_tools(message):
+    """
+    Streaming variant of chat_with_tools, with the same events as stream_chat_with_gpt.
+    The model gets one tool round, so the answer can be streamed as soon as
+    the search results are in.
+
+    Args:
+        message (str): User's question/prompt
+
+    Yields:
+        tuple: (event name, data), see stream_chat_with_gpt
+    """
+    print(f"Streaming chat with Grok (tools): {message}")
+    messages = build_tool_chat_messages(message)
+    yield "progress", {"stage": "understood", "query": {"original_question": message}}
+    try:
+        answer = None
+        for step, value in run_tool_rounds(messages, message, max_rounds=1):
+            if step == "retrieved":
+                yield "progress", {"stage": "retrieved", "events": value}
+            else:
+                answer = value
+        if answer is not None:
+            # The model answered during the tool rounds
+            yield "token", {"text": answer}
+        else:
+            for chunk in cached_stream(
+                "chat_tools", model=model_list[0], messages=messages, tools=[SEARCH_EVENTS_TOOL], tool_choice="none"
+            ):
+                yield "token", {"text": chunk}
+    except Exception as e:
+        print(f"Error streaming tools chat: {e}")
+        yield "error", {"status": "error", "answer": get_chat_error_message(parse_query(message)[0]['language'])}
+        return
+
+    yield "done", {"status": "ok"}
+
+
+def run_chat(message, engine):
+    """
+    Answer a chat question with the given engine, timing it for the A/B comparison.
+
+    Args:
+        message (str): User's question/prompt
+        engine (str): "two_stage" or "tools"
+
+    Returns:
+        dict: Response with status, answer and engine
+    """
+    started = time.monotonic()
+    result = chat_with_tools(message) if engine == "tools" else chat_with_gpt(message)
+    record_chat(engine, time.monotonic() - started, result.get("status") != "ok")
+    return {**result, "engine": engine}
+
+
+def stream_chat(message, engine):
+    """
+    Streaming variant of run_chat. The engine is reported in the done event.
+
+    Args:
+        message (str): User's question/prompt
+        engine (str): "two_stage" or "tools"
+
+    Yields:
+        tuple: (event name, data)
+    """
+    started = time.monotonic()
+    events = stream_chat_with_tools(message) if engine == "tools" else stream_chat_with_gpt(message)
+    failed = False
+    for event, data in events:
+        if event == "error":
+            failed = True
+        if event in ("done", "error"):
+            data = {**data, "engine": engine}
+        yield event, data
+    record_chat(engine, time.monotonic() - started, failed)
+
+
+def record_chat(engine, latency, failed):
+    stats[engine]["requests"] += 1
+    if failed:
+        stats[engine]["errors"] += 1
+    latencies[engine].add(latency, failed)
+
+
+def get_stats():
+    """
+    Get request, error and latency counters per chat engine.
+
+    Returns:
+        dict: {engine: counters and p50/p95 latency}, plus the engine settings
+    """
+    return {
+        "default": CHAT_ENGINE,
+        "tools_share": CHAT_TOOLS_SHARE,
+        "engines": {engine: {**stats[engine], **latencies[engine].snapshot()} for engine in CHAT_ENGINES}
+    }
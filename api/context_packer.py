@@ -0,0 +1,186 @@
+import math
+import os
+import threading
+from datetime import datetime, UTC
+from .utils import estimate_tokens
+from .dedup import normalize_text
+from .near_dup import get_shingles, NEAR_DUP_THRESHOLD
+from .db.models import SEVERITY_RANK, canonical_location, event_last_activity, parse_timestamp
+
+
+# Token budget of the events context of a chat prompt
+RAG_CONTEXT_TOKENS = int(os.environ.get("RAG_CONTEXT_TOKENS", 1500))
+# Local tokenizer.json, or a Hugging Face tokenizer name downloaded once.
+# An empty RAG_TOKENIZER without a path keeps the length estimate.
+RAG_TOKENIZER_PATH = os.environ.get("RAG_TOKENIZER_PATH")
+RAG_TOKENIZER = os.environ.get("RAG_TOKENIZER", "Xenova/grok-1-tokenizer")
+# Hours after which an event's recency score is halved
+RAG_RECENCY_HALF_LIFE_HOURS = float(os.environ.get("RAG_RECENCY_HALF_LIFE_HOURS", 6))
+
+# Ranking weights
+RELEVANCE_WEIGHT = 3.0
+SEVERITY_WEIGHT = 1.0
+RECENCY_WEIGHT = 2.0
+SOURCES_WEIGHT = 0.5
+
+tokenizer = None
+
+
+def load_tokenizer():
+    """Load the tokenizer. Until it is loaded (or if it cannot be), token counts are estimated."""
+    global tokenizer
+    if not (RAG_TOKENIZER_PATH or RAG_TOKENIZER):
+        return
+    try:
+        from tokenizers import Tokenizer
+        if RAG_TOKENIZER_PATH:
+            tokenizer = Tokenizer.from_file(RAG_TOKENIZER_PATH)
+        else:
+            tokenizer = Tokenizer.from_pretrained(RAG_TOKENIZER)
+        print(f"Loaded tokenizer {RAG_TOKENIZER_PATH or RAG_TOKENIZER}")
+    except Exception as e:
+        print(f"Tokenizer unavailable, estimating tokens from length: {e}")
+
+
+# Loaded in the background so a slow download never delays a chat request
+threading.Thread(target=load_tokenizer, daemon=True).start()
+
+
+def count_tokens(text):
+    """
+    Count the tokens of a text with the tokenizer, or estimate them.
+
+    Args:
+        text (str): Text
+
+    Returns:
+        int: Token count
+    """
+    current = tokenizer
+    if current is None:
+        return estimate_tokens(text)
+    return len(current.encode(text, add_special_tokens=False).ids)
+
+
+def get_query_terms(query_params, question):
+    """Normalized terms of the question and of the extracted location and event types."""
+    parts = [question or '', query_params.get('location') or '']
+    parts += query_params.get('event_types') or []
+    return {term for term in normalize_text(" ".join(parts)).split() if len(term) > 2}
+
+
+def score_event(event, query_terms, now):
+    """
+    Rank an event for the context: relevance to the question, severity, recency and corroboration.
+
+    Args:
+        event (dict): Event
+        query_terms (set): Normalized query terms
+        now (datetime): Reference time
+
+    Returns:
+        float: Score (higher first)
+    """
+    text = " ".join(str(event.get(field) or '') for field in ('summary', 'location', 'event_type'))
+    event_terms = set(normalize_text(text).split())
+    relevance = len(query_terms & event_terms) / len(query_terms) if query_terms else 0.0
+
+    severity = SEVERITY_RANK.get(event.get('severity'), 0) / max(SEVERITY_RANK.values())
+
+    last_activity = event_last_activity(event)
+    if last_activity:
+        age_hours = max((now - last_activity).total_seconds() / 3600, 0)
+        recency = 0.5 ** (age_hours / RAG_RECENCY_HALF_LIFE_HOURS)
+    else:
+        recency = 0.0
+
+    sources = math.log1p(event.get('sources_count') or 1) / math.log1p(10)
+
+    return (RELEVANCE_WEIGHT * relevance + SEVERITY_WEIGHT * severity
+            + RECENCY_WEIGHT * recency + SOURCES_WEIGHT * min(sources, 1.0))
+
+
+def format_time(value):
+    parsed = parse_timestamp(value) if value else None
+    return parsed.strftime("%m-%d %H:%M") if parsed else str(value or '?')
+
+
+def format_event_line(event, reports=1):
+    """
+    Format an event as one compact context line:
+    [time] severity type @ location: summary | src: ... | action: ...
+
+    Args:
+        event (dict): Event
+        reports (int): Number of near-identical events folded into this one
+
+    Returns:
+        str: Context line
+    """
+    line = (f"- [{format_time(event.get('timestamp_start'))}] {event.get('severity', '?')} "
+            f"{event.get('event_type', '?')} @ {event.get('location', '?')}: {event.get('summary', '')}")
+    if event.get('sources'):
+        sources = event['sources']
+        line += f" | src: {', '.join(map(str, sources)) if isinstance(sources, list) else sources}"
+    if reports > 1:
+        line += f" | x{reports} similar"
+    if event.get('recommended_action'):
+        line += f" | action: {event['recommended_action']}"
+    return line
+
+
+def similarity(shingles1, shingles2):
+    if not shingles1 or not shingles2:
+        return 0.0
+    return len(shingles1 & shingles2) / len(shingles1 | shingles2)
+
+
+def pack_events_context(events, query_params=None, question='', max_tokens=None):
+    """
+    Build the events context of a chat prompt within a token budget.
+    Events are ranked, near-identical summaries are folded together and lines
+    are added best first until the budget is spent.
+
+    Args:
+        events (list): Candidate events
+        query_params (dict): Query parameters from preprocessing
+        question (str): Original user question
+        max_tokens (int): Token budget, defaults to RAG_CONTEXT_TOKENS
+
+    Returns:
+        tuple: (context string or "NO_EVENTS", number of events packed)
+    """
+    if not events:
+        return "NO_EVENTS", 0
+
+    budget = max_tokens or RAG_CONTEXT_TOKENS
+    query_terms = get_query_terms(query_params or {}, question)
+    now = datetime.now(UTC)
+    ranked = sorted(events, key=lambda e: score_event(e, query_terms, now), reverse=True)
+
+    # Fold near-identical summaries of the same place and type into the best ranked one
+    kept = []  # [event, (location, type), shingles, reports]
+    for event in ranked:
+        group = (canonical_location(event.get('location')), event.get('event_type'))
+        shingles = get_shingles(event.get('summary') or '')
+        for entry in kept:
+            if entry[1] == group and similarity(shingles, entry[2]) >= NEAR_DUP_THRESHOLD:
+                entry[3] += 1
+                break
+        else:
+            kept.append([event, group, shingles, 1])
+
+    lines = []
+    used = 0
+    for event, _, _, reports in kept:
+        line = format_event_line(event, reports)
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            continue
+        lines.append(line)
+        used += cost
+
+    if not lines:
+        return "NO_EVENTS", 0
+    print(f"Packed {len(lines)}/{len(events)} events into {used} context tokens")
+    return "\n".join(lines), len(lines)
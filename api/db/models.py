@@ -1,6 +1,11 @@
 import json
 import os
+import re
+import threading
+import unicodedata
+from contextlib import ExitStack
 from pymongo.mongo_client import MongoClient
+from pymongo.errors import BulkWriteError
 from pymongo.server_api import ServerApi
 from datetime import UTC, datetime, timedelta
 
@@ -23,6 +28,13 @@ processed_messages_collection = db['processed_messages']
 users_collection = db['users']
 sessions_collection = db['sessions']
 notifications_collection = db['notifications']
+ingestion_jobs_collection = db['ingestion_jobs']
+message_fingerprints_collection = db['message_fingerprints']
+llm_cache_collection = db['llm_cache']
+
+
+# Events returned by the API: no internal id, no stored embedding
+EVENT_PROJECTION = {"_id": 0, "embedding": 0, "embedding_model": 0, "embedding_version": 0}
 
 
 def get_time_cutoff(time_range):
@@ -46,35 +58,25 @@ def get_time_cutoff(time_range):
 
 def build_location_query(location, location_is_general):
     """Build MongoDB query for location filtering, respecting hierarchy."""
+    from ..gazetteer import get_general_zone
+    
     if not location:
         return {}
     
-    # Hierarchical zones that support parent → subzone
-    hierarchical_zones = {
-        "Delmas": ["Delmas"],
-        "Tabarre": ["Tabarre", "Clercine", "Klèsin"],
-        "Pétion-Ville": ["Pétion-Ville", "Petionville", "Petyonvil", "PV"],
-        "Croix-des-Bouquets": ["Croix-des-Bouquets", "Kwadebouke", "Bon Repos"],
-        "Pèlerin": ["Pèlerin", "Pelerin"],
-        "Thomassin": ["Thomassin"],
-        "Canapé-Vert": ["Canapé-Vert", "Kanapevè"],
-        "Laboule": ["Laboule", "Laboul"]
-    }
-    
     # Normalize location name
     location_normalized = location.strip()
     
     # Check if this is a hierarchical parent
     if location_is_general:
-        # Find matching parent zone
-        for parent, variants in hierarchical_zones.items():
-            if any(location_normalized.lower() == v.lower() for v in variants):
-                # Build regex to match parent and all subzones
-                # e.g., "Delmas" should match "Delmas", "Delmas 19", "Delmas 33", etc.
-                # Pattern: ^Delmas($|\s|\s\d+)
-                parent_pattern = parent.replace("-", "\\-")  # Escape hyphens
-                regex_pattern = f"^{parent_pattern}($|\\s|\\s\\d+)"
-                return {"location": {"$regex": regex_pattern, "$options": "i"}}
+        # Find the parent zone in the gazetteer (name, alias or subzone of a parent)
+        parent_zone = get_general_zone(location_normalized)
+        if parent_zone:
+            # Build regex to match parent and all subzones
+            # e.g., "Delmas" should match "Delmas", "Delmas 19", "Delmas 33", etc.
+            # Pattern: ^Delmas($|\s|\s\d+)
+            parent_pattern = parent_zone["name"].replace("-", "\\-")  # Escape hyphens
+            regex_pattern = f"^{parent_pattern}($|\\s|\\s\\d+)"
+            return {"location": {"$regex": regex_pattern, "$options": "i"}}
         
         # If not found in hierarchical list, treat as exact match
         return {"location": {"$regex": f"^{location_normalized.replace('-', '\\-')}$", "$options": "i"}}
@@ -85,7 +87,81 @@ def build_location_query(location, location_is_general):
         return {"location": {"$regex": f"^{escaped_location}$", "$options": "i"}}
 
 
-def get_events_for_chat(query_params):
+def build_chat_query(query_params):
+    """
+    Build the MongoDB query of a chat question.
+    
+    Args:
+        query_params (dict): Query parameters (see get_events_for_chat)
+    
+    Returns:
+        dict: MongoDB query
+    """
+    query = {}
+    
+    # Location filter (normalize empty strings to None)
+    location = query_params.get('location')
+    if location and location.strip():
+        location_query = build_location_query(
+            location,
+            query_params.get('location_is_general', False)
+        )
+        query.update(location_query)
+    
+    # Event type filter
+    event_types = query_params.get('event_types', [])
+    if event_types and len(event_types) > 0:
+        query['event_type'] = {"$in": event_types}
+    
+    # Severity filter (include the specified severity and higher)
+    severity = query_params.get('severity')
+    if severity:
+        severity_order = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+        severity_level = severity_order.get(severity.lower(), 3)
+        # Include all severities at or above the requested level
+        allowed_severities = [
+            s for s, level in severity_order.items() 
+            if level <= severity_level
+        ]
+        query['severity'] = {"$in": allowed_severities}
+    
+    # Time range filter
+    time_range = query_params.get('time_range', 'any')
+    cutoff = get_time_cutoff(time_range)
+    if cutoff:
+        # MongoDB can compare ISO strings directly, but we'll use string format for consistency
+        cutoff_str = cutoff.isoformat()
+        query['timestamp_start'] = {"$gte": cutoff_str}
+    
+    return query
+
+
+def match_chat_query(event, query):
+    """
+    Evaluate a query built by build_chat_query on an event in memory
+    (the $regex, $in and $gte operators it uses, with MongoDB semantics).
+    
+    Args:
+        event (dict): Event
+        query (dict): Query from build_chat_query
+    
+    Returns:
+        bool: True if MongoDB would return the event
+    """
+    for field, condition in query.items():
+        value = event.get(field)
+        if "$regex" in condition:
+            flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+            if not isinstance(value, str) or not re.search(condition["$regex"], value, flags):
+                return False
+        if "$in" in condition and value not in condition["$in"]:
+            return False
+        if "$gte" in condition and (not isinstance(value, str) or value < condition["$gte"]):
+            return False
+    return True
+
+
+def get_events_for_chat(query_params, include_embeddings=False, limit=100, include_ids=False):
     """
     Flexible query function that supports multiple filters.
     
@@ -97,57 +173,33 @@ def get_events_for_chat(query_params):
             - severity (str or None): Severity level to filter by
             - time_range (str): "today", "yesterday", "last_24h", "last_week", "any"
             - query_type (str): Type of query for logging
+        include_embeddings (bool): Also return the stored embedding fields (vector search)
+        limit (int): Maximum number of events, most recent first
+        include_ids (bool): Keep _id (as a string), e.g. to load the embeddings later
     
     Returns:
         list: List of matching events
     """
     try:
         # Build MongoDB query
-        query = {}
-        
-        # Location filter (normalize empty strings to None)
-        location = query_params.get('location')
-        if location and location.strip():
-            location_query = build_location_query(
-                location,
-                query_params.get('location_is_general', False)
-            )
-            query.update(location_query)
-        
-        # Event type filter
-        event_types = query_params.get('event_types', [])
-        if event_types and len(event_types) > 0:
-            query['event_type'] = {"$in": event_types}
-        
-        # Severity filter (include the specified severity and higher)
-        severity = query_params.get('severity')
-        if severity:
-            severity_order = {"critical": 0, "high": 1, "medium": 2, "low": 3}
-            severity_level = severity_order.get(severity.lower(), 3)
-            # Include all severities at or above the requested level
-            allowed_severities = [
-                s for s, level in severity_order.items() 
-                if level <= severity_level
-            ]
-            query['severity'] = {"$in": allowed_severities}
-        
-        # Time range filter
-        time_range = query_params.get('time_range', 'any')
-        cutoff = get_time_cutoff(time_range)
-        if cutoff:
-            # MongoDB can compare ISO strings directly, but we'll use string format for consistency
-            cutoff_str = cutoff.isoformat()
-            query['timestamp_start'] = {"$gte": cutoff_str}
+        query = build_chat_query(query_params)
         
         print(f"Query params: {query_params}")
         print(f"MongoDB query: {query}")
         
+        projection = {"_id": 0} if include_embeddings else dict(EVENT_PROJECTION)
+        if include_ids:
+            del projection["_id"]
+        
         # Execute query
         results = list(
-            event_collection.find(query, {"_id": 0})
+            event_collection.find(query, projection or None)
             .sort("timestamp_start", -1)
-            .limit(100)  # Limit to prevent huge responses
+            .limit(limit)  # Limit to prevent huge responses
         )
+        if include_ids:
+            for event in results:
+                event['_id'] = str(event['_id'])
         
         print(f"Found {len(results)} events")
         return results
@@ -158,36 +210,361 @@ def get_events_for_chat(query_params):
 
 
 def save_processed_messages(preprocessed_message):
+    """
+    Save pretriage output in bulk. Documents carry a deterministic _id, so
+    saving the same output again (job retry) leaves the stored copies as is.
+    
+    Args:
+        preprocessed_message (list): Pretriaged message documents
+    
+    Returns:
+        InsertManyResult: Result or None if every message was already stored
+    """
     try:
-        result = processed_messages_collection.insert_many(preprocessed_message)
+        result = processed_messages_collection.insert_many(preprocessed_message, ordered=False)
         return result
-    except Exception as e:
+    except BulkWriteError as e:
+        if all(error.get('code') == 11000 for error in e.details.get('writeErrors', [])):
+            return None
         raise e
 
 
+def get_processed_messages(job_id):
+    """
+    Get the stored pretriage output of an ingestion job.
+    
+    Args:
+        job_id (str): Ingestion job ID
+    
+    Returns:
+        list: Pretriaged messages ordered by ref
+    """
+    return list(
+        processed_messages_collection.find({"job_id": job_id}, {"_id": 0, "job_id": 0})
+        .sort("ref", 1)
+    )
+
+
+def get_events_by_ids(event_ids, include_embeddings=True):
+    """
+    Get events by their IDs.
+    
+    Args:
+        event_ids (list): Event IDs
+        include_embeddings (bool): Also return the stored embedding fields
+    
+    Returns:
+        list: Events with _id as string
+    """
+    from bson import ObjectId
+    
+    projection = None if include_embeddings else {"embedding": 0}
+    events = list(event_collection.find({"_id": {"$in": [ObjectId(i) for i in event_ids]}}, projection))
+    for event in events:
+        event['_id'] = str(event['_id'])
+    return events
+
+
+def get_event_embeddings(event_ids):
+    """
+    Get the stored embedding fields of events.
+    
+    Args:
+        event_ids (list): Event IDs
+    
+    Returns:
+        dict: {event id: {embedding, embedding_model, embedding_version}} of the events that have them
+    """
+    from bson import ObjectId
+    
+    if not event_ids:
+        return {}
+    try:
+        events = event_collection.find(
+            {"_id": {"$in": [ObjectId(i) for i in event_ids]}, "embedding": {"$exists": True}},
+            {"embedding": 1, "embedding_model": 1, "embedding_version": 1}
+        )
+        return {str(event.pop('_id')): event for event in events}
+    except Exception as e:
+        print(f"Error getting event embeddings: {e}")
+        return {}
+
+
+# How long after its last report an event can still absorb new reports
+EVENT_MERGE_WINDOW_HOURS = float(os.environ.get("EVENT_MERGE_WINDOW_HOURS", 3))
+
+# Event types that describe the same incident when reported at the same place
+EVENT_TYPE_GROUPS = [
+    {"shooting", "gunshots", "insecurity"},
+    {"roadblock", "protest"},
+    {"traffic", "accident"},
+]
+
+SEVERITY_RANK = {"low": 0, "medium": 1, "high": 2, "critical": 3}
+
+# Bookkeeping set on returned events, never stored
+MERGE_ONLY_FIELDS = ('merged', 'escalated', 'merged_cluster_ids')
+
+event_indexes_ready = False
+
+# Parallel saves (pipelined clusters) at the same location run one at a time,
+# so each one sees the events the other inserted and merges instead of duplicating
+location_locks = {}  # location_key -> threading.Lock
+location_locks_lock = threading.Lock()
+
+
+def get_location_lock(location_key):
+    with location_locks_lock:
+        if location_key not in location_locks:
+            location_locks[location_key] = threading.Lock()
+        return location_locks[location_key]
+
+
+def canonical_location(location):
+    """
+    Canonical form of a location used to match events (case, accents and punctuation ignored).
+    
+    Args:
+        location (str): Location as returned by analysis
+    
+    Returns:
+        str: Canonical location or None
+    """
+    if not location or not isinstance(location, str):
+        return None
+    
+    folded = unicodedata.normalize("NFKD", location.casefold())
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    folded = re.sub(r"[^a-z0-9]+", " ", folded).strip()
+    return folded if folded and folded not in ("null", "none", "unknown") else None
+
+
+def compatible_event_types(event_type):
+    """Event types that can be merged with the given one."""
+    for group in EVENT_TYPE_GROUPS:
+        if event_type in group:
+            return group
+    return {event_type}
+
+
+def parse_timestamp(value):
+    """Parse an ISO timestamp (naive values are taken as UTC), or None."""
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=UTC)
+    except (TypeError, ValueError):
+        return None
+
+
+def event_last_activity(event):
+    """Latest known time of an event: its end, last report or start."""
+    times = [parse_timestamp(event.get(field)) for field in ('timestamp_end', 'last_seen_at', 'timestamp_start')]
+    times = [t for t in times if t]
+    return max(times) if times else None
+
+
+def find_merge_target(event, candidates):
+    """
+    Find an open event describing the same incident: same canonical location,
+    compatible type and reported within EVENT_MERGE_WINDOW_HOURS.
+    
+    Args:
+        event (dict): New event
+        candidates (list): Recent events (stored or pending insert)
+    
+    Returns:
+        dict: Matching candidate or None
+    """
+    if not event.get('location_key'):
+        return None
+    
+    start = parse_timestamp(event.get('timestamp_start')) or datetime.now(UTC)
+    window = timedelta(hours=EVENT_MERGE_WINDOW_HOURS)
+    types = compatible_event_types(event.get('event_type'))
+    
+    for candidate in candidates:
+        if candidate.get('location_key') != event['location_key']:
+            continue
+        if candidate.get('event_type') not in types:
+            continue
+        last_activity = event_last_activity(candidate)
+        if last_activity and abs(start - last_activity) <= window:
+            return candidate
+    return None
+
+
+def merge_into(target, event):
+    """
+    Merge a new report into an event in memory.
+    
+    Args:
+        target (dict): Event absorbing the report (modified in place)
+        event (dict): New event
+    
+    Returns:
+        dict: Fields raised on the target (last_seen_at, timestamp_end, probability,
+            severity and priority), for the database update. The merged
+            messages_used and sources_count are accumulated by the caller.
+    """
+    now = datetime.now(UTC).isoformat()
+    changes = {"last_seen_at": now}
+    
+    end = event.get('timestamp_end') or event.get('timestamp_start')
+    if end and (not target.get('timestamp_end') or str(end) > str(target['timestamp_end'])):
+        changes['timestamp_end'] = end
+    
+    probability = event.get('probability')
+    if isinstance(probability, (int, float)) and probability > (target.get('probability') or 0):
+        changes['probability'] = probability
+    
+    if SEVERITY_RANK.get(event.get('severity'), -1) > SEVERITY_RANK.get(target.get('severity'), -1):
+        changes['severity'] = event['severity']
+        changes['priority'] = event.get('priority', target.get('priority'))
+        target['escalated'] = True
+    
+    target.update(changes)
+    target['messages_used'] = list(target.get('messages_used') or []) + list(event.get('messages_used') or [])
+    target['sources_count'] = (target.get('sources_count') or 1) + (event.get('sources_count') or 1)
+    # Lets callers map the merged report's cluster to this event
+    target.setdefault('merged_cluster_ids', []).append(event.get('cluster_id'))
+    return changes
+
+
+def ensure_event_indexes():
+    """Create the location index used to find merge targets, once per process."""
+    global event_indexes_ready
+    if event_indexes_ready:
+        return
+    try:
+        event_collection.create_index([("location_key", 1), ("timestamp_start", -1)])
+        event_indexes_ready = True
+    except Exception as e:
+        print(f"Error creating event indexes: {e}")
+
+
 def save_event(analysed_events):
     """
     Save events to database and return the saved events with their IDs.
+    New reports of an ongoing incident (same canonical location, compatible
+    type, within the merge window) update the existing event in place
+    instead of creating a new one. Saves at the same locations are serialized
+    within the process, so parallel cluster workers never insert one incident twice.
     
     Args:
         analysed_events (dict): Dictionary with 'events' list
     
     Returns:
-        dict: Dictionary with 'result' (InsertManyResult) and 'events' (with _id added)
+        dict: Dictionary with 'result' (InsertManyResult or BulkWriteResult) and
+            'events' (with _id added; merged events carry 'merged': True and
+            'escalated': True when their severity increased)
     """
-    try:
-        result = event_collection.insert_many(analysed_events['events'])
+    ensure_event_indexes()
+    
+    events = analysed_events['events']
+    for event in events:
+        event['location_key'] = canonical_location(event.get('location'))
+    
+    location_keys = sorted({e['location_key'] for e in events if e['location_key']})
+    with ExitStack() as stack:
+        # Always locked in sorted order, so two saves cannot wait on each other
+        for location_key in location_keys:
+            stack.enter_context(get_location_lock(location_key))
+        return merge_or_insert_events(events, location_keys)
+
+
+def merge_or_insert_events(events, location_keys):
+    """
+    Merge events into recent events at the same location or insert them
+    (save_event, with the location locks held).
+    
+    Args:
+        events (list): Events with location_key set
+        location_keys (list): Canonical locations of the events
+    
+    Returns:
+        dict: Dictionary with 'result' and 'events' (see save_event)
+    """
+    from bson import ObjectId
+    from pymongo import UpdateOne
+    
+    # Recent events at the same locations, in one query
+    recent_events = []
+    if location_keys:
+        cutoff = (datetime.now(UTC) - timedelta(hours=24)).isoformat()
+        recent_events = list(event_collection.find({
+            "location_key": {"$in": location_keys},
+            "timestamp_start": {"$gte": cutoff[:19]}
+        }).sort("timestamp_start", -1))
+        for event in recent_events:
+            event['_id'] = str(event['_id'])
+    
+    new_events = []
+    updates = {}  # event _id -> accumulated update of an existing event
+    for event in events:
+        target = find_merge_target(event, new_events + recent_events)
+        if target is None:
+            new_events.append(event)
+            continue
         
+        changes = merge_into(target, event)
+        if '_id' not in target:
+            # Merged into an event of this batch that is not inserted yet
+            continue
+        
+        target['merged'] = True
+        update = updates.setdefault(target['_id'], {
+            "event": target, "max": {}, "escalation": {}, "messages": [], "sources": 0
+        })
+        for field in ('severity', 'priority'):
+            if field in changes:
+                update['escalation'][field] = changes.pop(field)
+        update['max'].update(changes)
+        update['messages'].extend(event.get('messages_used') or [])
+        update['sources'] += event.get('sources_count') or 1
+    
+    # Watermark of the in-memory indexes: any write they need to see sets it
+    now = datetime.now(UTC).isoformat()
+    result = None
+    if new_events:
+        result = event_collection.insert_many([
+            {**{k: v for k, v in event.items() if k not in MERGE_ONLY_FIELDS}, "updated_at": now}
+            for event in new_events
+        ])
         # Add _id to events for notification creation
-        for i, event in enumerate(analysed_events['events']):
+        for i, event in enumerate(new_events):
             event['_id'] = str(result.inserted_ids[i])
-        
-        return {
-            'result': result,
-            'events': analysed_events['events']
-        }
-    except Exception as e:
-        raise e
+            event.pop('escalated', None)
+    
+    if updates:
+        # Accumulated fields are updated with operators, so concurrent merges
+        # into the same event (other clusters or jobs) never overwrite each other
+        operations = []
+        for event_id, update in updates.items():
+            operation = {
+                "$inc": {"sources_count": update['sources']},
+                "$max": update['max'],
+                "$set": {"updated_at": now}
+            }
+            if update['messages']:
+                operation["$push"] = {"messages_used": {"$each": update['messages']}}
+            operations.append(UpdateOne({"_id": ObjectId(event_id)}, operation))
+            
+            escalation = update['escalation']
+            if escalation:
+                # Only raise the stored severity, whatever was written since it was read
+                lower = [s for s, rank in SEVERITY_RANK.items() if rank < SEVERITY_RANK[escalation['severity']]]
+                operations.append(UpdateOne(
+                    {"_id": ObjectId(event_id), "severity": {"$in": lower + [None]}},
+                    {"$set": {**escalation, "updated_at": now}}
+                ))
+        bulk_result = event_collection.bulk_write(operations, ordered=False)
+        result = result or bulk_result
+        print(f"Merged reports into {len(updates)} existing events")
+    
+    return {
+        'result': result,
+        'events': new_events + [update['event'] for update in updates.values()]
+    }
 
 
 def query_events_by_location(location):
@@ -205,7 +582,7 @@ def query_events_by_location(location):
                     "$options": "i"   # case-insensitive
                 },
             },
-            {"_id": 0}
+            EVENT_PROJECTION
         ).sort("timestamp_start", -1)
     )
 
@@ -223,14 +600,14 @@ def query_events(mode="last_24h", limit=20):
     """
     if mode == "latest":
         return event_collection.find_one(
-            {}, {"_id": 0},
+            {}, EVENT_PROJECTION,
             sort=[("timestamp_start", -1)]
         )
     
     if mode == "limit":
         return list(
             event_collection.find(
-                {}, {"_id": 0}
+                {}, EVENT_PROJECTION
             )
             .sort("timestamp_start", -1)
             .limit(limit)
@@ -243,7 +620,7 @@ def query_events(mode="last_24h", limit=20):
         return list(
             event_collection.find(
                 {"timestamp_start": {"$gte": cutoff_str}},
-                {"_id": 0}
+                EVENT_PROJECTION
             ).sort("timestamp_start", -1)
         )
 
@@ -646,3 +1023,581 @@ def get_all_active_users():
     except Exception as e:
         print(f"Error getting active users: {e}")
         return []
+
+
+# ============================================================================
+# INGESTION JOB FUNCTIONS
+# ============================================================================
+
+def ensure_ingestion_job_indexes():
+    """Create the idempotency key index of jobs and the job index of processed messages."""
+    try:
+        ingestion_jobs_collection.create_index("idempotency_key", unique=True, sparse=True)
+        processed_messages_collection.create_index("job_id")
+    except Exception as e:
+        print(f"Error creating ingestion job indexes: {e}")
+
+
+def create_ingestion_job(raw_messages, pipelined=False, idempotency_key=None):
+    """
+    Create a queued ingestion job for a batch of raw messages.
+    A batch with nothing left to process is recorded as already done.
+    
+    Args:
+        raw_messages (list): Raw messages received on /messages
+        pipelined (bool): Whether clusters are analysed and saved one by one
+        idempotency_key (str): Key identifying retries of the same delivery
+    
+    Returns:
+        str: Job ID
+    
+    Raises:
+        DuplicateKeyError: If a job already exists for the idempotency key
+    """
+    now = datetime.now(UTC).isoformat()
+    status = "queued" if raw_messages else "done"
+    job = {
+        "status": status,
+        "stage": status,
+        "messages": raw_messages,
+        "message_count": len(raw_messages),
+        "pipelined": pipelined,
+        "completed_stages": [],
+        "events_saved": 0,
+        "notifications_sent": 0,
+        "error": None,
+        "created_at": now,
+        "updated_at": now
+    }
+    if idempotency_key:
+        job["idempotency_key"] = idempotency_key
+    result = ingestion_jobs_collection.insert_one(job)
+    return str(result.inserted_id)
+
+
+def get_ingestion_job_by_key(idempotency_key):
+    """
+    Get the ingestion job created for an idempotency key.
+    
+    Args:
+        idempotency_key (str): Idempotency key
+    
+    Returns:
+        dict: Job document (without raw messages) or None
+    """
+    try:
+        job = ingestion_jobs_collection.find_one({"idempotency_key": idempotency_key}, {"messages": 0})
+        if job:
+            job['_id'] = str(job['_id'])
+        return job
+    except Exception as e:
+        print(f"Error getting ingestion job by key: {e}")
+        return None
+
+
+def requeue_ingestion_job(job_id):
+    """
+    Put a failed job back in the queue. Completed stages are kept so the
+    job resumes where it stopped.
+    
+    Args:
+        job_id (str): Job ID
+    
+    Returns:
+        bool: True if the job was failed and is queued again
+    """
+    try:
+        from bson import ObjectId
+        
+        result = ingestion_jobs_collection.update_one(
+            {"_id": ObjectId(job_id), "status": "failed"},
+            {"$set": {"status": "queued", "stage": "queued", "error": None,
+                      "updated_at": datetime.now(UTC).isoformat()}}
+        )
+        return result.modified_count > 0
+    except Exception as e:
+        print(f"Error requeuing ingestion job: {e}")
+        return False
+
+
+def complete_ingestion_job_stage(job_id, stage, **fields):
+    """
+    Record that a stage of a job finished, with the data needed to skip it on retry.
+    
+    Args:
+        job_id (str): Job ID
+        stage (str): Stage name (pretriage, analysis, saved, notified, or cluster:<id>)
+        **fields: Fields to set alongside
+    """
+    from bson import ObjectId
+    
+    fields['updated_at'] = datetime.now(UTC).isoformat()
+    ingestion_jobs_collection.update_one(
+        {"_id": ObjectId(job_id)},
+        {"$addToSet": {"completed_stages": stage}, "$set": fields}
+    )
+
+
+def claim_ingestion_job(job_id):
+    """
+    Atomically move a queued job to running so only one worker processes it.
+    
+    Args:
+        job_id (str): Job ID
+    
+    Returns:
+        dict: Claimed job document or None if already claimed
+    """
+    try:
+        from bson import ObjectId
+        from pymongo import ReturnDocument
+        
+        now = datetime.now(UTC).isoformat()
+        job = ingestion_jobs_collection.find_one_and_update(
+            {"_id": ObjectId(job_id), "status": "queued"},
+            {"$set": {"status": "running", "started_at": now, "updated_at": now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if job:
+            job['_id'] = str(job['_id'])
+        return job
+    except Exception as e:
+        print(f"Error claiming ingestion job: {e}")
+        return None
+
+
+def update_ingestion_job(job_id, **fields):
+    """
+    Update progress fields of an ingestion job.
+    
+    Args:
+        job_id (str): Job ID
+        **fields: Fields to set (status, stage, events_saved, error, ...)
+    
+    Returns:
+        bool: True if successful
+    """
+    try:
+        from bson import ObjectId
+        
+        fields['updated_at'] = datetime.now(UTC).isoformat()
+        result = ingestion_jobs_collection.update_one(
+            {"_id": ObjectId(job_id)},
+            {"$set": fields}
+        )
+        return result.matched_count > 0
+    except Exception as e:
+        print(f"Error updating ingestion job: {e}")
+        return False
+
+
+def get_ingestion_job(job_id):
+    """
+    Get an ingestion job without its raw messages.
+    
+    Args:
+        job_id (str): Job ID
+    
+    Returns:
+        dict: Job document or None
+    """
+    try:
+        from bson import ObjectId
+        
+        job = ingestion_jobs_collection.find_one(
+            {"_id": ObjectId(job_id)},
+            {"messages": 0}
+        )
+        if job:
+            job['_id'] = str(job['_id'])
+        return job
+    except Exception as e:
+        print(f"Error getting ingestion job: {e}")
+        return None
+
+
+def get_pending_ingestion_jobs(stale_after_minutes=10):
+    """
+    Get IDs of jobs that still need processing, e.g. after a restart.
+    Running jobs that have not progressed for a while are put back in the queue.
+    
+    Args:
+        stale_after_minutes (int): Age after which a running job is considered abandoned
+    
+    Returns:
+        list: List of job IDs, oldest first
+    """
+    try:
+        cutoff = (datetime.now(UTC) - timedelta(minutes=stale_after_minutes)).isoformat()
+        ingestion_jobs_collection.update_many(
+            {"status": "running", "updated_at": {"$lt": cutoff}},
+            {"$set": {"status": "queued", "stage": "queued"}}
+        )
+        jobs = ingestion_jobs_collection.find({"status": "queued"}, {"_id": 1}).sort("created_at", 1)
+        return [str(job['_id']) for job in jobs]
+    except Exception as e:
+        print(f"Error getting pending ingestion jobs: {e}")
+        return []
+
+
+# ============================================================================
+# MESSAGE FINGERPRINT FUNCTIONS
+# ============================================================================
+
+def ensure_fingerprint_indexes(ttl_hours):
+    """
+    Create the unique and TTL indexes of the fingerprint collection.
+    
+    Args:
+        ttl_hours (int): How long a fingerprint is remembered
+    """
+    try:
+        message_fingerprints_collection.create_index("fingerprint", unique=True)
+        message_fingerprints_collection.create_index("created_at", expireAfterSeconds=int(ttl_hours * 3600))
+    except Exception as e:
+        print(f"Error creating fingerprint indexes: {e}")
+
+
+def record_message_fingerprint(fingerprint):
+    """
+    Record a sighting of a message fingerprint. A new fingerprint is stored as
+    a pending claim (no event, no job yet).
+    
+    Args:
+        fingerprint (str): Normalized text hash
+    
+    Returns:
+        dict: Fingerprint document as it was before this sighting, or None if new
+    """
+    now = datetime.now(UTC)
+    return message_fingerprints_collection.find_one_and_update(
+        {"fingerprint": fingerprint},
+        {
+            "$setOnInsert": {"event_id": None, "job_id": None, "created_at": now, "claimed_at": now},
+            "$inc": {"seen_count": 1}
+        },
+        upsert=True
+    )
+
+
+def get_message_fingerprint(fingerprint):
+    """
+    Get a fingerprint document without recording a sighting.
+    
+    Args:
+        fingerprint (str): Normalized text hash
+    
+    Returns:
+        dict: Fingerprint document or None
+    """
+    try:
+        return message_fingerprints_collection.find_one({"fingerprint": fingerprint})
+    except Exception as e:
+        print(f"Error getting message fingerprint: {e}")
+        return None
+
+
+def reclaim_message_fingerprint(previous):
+    """
+    Take over a pending fingerprint whose claim is stale (job failed, finished
+    without an event, or never created), unless another request took it first.
+    
+    Args:
+        previous (dict): Fingerprint document as read by the caller
+    
+    Returns:
+        bool: True if the claim now belongs to the caller
+    """
+    try:
+        result = message_fingerprints_collection.update_one(
+            {
+                "fingerprint": previous['fingerprint'],
+                "event_id": None,
+                "job_id": previous.get('job_id'),
+                "claimed_at": previous.get('claimed_at')
+            },
+            {"$set": {"job_id": None, "claimed_at": datetime.now(UTC)}}
+        )
+        return result.modified_count > 0
+    except Exception as e:
+        print(f"Error reclaiming message fingerprint: {e}")
+        return False
+
+
+def assign_fingerprints_to_job(fingerprints, job_id):
+    """
+    Attach pending fingerprints to the ingestion job processing their messages.
+    
+    Args:
+        fingerprints (list): Fingerprints of the job's messages
+        job_id (str): Ingestion job ID
+    
+    Returns:
+        int: Number of fingerprints assigned
+    """
+    try:
+        result = message_fingerprints_collection.update_many(
+            {"fingerprint": {"$in": fingerprints}, "event_id": None, "job_id": None},
+            {"$set": {"job_id": job_id}}
+        )
+        return result.modified_count
+    except Exception as e:
+        print(f"Error assigning fingerprints to job: {e}")
+        return 0
+
+
+def release_message_fingerprints(fingerprints):
+    """
+    Delete fingerprint claims that were never assigned to a job, for messages
+    dropped before processing (folded near-duplicates, prefilter drops).
+    
+    Args:
+        fingerprints (list): Fingerprints claimed by the caller
+    
+    Returns:
+        int: Number of claims released
+    """
+    try:
+        result = message_fingerprints_collection.delete_many(
+            {"fingerprint": {"$in": fingerprints}, "event_id": None, "job_id": None}
+        )
+        return result.deleted_count
+    except Exception as e:
+        print(f"Error releasing message fingerprints: {e}")
+        return 0
+
+
+def link_fingerprints_to_event(fingerprints, event_id):
+    """
+    Attach message fingerprints to the event they produced.
+    
+    Args:
+        fingerprints (list): Fingerprints of the messages used by the event
+        event_id (str): Event ID
+    
+    Returns:
+        int: Number of fingerprints linked
+    """
+    try:
+        result = message_fingerprints_collection.update_many(
+            {"fingerprint": {"$in": fingerprints}},
+            {"$set": {"event_id": event_id}}
+        )
+        return result.modified_count
+    except Exception as e:
+        print(f"Error linking fingerprints to event: {e}")
+        return 0
+
+
+def increment_event_sources(event_id, count=1):
+    """
+    Count additional copies of a message against an existing event.
+    
+    Args:
+        event_id (str): Event ID
+        count (int): Number of new sources
+    
+    Returns:
+        bool: True if successful
+    """
+    try:
+        from bson import ObjectId
+        
+        now = datetime.now(UTC).isoformat()
+        result = event_collection.update_one(
+            {"_id": ObjectId(event_id)},
+            {
+                "$inc": {"sources_count": count},
+                "$set": {"last_seen_at": now, "updated_at": now}
+            }
+        )
+        return result.modified_count > 0
+    except Exception as e:
+        print(f"Error incrementing event sources: {e}")
+        return False
+
+
+# ============================================================================
+# LLM RESPONSE CACHE FUNCTIONS
+# ============================================================================
+
+def ensure_llm_cache_indexes():
+    """Create the TTL index that removes expired cached responses."""
+    try:
+        llm_cache_collection.create_index("expires_at", expireAfterSeconds=0)
+    except Exception as e:
+        print(f"Error creating LLM cache indexes: {e}")
+
+
+def get_cached_llm_response(key):
+    """
+    Get a cached LLM response that has not expired.
+    
+    Args:
+        key (str): Cache key
+    
+    Returns:
+        dict: Cached response (content, tokens) or None
+    """
+    try:
+        return llm_cache_collection.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.now(UTC)}},
+            {"_id": 0, "content": 1, "tokens": 1}
+        )
+    except Exception as e:
+        print(f"Error getting cached LLM response: {e}")
+        return None
+
+
+def save_cached_llm_response(key, call_site, content, tokens, ttl_seconds):
+    """
+    Store an LLM response in the shared cache.
+    
+    Args:
+        key (str): Cache key
+        call_site (str): Call site that produced the response
+        content (str): Response content
+        tokens (int): Tokens the response cost
+        ttl_seconds (int): Time to live
+    
+    Returns:
+        bool: True if successful
+    """
+    try:
+        llm_cache_collection.replace_one(
+            {"_id": key},
+            {
+                "call_site": call_site,
+                "content": content,
+                "tokens": tokens,
+                "expires_at": datetime.now(UTC) + timedelta(seconds=ttl_seconds)
+            },
+            upsert=True
+        )
+        return True
+    except Exception as e:
+        print(f"Error saving cached LLM response: {e}")
+        return False
+
+
+# ============================================================================
+# EVENT EMBEDDING FUNCTIONS
+# ============================================================================
+
+def get_events_missing_embeddings(model, version, limit):
+    """
+    Get events without a current embedding, newest first.
+    
+    Args:
+        model (str): Current embedding model
+        version (int): Current embedding version
+        limit (int): Maximum number of events
+    
+    Returns:
+        list: Events (with string _id), without embedding fields
+    """
+    try:
+        events = list(
+            event_collection.find(
+                {"$or": [
+                    {"embedding_model": {"$ne": model}},
+                    {"embedding_version": {"$ne": version}}
+                ]},
+                {"embedding": 0}
+            )
+            .sort("timestamp_start", -1)
+            .limit(limit)
+        )
+        for event in events:
+            event['_id'] = str(event['_id'])
+        return events
+    except Exception as e:
+        print(f"Error getting events missing embeddings: {e}")
+        return []
+
+
+def get_embedded_events(model, version, since, updated_since=None):
+    """
+    Get the embeddings and filter fields of events started since a time, for the vector index.
+    
+    Args:
+        model (str): Current embedding model
+        version (int): Current embedding version
+        since (datetime): Oldest start time
+        updated_since (datetime): Only events inserted, merged or embedded at or after this time
+    
+    Returns:
+        list: Events (with string _id) with embedding fields, severity, event_type and timestamp_start
+    """
+    query = {
+        "embedding_model": model,
+        "embedding_version": version,
+        "timestamp_start": {"$gte": since.isoformat()[:19]}
+    }
+    if updated_since:
+        query["updated_at"] = {"$gte": updated_since.isoformat()}
+    try:
+        events = list(event_collection.find(query, {
+            "embedding": 1, "embedding_model": 1, "embedding_version": 1,
+            "severity": 1, "event_type": 1, "timestamp_start": 1
+        }))
+        for event in events:
+            event['_id'] = str(event['_id'])
+        return events
+    except Exception as e:
+        print(f"Error getting embedded events: {e}")
+        return []
+
+
+def get_searchable_events(since, updated_since=None):
+    """
+    Get the text and filter fields of events started since a time, for the keyword index.
+
+    Args:
+        since (datetime): Oldest start time
+        updated_since (datetime): Only events inserted or merged at or after this time
+
+    Returns:
+        list: Events (with string _id) with summary, location, event_type, severity and timestamp_start
+    """
+    query = {"timestamp_start": {"$gte": since.isoformat()[:19]}}
+    if updated_since:
+        query["updated_at"] = {"$gte": updated_since.isoformat()}
+    try:
+        events = list(event_collection.find(query, {
+            "summary": 1, "location": 1, "event_type": 1, "severity": 1, "timestamp_start": 1
+        }))
+        for event in events:
+            event['_id'] = str(event['_id'])
+        return events
+    except Exception as e:
+        print(f"Error getting searchable events: {e}")
+        return []
+
+
+def save_event_embeddings(embeddings):
+    """
+    Store precomputed embeddings on events.
+    
+    Args:
+        embeddings (list): (event_id, fields) pairs, fields being embedding, embedding_model and embedding_version
+    
+    Returns:
+        int: Number of events updated
+    """
+    from bson import ObjectId
+    from pymongo import UpdateOne
+    
+    if not embeddings:
+        return 0
+    now = datetime.now(UTC).isoformat()
+    try:
+        result = event_collection.bulk_write(
+            [UpdateOne({"_id": ObjectId(event_id)}, {"$set": {**fields, "updated_at": now}})
+             for event_id, fields in embeddings],
+            ordered=False
+        )
+        return result.modified_count
+    except Exception as e:
+        print(f"Error saving event embeddings: {e}")
+        return 0
@@ -0,0 +1,291 @@
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from datetime import datetime, UTC, timedelta
+from cachetools import TTLCache
+from .db.models import (
+    ensure_fingerprint_indexes, record_message_fingerprint, get_message_fingerprint,
+    reclaim_message_fingerprint, assign_fingerprints_to_job, release_message_fingerprints,
+    get_ingestion_job, link_fingerprints_to_event, increment_event_sources
+)
+
+
+# How long a message fingerprint is remembered (Mongo TTL index and LRU front)
+DEDUP_TTL_HOURS = float(os.environ.get("DEDUP_TTL_HOURS", 24))
+DEDUP_CACHE_SIZE = int(os.environ.get("DEDUP_CACHE_SIZE", 10000))
+# Seconds a fingerprint claimed by a request may wait for its ingestion job to be created
+DEDUP_PENDING_SECONDS = float(os.environ.get("DEDUP_PENDING_SECONDS", 120))
+
+# Forwarding markers added by messaging apps
+FORWARD_PREFIX = re.compile(r"^((fwd|fw|tr|transfere|forwarded)\b\s*)+")
+NON_WORD = re.compile(r"[^\w\s]")
+WHITESPACE = re.compile(r"\s+")
+
+# fingerprint -> event_id (None while the message has not produced an event yet)
+fingerprint_cache = TTLCache(maxsize=DEDUP_CACHE_SIZE, ttl=DEDUP_TTL_HOURS * 3600)
+cache_lock = threading.Lock()
+indexes_ready = False
+
+stats = {"checked": 0, "duplicates": 0, "cache_hits": 0, "reclaimed": 0}
+
+
+def get_message_text(message):
+    """Return the text of a raw message (dict or plain string)."""
+    if isinstance(message, dict):
+        return message.get('text') or ''
+    return str(message)
+
+
+def normalize_text(text):
+    """
+    Normalize message text so trivially different copies hash the same.
+    Case, accents, punctuation, emoji, forwarding markers and whitespace are ignored.
+
+    Args:
+        text (str): Raw message text
+
+    Returns:
+        str: Normalized text
+    """
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = NON_WORD.sub(" ", text)
+    text = WHITESPACE.sub(" ", text).strip()
+    return FORWARD_PREFIX.sub("", text)
+
+
+def fingerprint_message(message):
+    """
+    Compute the content fingerprint of a raw message.
+
+    Args:
+        message (dict): Raw message
+
+    Returns:
+        str: Hex digest of the normalized text, or None if nothing is left of
+            the text (media-only, emoji-only): such messages are never duplicates
+    """
+    normalized = normalize_text(get_message_text(message))
+    if not normalized:
+        return None
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def get_fingerprint_state(record):
+    """
+    Tell whether a stored fingerprint still stands for a processed message.
+
+    Args:
+        record (dict): Fingerprint document
+
+    Returns:
+        str: "linked" (it produced an event), "pending" (its job is queued or
+            running, or is about to be created) or "stale" (its job failed or
+            finished without an event: the message was never turned into one)
+    """
+    if record.get('event_id'):
+        return "linked"
+
+    job_id = record.get('job_id')
+    if job_id:
+        job = get_ingestion_job(job_id)
+        return "pending" if job and job.get('status') in ('queued', 'running') else "stale"
+
+    claimed_at = record.get('claimed_at') or record.get('created_at')
+    if claimed_at is None:
+        return "stale"
+    if claimed_at.tzinfo is None:
+        claimed_at = claimed_at.replace(tzinfo=UTC)
+    if claimed_at > datetime.now(UTC) - timedelta(seconds=DEDUP_PENDING_SECONDS):
+        return "pending"
+    return "stale"
+
+
+def check_fingerprint(fingerprint):
+    """
+    Check a fingerprint against the LRU front and the Mongo store.
+    Known duplicates are counted as an extra source on their event. A message
+    whose earlier copy was never turned into an event is processed again.
+
+    Args:
+        fingerprint (str): Message fingerprint
+
+    Returns:
+        bool: True if the message was already seen
+    """
+    with cache_lock:
+        event_id = fingerprint_cache.get(fingerprint)
+    if event_id:
+        # Already linked to an event: no need to ask Mongo
+        stats["cache_hits"] += 1
+        increment_event_sources(event_id)
+        return True
+
+    previous = record_message_fingerprint(fingerprint)
+    if previous is None:
+        return False
+
+    state = get_fingerprint_state(previous)
+    if state == "linked":
+        with cache_lock:
+            fingerprint_cache[fingerprint] = previous['event_id']
+        increment_event_sources(previous['event_id'])
+        return True
+    if state == "stale" and reclaim_message_fingerprint(previous):
+        stats["reclaimed"] += 1
+        return False
+    return True
+
+
+def count_as_source(fingerprint):
+    """
+    Count a copy of a message against the event of its fingerprint.
+
+    Args:
+        fingerprint (str): Fingerprint of the message copied
+
+    Returns:
+        bool: True if the copy is covered (event counted, or original still
+            being processed), False if the original was never turned into an event
+    """
+    with cache_lock:
+        event_id = fingerprint_cache.get(fingerprint)
+    if not event_id:
+        record = get_message_fingerprint(fingerprint)
+        if record is None:
+            return False
+        state = get_fingerprint_state(record)
+        if state != "linked":
+            return state == "pending"
+        event_id = record['event_id']
+    increment_event_sources(event_id)
+    return True
+
+
+def assign_job_fingerprints(raw_messages, job_id):
+    """
+    Attach the fingerprints claimed for a job's messages to the job, so copies
+    are only treated as duplicates while the job can still produce an event.
+
+    Args:
+        raw_messages (list): Raw messages of the job
+        job_id (str): Ingestion job ID
+    """
+    fingerprints = [f for f in map(fingerprint_message, raw_messages) if f]
+    if fingerprints:
+        assign_fingerprints_to_job(fingerprints, job_id)
+
+
+def release_fingerprints(raw_messages):
+    """
+    Release the fingerprints claimed for messages that will not be processed
+    (folded into a near-duplicate, dropped by the prefilter), so they are not
+    left pending until they go stale.
+
+    Args:
+        raw_messages (list): Raw messages that passed filter_duplicate_messages but were not enqueued
+    """
+    fingerprints = [f for f in map(fingerprint_message, raw_messages) if f]
+    if fingerprints:
+        release_message_fingerprints(fingerprints)
+
+
+def filter_duplicate_messages(raw_messages):
+    """
+    Drop messages that were already received within the TTL window.
+
+    Args:
+        raw_messages (list): Raw messages
+
+    Returns:
+        tuple: (new messages, number of duplicates dropped)
+    """
+    global indexes_ready
+    if not indexes_ready:
+        ensure_fingerprint_indexes(DEDUP_TTL_HOURS)
+        indexes_ready = True
+
+    new_messages = []
+    duplicates = 0
+    for message in raw_messages:
+        stats["checked"] += 1
+        fingerprint = fingerprint_message(message)
+        if fingerprint is None:
+            new_messages.append(message)
+            continue
+        try:
+            is_duplicate = check_fingerprint(fingerprint)
+        except Exception as e:
+            print(f"Fingerprint check failed: {e}")
+            is_duplicate = False
+
+        if is_duplicate:
+            duplicates += 1
+        else:
+            new_messages.append(message)
+
+    stats["duplicates"] += duplicates
+    if duplicates:
+        print(f"Dropped {duplicates} duplicate messages")
+    return new_messages, duplicates
+
+
+def link_event_fingerprints(raw_messages, preprocessed_messages, saved_events):
+    """
+    Remember which event each raw message produced, so later copies of the
+    message are counted on that event instead of being processed again.
+    Near-duplicates folded into a message are counted as extra sources.
+
+    Args:
+        raw_messages (list): Raw messages of the job
+        preprocessed_messages (list): Pretriage output (with `ref` and `cluster_id`)
+        saved_events (list): Saved events (with `_id` and `cluster_id`)
+    """
+    event_ids = {}
+    for event in saved_events:
+        if event.get('_id'):
+            for cluster_id in [event.get('cluster_id')] + event.get('merged_cluster_ids', []):
+                event_ids.setdefault(cluster_id, event['_id'])
+
+    fingerprints_by_event = {}
+    near_duplicates_by_event = {}
+    for message in preprocessed_messages:
+        event_id = event_ids.get(message.get('cluster_id'))
+        ref = message.get('ref')
+        if not event_id or not isinstance(ref, int) or not 0 <= ref < len(raw_messages):
+            continue
+        raw_message = raw_messages[ref]
+        fingerprint = fingerprint_message(raw_message)
+        if fingerprint:
+            fingerprints_by_event.setdefault(event_id, []).append(fingerprint)
+        if isinstance(raw_message, dict) and raw_message.get('near_duplicates'):
+            near_duplicates_by_event[event_id] = (
+                near_duplicates_by_event.get(event_id, 0) + raw_message['near_duplicates']
+            )
+
+    for event_id, count in near_duplicates_by_event.items():
+        increment_event_sources(event_id, count)
+
+    for event_id, fingerprints in fingerprints_by_event.items():
+        link_fingerprints_to_event(fingerprints, event_id)
+        with cache_lock:
+            for fingerprint in fingerprints:
+                fingerprint_cache[fingerprint] = event_id
+
+
+def get_stats():
+    """
+    Get exact-duplicate suppression counters.
+
+    Returns:
+        dict: Counters and hit rate
+    """
+    checked = stats["checked"]
+    return {
+        **stats,
+        "hit_rate": round(stats["duplicates"] / checked, 4) if checked else 0.0,
+        "cached_fingerprints": len(fingerprint_cache),
+        "ttl_hours": DEDUP_TTL_HOURS
+    }
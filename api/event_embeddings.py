@@ -0,0 +1,180 @@
+import os
+import numpy as np
+from bson.binary import Binary
+from .llm_gateway import create_embeddings
+from .db.models import get_events_missing_embeddings, save_event_embeddings
+
+
+# Model used to embed events (stored with each embedding)
+EVENT_EMBEDDING_MODEL = os.environ.get("EVENT_EMBEDDING_MODEL", "grok-code-fast-1")
+# Bump when create_event_searchable_text changes, so the backfill re-embeds old events
+EVENT_EMBEDDING_VERSION = 1
+EMBEDDING_BACKFILL_BATCH = int(os.environ.get("EMBEDDING_BACKFILL_BATCH", 64))
+
+
+def create_event_searchable_text(event):
+    """
+    Create a searchable text representation of an event for embedding.
+
+    Args:
+        event (dict): Event dictionary
+
+    Returns:
+        str: Searchable text combining summary, location, event_type, etc.
+    """
+    parts = []
+
+    # Add summary (most important)
+    if event.get('summary'):
+        parts.append(event['summary'])
+
+    # Add event type
+    if event.get('event_type'):
+        parts.append(f"Event type: {event['event_type']}")
+
+    # Add location
+    if event.get('location'):
+        parts.append(f"Location: {event['location']}")
+
+    # Add severity if high/critical
+    if event.get('severity') in ['critical', 'high']:
+        parts.append(f"Severity: {event['severity']}")
+
+    # Add recommended action if available
+    if event.get('recommended_action'):
+        parts.append(event['recommended_action'])
+
+    return " ".join(parts)
+
+
+def encode_embedding(vector):
+    """Store an embedding as raw float32 bytes (half the size of a list of doubles)."""
+    return Binary(np.asarray(vector, dtype=np.float32).tobytes())
+
+
+def decode_embedding(value):
+    """Read back an embedding stored by encode_embedding, or None."""
+    if value is None:
+        return None
+    return np.frombuffer(bytes(value), dtype=np.float32)
+
+
+def embed_events(events):
+    """
+    Embed the searchable text of events in one request.
+
+    Args:
+        events (list): Events
+
+    Returns:
+        list: numpy.ndarray embeddings, in the order of the events
+
+    Raises:
+        Exception: If the embedding request failed
+    """
+    response = create_embeddings(
+        model=EVENT_EMBEDDING_MODEL,
+        input=[create_event_searchable_text(e) for e in events]
+    )
+    return [np.asarray(item.embedding, dtype=np.float32) for item in response.data[:len(events)]]
+
+
+def attach_event_embeddings(events):
+    """
+    Embed events before they are saved. Events stay unembedded if the request
+    fails; the backfill embeds them later.
+
+    Args:
+        events (list): Events about to be saved (updated in place)
+
+    Returns:
+        int: Number of events embedded
+    """
+    if not events:
+        return 0
+    try:
+        embeddings = embed_events(events)
+    except Exception as e:
+        print(f"Event embedding failed, leaving it to the backfill: {e}")
+        return 0
+
+    for event, embedding in zip(events, embeddings):
+        event['embedding'] = encode_embedding(embedding)
+        event['embedding_model'] = EVENT_EMBEDDING_MODEL
+        event['embedding_version'] = EVENT_EMBEDDING_VERSION
+    return len(embeddings)
+
+
+def get_stored_embedding(event):
+    """
+    Get the precomputed embedding of an event if it is current.
+
+    Args:
+        event (dict): Event (with its embedding fields)
+
+    Returns:
+        numpy.ndarray: Embedding, or None if missing or made by another model/version
+    """
+    if (event.get('embedding_model') != EVENT_EMBEDDING_MODEL
+            or event.get('embedding_version') != EVENT_EMBEDDING_VERSION):
+        return None
+    return decode_embedding(event.get('embedding'))
+
+
+def backfill_event_embeddings(limit=None, batch_size=EMBEDDING_BACKFILL_BATCH):
+    """
+    Embed stored events that have no current embedding, newest first.
+
+    Args:
+        limit (int): Maximum number of events to embed (None = all)
+        batch_size (int): Events per embedding request
+
+    Returns:
+        dict: Number of events embedded and failed
+    """
+    embedded = 0
+    failed = 0
+    seen = set()
+    while limit is None or embedded + failed < limit:
+        size = batch_size if limit is None else min(batch_size, limit - embedded - failed)
+        events = [
+            e for e in get_events_missing_embeddings(
+                EVENT_EMBEDDING_MODEL, EVENT_EMBEDDING_VERSION, size + len(seen)
+            )
+            if e['_id'] not in seen
+        ][:size]
+        if not events:
+            break
+
+        try:
+            embeddings = embed_events(events)
+        except Exception as e:
+            # Skip this batch so a bad event cannot stall the whole backfill
+            print(f"Embedding backfill batch failed: {e}")
+            failed += len(events)
+            seen.update(e['_id'] for e in events)
+            continue
+
+        saved = save_event_embeddings([
+            (event['_id'], {
+                "embedding": encode_embedding(embedding),
+                "embedding_model": EVENT_EMBEDDING_MODEL,
+                "embedding_version": EVENT_EMBEDDING_VERSION
+            })
+            for event, embedding in zip(events, embeddings)
+        ])
+        if saved < len(events):
+            # Events whose embedding was not saved are not fetched again in this run
+            seen.update(e['_id'] for e in events)
+        embedded += saved
+        failed += len(events) - saved
+        if not saved:
+            print("Embedding backfill could not save any embedding, stopping")
+            break
+        print(f"Embedding backfill: {embedded} events embedded")
+
+    return {"embedded": embedded, "failed": failed}
+
+
+if __name__ == "__main__":
+    print(backfill_event_embeddings())
@@ -0,0 +1,229 @@
+import json
+import os
+from collections import deque
+from .dedup import normalize_text
+
+
+# Zones, aliases, parent/child relations and topic keywords (see gazetteer.json)
+GAZETTEER_PATH = os.environ.get(
+    "GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.json")
+)
+
+
+class TermMatcher:
+    """
+    Aho-Corasick automaton over folded terms (case, accents and punctuation
+    ignored, like message text). A text is scanned once, whatever the number
+    of terms.
+    """
+
+    def __init__(self, terms):
+        """
+        Args:
+            terms (dict): {term: value}; terms are folded on insertion
+        """
+        self.values = {}
+        self.transitions = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+        for term, value in terms.items():
+            term = normalize_text(term)
+            if not term:
+                continue
+            self.values[term] = value
+            state = 0
+            for char in term:
+                if char not in self.transitions[state]:
+                    self.transitions.append({})
+                    self.fail.append(0)
+                    self.outputs.append([])
+                    self.transitions[state][char] = len(self.transitions) - 1
+                state = self.transitions[state][char]
+            self.outputs[state].append(term)
+
+        # Failure links, breadth first: longest proper suffix that is also a prefix
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.transitions[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.transitions[fallback].get(char, 0)
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+
+    def find(self, text):
+        """
+        Find the whole-word terms of a folded text. Overlaps are resolved like a
+        regex alternation of the terms, longest first: leftmost match wins, then
+        the longest one starting there.
+
+        Args:
+            text (str): Text folded with normalize_text
+
+        Returns:
+            list: (start, end, term) tuples in text order
+        """
+        matches = []
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self.transitions[state]:
+                state = self.fail[state]
+            state = self.transitions[state].get(char, 0)
+            end = i + 1
+            if end < len(text) and text[end] != " ":
+                continue
+            for term in self.outputs[state]:
+                start = end - len(term)
+                if start == 0 or text[start - 1] == " ":
+                    matches.append((start, end, term))
+
+        matches.sort(key=lambda m: (m[0], -m[1]))
+        selected = []
+        covered = 0
+        for match in matches:
+            if match[0] >= covered:
+                selected.append(match)
+                covered = match[1]
+        return selected
+
+    def find_values(self, text):
+        """Values of the terms found in a raw text, in text order."""
+        return [self.values[term] for _, _, term in self.find(normalize_text(text or ''))]
+
+    def __len__(self):
+        return len(self.values)
+
+
+def load_gazetteer(path=GAZETTEER_PATH):
+    """
+    Load the gazetteer file.
+
+    Args:
+        path (str): JSON file with zones, weak place terms and topics
+
+    Returns:
+        dict: Zones by name, folded zone aliases, weak place terms and folded terms by topic
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    zones = {}
+    aliases = {}
+    for zone in data.get("zones", []):
+        name = zone["name"]
+        zones[name] = {
+            "name": name,
+            "hierarchical": bool(zone.get("hierarchical")),
+            "numbered": bool(zone.get("numbered")),
+            "parent": zone.get("parent")
+        }
+        for alias in [name] + zone.get("aliases", []):
+            aliases[normalize_text(alias)] = name
+
+    for zone in zones.values():
+        if zone["parent"] and zone["parent"] not in zones:
+            raise ValueError(f"Unknown parent zone {zone['parent']} of {zone['name']}")
+
+    topics = {topic: [normalize_text(t) for t in terms] for topic, terms in data.get("topics", {}).items()}
+
+    return {
+        "zones": zones,
+        "aliases": aliases,
+        "weak_place_terms": [normalize_text(t) for t in data.get("weak_place_terms", [])],
+        "topics": topics
+    }
+
+
+gazetteer = load_gazetteer()
+ZONES = gazetteer["zones"]
+ZONE_ALIASES = gazetteer["aliases"]
+WEAK_PLACE_TERMS = gazetteer["weak_place_terms"]
+ZONE_MATCHER = TermMatcher(ZONE_ALIASES)
+# One matcher per topic: overlaps are only resolved between terms of the same
+# topic, so "how is the situation" (situation) does not hide "situation" (patrolx)
+TOPIC_MATCHERS = {topic: TermMatcher(dict.fromkeys(terms, topic)) for topic, terms in gazetteer["topics"].items()}
+
+
+def get_zone(location):
+    """
+    Look up a zone by its name or one of its aliases.
+
+    Args:
+        location (str): Zone name or alias, in any case or spelling of the accents
+
+    Returns:
+        dict: Zone (name, hierarchical, numbered, parent), or None if unknown
+    """
+    name = ZONE_ALIASES.get(normalize_text(location or ''))
+    return ZONES[name] if name else None
+
+
+def get_general_zone(location):
+    """
+    Hierarchical zone a general location refers to: the zone itself if it has
+    subzones, else its parent (Clercine -> Tabarre).
+
+    Args:
+        location (str): Zone name or alias
+
+    Returns:
+        dict: Hierarchical zone, or None
+    """
+    zone = get_zone(location)
+    while zone and not zone["hierarchical"]:
+        zone = ZONES.get(zone["parent"])
+    return zone
+
+
+def find_zones(text):
+    """
+    Find the zones mentioned in a text.
+
+    Args:
+        text (str): Raw text
+
+    Returns:
+        list: Zone names in text order, without duplicates
+    """
+    return list(dict.fromkeys(ZONE_MATCHER.find_values(text)))
+
+
+def find_topics(text):
+    """
+    Find the topics whose keywords appear in a text.
+
+    Args:
+        text (str): Raw text
+
+    Returns:
+        set: Topic names (situation, patrolx, general_question, haiti)
+    """
+    text = normalize_text(text or '')
+    return {topic for topic, matcher in TOPIC_MATCHERS.items() if matcher.find(text)}
+
+
+def get_numbered_zones():
+    """Names of the zones with numbered subzones (Delmas 33, Tabarre 52)."""
+    return [zone["name"] for zone in ZONES.values() if zone["numbered"]]
+
+
+def get_lookalike_zones():
+    """
+    Zones sharing the name of another zone without being part of it
+    (Carrefour-Feuilles is not in Carrefour).
+
+    Returns:
+        dict: {zone name: [lookalike zone names]}
+    """
+    lookalikes = {}
+    for name in ZONES:
+        root = normalize_text(name) + " "
+        others = [
+            other for other, zone in ZONES.items()
+            if normalize_text(other).startswith(root) and zone["parent"] != name
+        ]
+        if others:
+            lookalikes[name] = others
+    return lookalikes
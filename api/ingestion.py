@@ -0,0 +1,426 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .services import analyse_msg
+from .pretriage import pretriage
+from .dedup import link_event_fingerprints, assign_job_fingerprints
+from .event_embeddings import attach_event_embeddings
+from .vector_index import add_events as add_to_vector_index
+from .keyword_index import add_events as add_to_keyword_index
+from pymongo.errors import DuplicateKeyError
+from .db.models import (
+    save_event, get_all_active_users, create_notification, save_processed_messages,
+    get_processed_messages, ensure_ingestion_job_indexes, create_ingestion_job,
+    claim_ingestion_job, update_ingestion_job, complete_ingestion_job_stage,
+    requeue_ingestion_job, get_ingestion_job, get_ingestion_job_by_key,
+    get_pending_ingestion_jobs
+)
+
+
+# Number of background workers draining the ingestion queue.
+# 0 processes each job inline in the request (useful on serverless hosts).
+INGESTION_WORKERS = int(os.environ.get("INGESTION_WORKERS", 4))
+
+# Pipelined mode analyses each pretriage cluster separately (up to
+# ANALYSIS_CONCURRENCY at once) so critical events are saved and notified early.
+INGESTION_PIPELINED = os.environ.get("INGESTION_PIPELINED", "false").lower() == "true"
+ANALYSIS_CONCURRENCY = int(os.environ.get("ANALYSIS_CONCURRENCY", 4))
+
+# Keys derived from the payload content (messages without ids) only match
+# retries received within the same window, so a later identical alert is processed
+IDEMPOTENCY_CONTENT_WINDOW_MINUTES = float(os.environ.get("IDEMPOTENCY_CONTENT_WINDOW_MINUTES", 60))
+
+RISK_ORDER = {"low": 0, "medium": 1, "high": 2}
+URGENT_CATEGORIES = ["kidnapping", "gunshots", "insecurity"]
+
+job_queue = queue.Queue()
+analysis_executor = ThreadPoolExecutor(max_workers=ANALYSIS_CONCURRENCY, thread_name_prefix="analysis")
+workers = []
+workers_lock = threading.Lock()
+indexes_ready = False
+
+
+def notify_users(saved_events):
+    """
+    Create notifications for all active users about critical/high events.
+
+    Args:
+        saved_events (list): Saved events (with _id)
+
+    Returns:
+        int: Number of notifications created
+    """
+    # Reports merged into an existing event only notify again when severity increased
+    important_events = [
+        e for e in saved_events
+        if e.get('severity') in ['critical', 'high'] and (not e.get('merged') or e.get('escalated'))
+    ]
+    if not important_events:
+        return 0
+
+    active_users = get_all_active_users()
+    count = 0
+    for event in important_events:
+        for user_id in active_users:
+            if create_notification(user_id, event):
+                count += 1
+    return count
+
+
+def save_and_notify(analysed_events, raw_messages, preprocessed_messages):
+    """
+    Embed and save analysed events, link their source messages and notify users.
+
+    Args:
+        analysed_events (dict): Dictionary with 'events' list
+        raw_messages (list): Raw messages of the job
+        preprocessed_messages (list): Pretriaged messages the events were built from
+
+    Returns:
+        tuple: (saved events, notifications sent)
+    """
+    if not analysed_events.get('events'):
+        return [], 0
+
+    # Embedded once here so chat vector search never re-embeds stored events
+    attach_event_embeddings(analysed_events['events'])
+    save_result = save_event(analysed_events)
+    if not save_result or not save_result.get('result'):
+        raise RuntimeError("Event not saved")
+
+    saved_events = save_result.get('events', [])
+    add_to_vector_index(saved_events)
+    add_to_keyword_index(saved_events)
+    link_event_fingerprints(raw_messages, preprocessed_messages, saved_events)
+    return saved_events, notify_users(saved_events)
+
+
+def run_pretriage_stage(job):
+    """
+    Pretriage the job's messages and persist the output, or reload it if a
+    previous attempt of the job already got that far.
+
+    Args:
+        job (dict): Claimed job document
+
+    Returns:
+        list: Pretriaged messages
+    """
+    job_id = job['_id']
+    if 'pretriage' in job.get('completed_stages', []):
+        print(f"Ingestion job {job_id}: reusing stored pretriage output")
+        return get_processed_messages(job_id)
+
+    update_ingestion_job(job_id, stage="preprocessing")
+    preprocessed_messages = pretriage(job.get('messages', []))['messages']
+    if preprocessed_messages:
+        save_processed_messages([
+            {**message, "_id": f"{job_id}:{message.get('ref')}", "job_id": job_id}
+            for message in preprocessed_messages
+        ])
+    complete_ingestion_job_stage(job_id, 'pretriage')
+    return preprocessed_messages
+
+
+def process_messages(job):
+    """
+    Run the full ingestion pipeline for a job, skipping stages completed by a
+    previous attempt.
+
+    Args:
+        job (dict): Claimed job document (raw messages, options, completed stages)
+
+    Returns:
+        dict: Number of events saved and notifications sent
+    """
+    job_id = job['_id']
+    raw_messages = job.get('messages', [])
+    completed_stages = job.get('completed_stages', [])
+
+    preprocessed_messages = run_pretriage_stage(job)
+    if not preprocessed_messages:
+        return {"events_saved": 0, "notifications_sent": 0}
+
+    if job.get('pipelined', INGESTION_PIPELINED):
+        return process_clusters(raw_messages, preprocessed_messages, job)
+
+    if 'analysis' in completed_stages:
+        analysed_events = job.get('analysed_events') or {}
+    else:
+        update_ingestion_job(job_id, stage="analysing")
+        analysed_events = analyse_msg({"messages": preprocessed_messages})
+        complete_ingestion_job_stage(job_id, 'analysis', analysed_events=analysed_events)
+
+    if 'saved' in completed_stages:
+        # Events were saved and users notified by the previous attempt
+        return {"events_saved": len(job.get('saved_event_ids', [])),
+                "notifications_sent": job.get('notifications_sent', 0)}
+
+    update_ingestion_job(job_id, stage="saving")
+    # save_event adds _id to the events, keep the stored analysis clean
+    analysed_events = {"events": [dict(e) for e in analysed_events.get('events', [])]}
+    saved_events, notifications_sent = save_and_notify(analysed_events, raw_messages, preprocessed_messages)
+    complete_ingestion_job_stage(job_id, 'saved', saved_event_ids=[e['_id'] for e in saved_events])
+
+    return {"events_saved": len(saved_events), "notifications_sent": notifications_sent}
+
+
+def group_by_cluster(preprocessed_messages):
+    """
+    Group relevant pretriaged messages by cluster_id, most urgent clusters first.
+
+    Args:
+        preprocessed_messages (list): Pretriaged messages
+
+    Returns:
+        list: List of (cluster_id, messages) tuples
+    """
+    clusters = {}
+    for message in preprocessed_messages:
+        if message.get('is_relevant') is False:
+            continue
+        clusters.setdefault(message.get('cluster_id') or 'general', []).append(message)
+
+    def urgency(item):
+        messages = item[1]
+        risk = max(RISK_ORDER.get(m.get('risk_hint'), 0) for m in messages)
+        urgent_category = any(m.get('category_hint') in URGENT_CATEGORIES for m in messages)
+        return (urgent_category, risk)
+
+    return sorted(clusters.items(), key=urgency, reverse=True)
+
+
+def process_cluster(cluster_id, messages, raw_messages, job_id):
+    """
+    Analyse one cluster, then save and notify its events right away.
+
+    Args:
+        cluster_id (str): Cluster ID
+        messages (list): Pretriaged messages of the cluster
+        raw_messages (list): Raw messages of the job
+        job_id (str): Ingestion job ID
+
+    Returns:
+        tuple: (events saved, notifications sent)
+    """
+    analysed_events = analyse_msg({"messages": messages})
+    for event in analysed_events.get('events', []):
+        event.setdefault('cluster_id', cluster_id)
+    saved_events, notifications_sent = save_and_notify(analysed_events, raw_messages, messages)
+    complete_ingestion_job_stage(job_id, f"cluster:{cluster_id}")
+    return len(saved_events), notifications_sent
+
+
+def process_clusters(raw_messages, preprocessed_messages, job):
+    """
+    Pipelined mode: analyse clusters concurrently and persist/fan out each
+    event as soon as its cluster is done, instead of waiting for the batch.
+    Clusters finished by a previous attempt of the job are skipped.
+
+    Args:
+        raw_messages (list): Raw messages of the job
+        preprocessed_messages (list): Pretriaged messages
+        job (dict): Claimed job document
+
+    Returns:
+        dict: Number of events saved and notifications sent
+    """
+    job_id = job['_id']
+    completed_stages = job.get('completed_stages', [])
+    clusters = group_by_cluster(preprocessed_messages)
+    remaining = [(c, m) for c, m in clusters if f"cluster:{c}" not in completed_stages]
+    clusters_done = len(clusters) - len(remaining)
+    update_ingestion_job(job_id, stage="analysing", clusters_total=len(clusters), clusters_done=clusters_done)
+
+    futures = {
+        analysis_executor.submit(process_cluster, cluster_id, messages, raw_messages, job_id): cluster_id
+        for cluster_id, messages in remaining
+    }
+
+    events_saved = job.get('events_saved', 0)
+    notifications_sent = job.get('notifications_sent', 0)
+    failed = []
+    for future in as_completed(futures):
+        try:
+            saved, notified = future.result()
+            events_saved += saved
+            notifications_sent += notified
+            clusters_done += 1
+        except Exception as e:
+            print(f"Cluster {futures[future]} failed: {e}")
+            failed.append(futures[future])
+        update_ingestion_job(job_id, clusters_done=clusters_done, events_saved=events_saved,
+                             notifications_sent=notifications_sent)
+
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(clusters)} clusters failed: {', '.join(failed)}")
+
+    return {"events_saved": events_saved, "notifications_sent": notifications_sent}
+
+
+def run_job(job_id):
+    """
+    Claim and process one ingestion job, recording the outcome on the job.
+
+    Args:
+        job_id (str): Job ID
+    """
+    job = claim_ingestion_job(job_id)
+    if not job:
+        # Already processed or claimed by another worker
+        return
+
+    try:
+        result = process_messages(job)
+        update_ingestion_job(job_id, status="done", stage="done", **result)
+        print(f"Ingestion job {job_id} done: {result}")
+    except Exception as e:
+        print(f"Ingestion job {job_id} failed: {e}")
+        update_ingestion_job(job_id, status="failed", error=str(e))
+
+
+def worker_loop():
+    """Drain the ingestion queue forever."""
+    while True:
+        job_id = job_queue.get()
+        try:
+            run_job(job_id)
+        except Exception as e:
+            print(f"Ingestion worker error: {e}")
+        finally:
+            job_queue.task_done()
+
+
+def start_workers():
+    """Start the worker pool once and re-queue jobs left over from a previous run."""
+    with workers_lock:
+        if workers or INGESTION_WORKERS <= 0:
+            return
+
+        for i in range(INGESTION_WORKERS):
+            worker = threading.Thread(target=worker_loop, name=f"ingestion-worker-{i}", daemon=True)
+            worker.start()
+            workers.append(worker)
+
+        pending_jobs = get_pending_ingestion_jobs()
+        if pending_jobs:
+            print(f"Re-queuing {len(pending_jobs)} pending ingestion jobs")
+        for job_id in pending_jobs:
+            job_queue.put(job_id)
+
+
+def derive_idempotency_key(raw_messages):
+    """
+    Derive an idempotency key for a delivery without an explicit one:
+    from the sender's message ids when every message has one, otherwise from
+    the exact payload content and the current IDEMPOTENCY_CONTENT_WINDOW_MINUTES window.
+
+    Args:
+        raw_messages (list): Raw messages as received
+
+    Returns:
+        str: Idempotency key
+    """
+    ids = [m.get('id') or m.get('message_id') if isinstance(m, dict) else None for m in raw_messages]
+    if ids and all(ids):
+        material = "ids:" + json.dumps(sorted(str(i) for i in ids))
+    else:
+        window = int(time.time() // (IDEMPOTENCY_CONTENT_WINDOW_MINUTES * 60))
+        material = f"content:{window}:" + json.dumps(raw_messages, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def queue_job(job_id):
+    """Process a job inline or hand it to the worker pool."""
+    if INGESTION_WORKERS <= 0:
+        run_job(job_id)
+    else:
+        start_workers()
+        job_queue.put(job_id)
+
+
+def find_existing_job(idempotency_key):
+    """
+    Look up the job of an earlier delivery with the same idempotency key.
+    A failed job is queued again and resumes from its last completed stage.
+
+    Args:
+        idempotency_key (str): Idempotency key
+
+    Returns:
+        str: Job ID or None if the delivery is new
+    """
+    global indexes_ready
+    if not indexes_ready:
+        ensure_ingestion_job_indexes()
+        indexes_ready = True
+
+    job = get_ingestion_job_by_key(idempotency_key)
+    if not job:
+        return None
+
+    if job.get('status') == 'failed' and requeue_ingestion_job(job['_id']):
+        print(f"Resuming failed ingestion job {job['_id']}")
+        queue_job(job['_id'])
+    return job['_id']
+
+
+def enqueue_messages(raw_messages, pipelined=None, idempotency_key=None):
+    """
+    Persist a batch of raw messages as an ingestion job and queue it.
+
+    Args:
+        raw_messages (list): Raw messages received on /messages
+        pipelined (bool): Use the per-cluster pipeline (defaults to INGESTION_PIPELINED)
+        idempotency_key (str): Key identifying retries of the same delivery
+
+    Returns:
+        str: Job ID
+    """
+    if pipelined is None:
+        pipelined = INGESTION_PIPELINED
+    try:
+        job_id = create_ingestion_job(raw_messages, pipelined=pipelined, idempotency_key=idempotency_key)
+    except DuplicateKeyError:
+        # A concurrent retry of the same delivery created the job first
+        return find_existing_job(idempotency_key)
+
+    if raw_messages:
+        assign_job_fingerprints(raw_messages, job_id)
+        queue_job(job_id)
+    return job_id
+
+
+def get_job_status(job_id):
+    """
+    Get the progress of an ingestion job.
+
+    Args:
+        job_id (str): Job ID
+
+    Returns:
+        dict: Job status or None if not found
+    """
+    job = get_ingestion_job(job_id)
+    if not job:
+        return None
+
+    return {
+        "job_id": job['_id'],
+        "status": job.get('status'),
+        "stage": job.get('stage'),
+        "message_count": job.get('message_count', 0),
+        "completed_stages": job.get('completed_stages', []),
+        "pipelined": job.get('pipelined', False),
+        "clusters_total": job.get('clusters_total'),
+        "clusters_done": job.get('clusters_done'),
+        "events_saved": job.get('events_saved', 0),
+        "notifications_sent": job.get('notifications_sent', 0),
+        "error": job.get('error'),
+        "created_at": job.get('created_at'),
+        "updated_at": job.get('updated_at')
+    }
@@ -0,0 +1,325 @@
+import math
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, UTC, timedelta
+import numpy as np
+from .dedup import normalize_text
+from .db.models import SEVERITY_RANK, get_searchable_events, parse_timestamp
+
+
+KEYWORD_INDEX_ENABLED = os.environ.get("KEYWORD_INDEX_ENABLED", "true").lower() == "true"
+# Events older than this (by start time) are evicted from the index
+KEYWORD_INDEX_WINDOW_HOURS = float(os.environ.get("KEYWORD_INDEX_WINDOW_HOURS", 72))
+# How often the index pulls events saved by other instances
+KEYWORD_INDEX_REFRESH_SECONDS = float(os.environ.get("KEYWORD_INDEX_REFRESH_SECONDS", 60))
+# Each refresh also pulls events updated this many seconds before the previous one,
+# covering clock skew between instances and writes still in flight
+KEYWORD_INDEX_REFRESH_OVERLAP_SECONDS = float(os.environ.get("KEYWORD_INDEX_REFRESH_OVERLAP_SECONDS", 120))
+# Reciprocal rank fusion constant: higher values flatten the advantage of top ranks
+RRF_K = int(os.environ.get("RRF_K", 60))
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Term frequency multiplier per event field (a place name in the location beats one in the summary)
+FIELD_WEIGHTS = {"summary": 1, "location": 2, "event_type": 2}
+
+# Creole, French and English function words that say nothing about an event
+STOPWORDS = {
+    # Creole
+    "eske", "esk", "gen", "genyen", "ki", "la", "yo", "nan", "ak", "pou", "sou", "se", "li", "mwen",
+    "nou", "ou", "sa", "ye", "te", "ap", "pa", "kote", "kisa", "kijan", "konn", "fe", "fin", "deja",
+    "jodi", "an", "men", "tou", "bo", "kounye", "koulye",
+    # French
+    "le", "les", "de", "des", "du", "un", "une", "et", "est", "en", "au", "aux", "dans", "sur",
+    "que", "qui", "il", "y", "quoi", "quel", "quelle", "ce", "cette", "avec", "par", "pas", "ont",
+    # English
+    "the", "is", "are", "any", "in", "at", "of", "on", "what", "there", "was", "were", "to", "and",
+    "or", "for", "near", "around", "happening", "going",
+}
+
+
+def tokenize(text):
+    """
+    Split text into index terms: accents, case and punctuation are folded,
+    function words dropped and a final "s" then "e" removed, so Creole "tirè",
+    French "tirs" and "tiré" all match "tire".
+
+    Args:
+        text (str): Text
+
+    Returns:
+        list: Terms
+    """
+    terms = []
+    for token in normalize_text(text or '').split():
+        if len(token) < 2 or token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        if len(token) > 3 and token.endswith("e"):
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+
+def event_terms(event):
+    """Weighted term frequencies of an event's summary, location and type."""
+    tf = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for term in tokenize(str(event.get(field) or '')):
+            tf[term] += weight
+    return tf
+
+
+class EventKeywordIndex:
+    """
+    In-memory inverted index with BM25 scoring over event text.
+    Postings map each term to {event id: weighted term frequency}; filter
+    fields are kept per event like in the vector index.
+    """
+
+    def __init__(self):
+        self.postings = {}  # term -> {event id: tf}
+        self.doc_terms = {}  # event id -> Counter, to remove the event's postings
+        self.doc_lengths = {}
+        self.total_length = 0
+        self.severity = {}
+        self.timestamps = {}
+        self.event_types = {}
+        self.lock = threading.RLock()
+
+    def add(self, event_id, event):
+        """
+        Add an event, or update it if already indexed.
+
+        Args:
+            event_id (str): Event ID
+            event (dict): Event with summary, location, event_type, severity and timestamp_start
+        """
+        tf = event_terms(event)
+        timestamp = parse_timestamp(event.get('timestamp_start'))
+        with self.lock:
+            self.remove(event_id)
+            for term, count in tf.items():
+                self.postings.setdefault(term, {})[event_id] = count
+            self.doc_terms[event_id] = tf
+            self.doc_lengths[event_id] = sum(tf.values())
+            self.total_length += self.doc_lengths[event_id]
+            self.severity[event_id] = SEVERITY_RANK.get(event.get('severity'), 0)
+            self.timestamps[event_id] = timestamp.timestamp() if timestamp else 0.0
+            self.event_types[event_id] = event.get('event_type')
+
+    def remove(self, event_id):
+        with self.lock:
+            tf = self.doc_terms.pop(event_id, None)
+            if tf is None:
+                return
+            for term in tf:
+                postings = self.postings[term]
+                del postings[event_id]
+                if not postings:
+                    del self.postings[term]
+            self.total_length -= self.doc_lengths.pop(event_id)
+            del self.severity[event_id], self.timestamps[event_id], self.event_types[event_id]
+
+    def evict_older_than(self, cutoff):
+        """Remove events that started before the cutoff (datetime). Returns the number removed."""
+        with self.lock:
+            expired = [event_id for event_id, ts in self.timestamps.items() if ts < cutoff.timestamp()]
+            for event_id in expired:
+                self.remove(event_id)
+            return len(expired)
+
+    def search(self, query, top_k=10, min_severity=None, event_types=None, since=None):
+        """
+        Rank events by BM25 score of the query terms.
+
+        Args:
+            query (str): Query text
+            top_k (int): Number of results
+            min_severity (str): Only events at or above this severity
+            event_types (list): Only events of these types
+            since (datetime): Only events started at or after this time
+
+        Returns:
+            list: (event id, BM25 score) pairs, best first. Events matching no term are left out.
+        """
+        terms = set(tokenize(query))
+        with self.lock:
+            n = len(self.doc_terms)
+            if not n or not terms:
+                return []
+            average_length = self.total_length / n
+            min_rank = SEVERITY_RANK.get(min_severity, 0) if min_severity else None
+            types = set(event_types) if event_types else None
+            cutoff = since.timestamp() if since else None
+
+            scores = {}
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for event_id, tf in postings.items():
+                    if min_rank is not None and self.severity[event_id] < min_rank:
+                        continue
+                    if types is not None and self.event_types[event_id] not in types:
+                        continue
+                    if cutoff is not None and self.timestamps[event_id] < cutoff:
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[event_id] / average_length)
+                    scores[event_id] = scores.get(event_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        if not scores:
+            return []
+        ids = list(scores)
+        values = np.fromiter((scores[i] for i in ids), dtype=np.float64, count=len(ids))
+        k = min(top_k, len(ids))
+        top = np.argpartition(-values, k - 1)[:k]
+        top = top[np.argsort(-values[top])]
+        return [(ids[i], float(values[i])) for i in top]
+
+    def __len__(self):
+        return len(self.doc_terms)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuse rankings of the same items from several retrievers.
+
+    Args:
+        rankings (list): Lists of item keys, best first
+        k (int): RRF constant
+
+    Returns:
+        list: Item keys ordered by fused score
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def rank_events(query, events):
+    """
+    Rank a list of events by BM25 without the shared index (database candidates).
+
+    Args:
+        query (str): Query text
+        events (list): Events
+
+    Returns:
+        list: Positions in events of the matching events, best first
+    """
+    candidates = EventKeywordIndex()
+    for i, event in enumerate(events):
+        candidates.add(i, event)
+    return [i for i, _ in candidates.search(query, top_k=len(events))]
+
+
+index = EventKeywordIndex()
+loaded_until = None  # start of the last refresh: events updated before it are loaded
+last_refresh = 0.0
+refresh_lock = threading.Lock()
+
+
+def add_events(events):
+    """
+    Add saved events to the index.
+
+    Args:
+        events (list): Events with _id
+
+    Returns:
+        int: Number of events indexed
+    """
+    if not KEYWORD_INDEX_ENABLED:
+        return 0
+    added = 0
+    for event in events:
+        if event.get('_id'):
+            index.add(str(event['_id']), event)
+            added += 1
+    return added
+
+
+def refresh():
+    """
+    Load events saved or merged since the last refresh (by any instance) and
+    evict old ones. The first call loads the whole window.
+    """
+    global loaded_until, last_refresh
+    if time.time() - last_refresh < KEYWORD_INDEX_REFRESH_SECONDS:
+        return
+    with refresh_lock:
+        if time.time() - last_refresh < KEYWORD_INDEX_REFRESH_SECONDS:
+            return
+        started = datetime.now(UTC)
+        cutoff = started - timedelta(hours=KEYWORD_INDEX_WINDOW_HOURS)
+        updated_since = None
+        if loaded_until:
+            updated_since = loaded_until - timedelta(seconds=KEYWORD_INDEX_REFRESH_OVERLAP_SECONDS)
+        events = get_searchable_events(since=cutoff, updated_since=updated_since)
+        added = add_events(events)
+        loaded_until = started
+        evicted = index.evict_older_than(cutoff)
+        last_refresh = time.time()
+        if added or evicted:
+            print(f"Keyword index: {added} events added, {evicted} evicted, {len(index)} indexed")
+
+
+def search_events(query_text, query_params=None, top_k=10):
+    """
+    Search the indexed hot window with the filters of a chat query.
+
+    Args:
+        query_text (str): Query text
+        query_params (dict): Query parameters (event_types, severity, time cutoff as 'since')
+        top_k (int): Number of results
+
+    Returns:
+        list: (event id, score) pairs, or None if the index cannot answer
+            (disabled or time range beyond the window)
+    """
+    if not KEYWORD_INDEX_ENABLED:
+        return None
+    query_params = query_params or {}
+    since = query_params.get('since')
+    if since is None or since < datetime.now(UTC) - timedelta(hours=KEYWORD_INDEX_WINDOW_HOURS):
+        return None
+    try:
+        refresh()
+    except Exception as e:
+        print(f"Keyword index refresh failed: {e}")
+
+    return index.search(
+        query_text,
+        top_k=top_k,
+        min_severity=(query_params.get('severity') or '').lower() or None,
+        event_types=query_params.get('event_types') or None,
+        since=since
+    )
+
+
+def get_stats():
+    """
+    Get keyword index size and settings.
+
+    Returns:
+        dict: Indexed events, distinct terms and settings
+    """
+    with index.lock:
+        terms = len(index.postings)
+    return {
+        "enabled": KEYWORD_INDEX_ENABLED,
+        "indexed_events": len(index),
+        "terms": terms,
+        "window_hours": KEYWORD_INDEX_WINDOW_HOURS,
+        "refresh_seconds": KEYWORD_INDEX_REFRESH_SECONDS,
+        "rrf_k": RRF_K
+    }
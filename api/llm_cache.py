@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from cachetools import LRUCache
+from .model_router import routed_completion, routed_stream
+from .utils import estimate_tokens
+from .db.models import ensure_llm_cache_indexes, get_cached_llm_response, save_cached_llm_response
+
+
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", 1000))
+# Share cached responses between instances through Mongo
+LLM_CACHE_SHARED = os.environ.get("LLM_CACHE_SHARED", "false").lower() == "true"
+
+# Seconds a response stays valid per call site (0 = never cached).
+# Keys also include a time bucket of the same length, so answers built on
+# live event data never outlive their bucket.
+CALL_SITE_TTLS = {
+    "preprocess_chat": 3600,
+    "general_question": 86400,
+    "analyse_chat": 120,
+    "chat_tools": 120,
+    "summary": 120,
+    "preprocess_msg": 600,
+    "analyse_msg": 600,
+}
+
+lru = LRUCache(maxsize=LLM_CACHE_SIZE)  # key -> (expires_at, content, tokens)
+lru_lock = threading.Lock()
+indexes_ready = False
+
+stats = {"hits": 0, "shared_hits": 0, "misses": 0, "saved_tokens": 0, "by_call_site": {}}
+
+
+def normalize_content(text):
+    """Normalize message content for cache keys (case and whitespace ignored)."""
+    return " ".join(str(text).split()).casefold()
+
+
+def make_cache_key(call_site, ttl, kwargs):
+    """
+    Build the content-addressed key of a completion request.
+
+    Args:
+        call_site (str): Call site name
+        ttl (int): Call site TTL, also the time bucket length
+        kwargs (dict): Arguments of chat.completions.create
+
+    Returns:
+        str: Hex digest key
+    """
+    messages = kwargs.get('messages', [])
+    system = "".join(m['content'] for m in messages if m['role'] == 'system')
+    user = [normalize_content(m['content']) for m in messages if m['role'] != 'system']
+    params = {k: v for k, v in kwargs.items() if k not in ('messages', 'model')}
+    material = json.dumps([
+        call_site,
+        kwargs.get('model'),
+        hashlib.sha256(system.encode("utf-8")).hexdigest(),
+        user,
+        params,
+        int(time.time() // ttl)
+    ], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def record(call_site, outcome, tokens=0):
+    site = stats["by_call_site"].setdefault(call_site, {"hits": 0, "misses": 0, "saved_tokens": 0})
+    if outcome == "miss":
+        stats["misses"] += 1
+        site["misses"] += 1
+        return
+    stats["hits"] += 1
+    if outcome == "shared_hit":
+        stats["shared_hits"] += 1
+    stats["saved_tokens"] += tokens
+    site["hits"] += 1
+    site["saved_tokens"] += tokens
+
+
+def lookup(call_site, key, ttl):
+    """Return the cached content of a key from the LRU tier, then the shared tier, or None."""
+    global indexes_ready
+    now = time.time()
+    with lru_lock:
+        entry = lru.get(key)
+    if entry and entry[0] > now:
+        record(call_site, "hit", entry[2])
+        return entry[1]
+
+    if LLM_CACHE_SHARED:
+        if not indexes_ready:
+            ensure_llm_cache_indexes()
+            indexes_ready = True
+        shared = get_cached_llm_response(key)
+        if shared:
+            with lru_lock:
+                lru[key] = (now + ttl, shared['content'], shared.get('tokens', 0))
+            record(call_site, "shared_hit", shared.get('tokens', 0))
+            return shared['content']
+    return None
+
+
+def store(call_site, key, ttl, content, tokens):
+    record(call_site, "miss")
+    with lru_lock:
+        lru[key] = (time.time() + ttl, content, tokens)
+    if LLM_CACHE_SHARED:
+        save_cached_llm_response(key, call_site, content, tokens, ttl)
+
+
+def cached_completion(call_site, **kwargs):
+    """
+    Run a chat completion through the response cache, then the model router.
+
+    Args:
+        call_site (str): Call site name, selects the TTL
+        **kwargs: Arguments of the completion (model, messages, response_format, ...)
+
+    Returns:
+        str: Message content of the completion
+    """
+    ttl = CALL_SITE_TTLS.get(call_site, 0)
+    if not LLM_CACHE_ENABLED or ttl <= 0:
+        return routed_completion(call_site, **kwargs).choices[0].message.content
+
+    key = make_cache_key(call_site, ttl, kwargs)
+    content = lookup(call_site, key, ttl)
+    if content is not None:
+        return content
+
+    completion = routed_completion(call_site, **kwargs)
+    content = completion.choices[0].message.content
+    usage = getattr(completion, 'usage', None)
+    store(call_site, key, ttl, content, getattr(usage, 'total_tokens', 0) or 0)
+    return content
+
+
+def cached_stream(call_site, **kwargs):
+    """
+    Stream a chat completion through the response cache. A cached response is
+    yielded as a single chunk; a streamed response is cached once complete.
+    Shares cache entries with cached_completion for the same arguments.
+
+    Args:
+        call_site (str): Call site name, selects the TTL
+        **kwargs: Arguments of the completion (model, messages, ...)
+
+    Yields:
+        str: Content chunks
+    """
+    ttl = CALL_SITE_TTLS.get(call_site, 0)
+    if not LLM_CACHE_ENABLED or ttl <= 0:
+        yield from routed_stream(call_site, **kwargs)
+        return
+
+    key = make_cache_key(call_site, ttl, kwargs)
+    content = lookup(call_site, key, ttl)
+    if content is not None:
+        yield content
+        return
+
+    parts = []
+    for chunk in routed_stream(call_site, **kwargs):
+        parts.append(chunk)
+        yield chunk
+
+    content = "".join(parts)
+    # Streams carry no usage, so the cost is estimated from the text
+    prompt = "".join(str(m['content']) for m in kwargs.get('messages', []))
+    store(call_site, key, ttl, content, estimate_tokens(prompt + content))
+
+
+def get_stats():
+    """
+    Get response cache counters.
+
+    Returns:
+        dict: Hits, misses, hit rate and saved tokens (total and per call site)
+    """
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        **stats,
+        "hit_rate": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+        "enabled": LLM_CACHE_ENABLED,
+        "shared": LLM_CACHE_SHARED,
+        "entries": len(lru),
+        "ttls": CALL_SITE_TTLS
+    }
@@ -0,0 +1,304 @@
+import os
+import threading
+import time
+from collections import deque
+import httpx
+import openai
+from openai import OpenAI
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+
+GROK_TOKEN = os.environ.get("GROK_TOKEN")
+if not GROK_TOKEN:
+    raise RuntimeError(
+        "Missing GROK_API_KEY or XAI_API_KEY environment variable.\n"
+        "Get your API key from https://console.x.ai/\n"
+        "Then set it: export GROK_API_KEY='your-api-key-here'"
+    )
+
+GROK_BASE_URL = os.environ.get("GROK_BASE_URL", "https://api.x.ai/v1")
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", 20))
+LLM_MAX_KEEPALIVE = int(os.environ.get("LLM_MAX_KEEPALIVE", 10))
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", 5))
+# Attempts per call, including the first one
+LLM_MAX_ATTEMPTS = int(os.environ.get("LLM_MAX_ATTEMPTS", 3))
+LLM_RETRY_MAX_WAIT = float(os.environ.get("LLM_RETRY_MAX_WAIT", 8))
+# Circuit breaker: opens when at least LLM_BREAKER_ERROR_RATE of the last
+# LLM_BREAKER_WINDOW calls to a model failed, and stays open LLM_BREAKER_COOLDOWN seconds
+LLM_BREAKER_WINDOW = int(os.environ.get("LLM_BREAKER_WINDOW", 20))
+LLM_BREAKER_MIN_CALLS = int(os.environ.get("LLM_BREAKER_MIN_CALLS", 5))
+LLM_BREAKER_ERROR_RATE = float(os.environ.get("LLM_BREAKER_ERROR_RATE", 0.5))
+LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", 30))
+
+# Total seconds a call may take per call site, retries included.
+# Interactive chat fails fast; batch ingestion can wait for long reasoning calls.
+CALL_SITE_DEADLINES = {
+    "preprocess_chat": 20,
+    "general_question": 45,
+    "chat_tools": 45,
+    "analyse_chat": 45,
+    "summary": 30,
+    "embeddings": 15,
+    "preprocess_msg": 90,
+    "analyse_msg": 180,
+}
+DEFAULT_DEADLINE = 60
+
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+# Pooled transport shared by every request (keep-alive connections to the Grok API)
+http_client = httpx.Client(
+    limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE),
+    timeout=httpx.Timeout(DEFAULT_DEADLINE, connect=LLM_CONNECT_TIMEOUT),
+)
+
+# Grok AI uses OpenAI-compatible API. Retries are handled here, not by the SDK.
+client = OpenAI(
+    base_url=GROK_BASE_URL,
+    api_key=GROK_TOKEN,
+    http_client=http_client,
+    max_retries=0,
+)
+
+stats = {"calls": 0, "retries": 0, "failures": 0, "fast_failures": 0, "by_call_site": {}}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Rolling error-rate circuit breaker for one model.
+    closed: calls go through; open: calls fail fast until the cooldown elapsed;
+    half_open: one trial call decides whether to close or open again.
+    """
+
+    def __init__(self, window=LLM_BREAKER_WINDOW, min_calls=LLM_BREAKER_MIN_CALLS,
+                 error_rate=LLM_BREAKER_ERROR_RATE, cooldown=LLM_BREAKER_COOLDOWN):
+        self.outcomes = deque(maxlen=window)  # True = failure
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may be attempted now."""
+        with self.lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self.trial_running:
+                    return False
+                self.trial_running = True
+            return True
+
+    def rejecting(self):
+        """Return True while calls fail fast, without moving the breaker to half_open."""
+        with self.lock:
+            if self.state == "open":
+                return time.monotonic() - self.opened_at < self.cooldown
+            return self.state == "half_open" and self.trial_running
+
+    def record(self, failed):
+        with self.lock:
+            if self.state == "half_open":
+                self.trial_running = False
+                if failed:
+                    self.open()
+                else:
+                    self.state = "closed"
+                    self.outcomes.clear()
+                return
+
+            self.outcomes.append(failed)
+            failures = sum(self.outcomes)
+            if len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.error_rate:
+                self.open()
+
+    def open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+        print(f"Circuit breaker opened for {self.cooldown}s")
+
+    def snapshot(self):
+        return {
+            "state": self.state,
+            "recent_calls": len(self.outcomes),
+            "recent_failures": sum(self.outcomes)
+        }
+
+
+breakers = {}  # model -> CircuitBreaker
+breakers_lock = threading.Lock()
+
+
+def get_breaker(model):
+    with breakers_lock:
+        if model not in breakers:
+            breakers[model] = CircuitBreaker()
+        return breakers[model]
+
+
+def is_retryable(error):
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+def record(call_site, key, count=1):
+    site = stats["by_call_site"].setdefault(
+        call_site, {"calls": 0, "retries": 0, "failures": 0, "fast_failures": 0}
+    )
+    stats[key] += count
+    site[key] += count
+
+
+def call_model(call_site, model, request, deadline=None, **kwargs):
+    """
+    Call the Grok API with a deadline, jittered exponential retries and the model's circuit breaker.
+
+    Args:
+        call_site (str): Call site name, selects the deadline
+        model (str): Model name
+        request (callable): SDK method to call (chat.completions.create, embeddings.create)
+        deadline (float): Seconds allowed for the call, defaults to the call site deadline
+        **kwargs: Request arguments (without model)
+
+    Returns:
+        The SDK response
+
+    Raises:
+        CircuitOpenError: If the model's circuit breaker is open
+        openai.OpenAIError: If the call failed after all retries
+    """
+    breaker = get_breaker(model)
+    deadline_seconds = deadline or CALL_SITE_DEADLINES.get(call_site, DEFAULT_DEADLINE)
+    deadline = time.monotonic() + deadline_seconds
+    record(call_site, "calls")
+
+    backoff = wait_random_exponential(multiplier=0.5, max=LLM_RETRY_MAX_WAIT)
+
+    def wait_within_deadline(retry_state):
+        # Never sleep past the deadline
+        return min(backoff(retry_state), max(deadline - time.monotonic(), 0.0))
+
+    def deadline_reached(retry_state):
+        # Checked after the wait is chosen: no retry would start at or after the deadline
+        return time.monotonic() + retry_state.upcoming_sleep >= deadline
+
+    retrying = Retrying(
+        retry=retry_if_exception(is_retryable),
+        wait=wait_within_deadline,
+        stop=stop_after_attempt(LLM_MAX_ATTEMPTS) | deadline_reached,
+        reraise=True,
+    )
+    try:
+        for attempt in retrying:
+            with attempt:
+                if attempt.retry_state.attempt_number > 1:
+                    record(call_site, "retries")
+                if not breaker.allow():
+                    record(call_site, "fast_failures")
+                    raise CircuitOpenError(f"Circuit open for {model}, skipping {call_site}")
+
+                # Each attempt only gets the time left before the call's deadline
+                timeout = max(deadline - time.monotonic(), 1.0)
+                try:
+                    response = request(model=model, timeout=timeout, **kwargs)
+                except Exception as e:
+                    # Client errors (bad request, auth) say nothing about the model's health
+                    breaker.record(failed=is_retryable(e))
+                    raise
+                breaker.record(failed=False)
+                return response
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        record(call_site, "failures")
+        print(f"LLM call {call_site} on {model} failed: {type(e).__name__}: {e}")
+        raise
+
+
+def chat_completion(call_site, model, deadline=None, **kwargs):
+    """
+    Create a chat completion through the gateway.
+
+    Args:
+        call_site (str): Call site name
+        model (str): Model name
+        deadline (float): Seconds allowed for the call, defaults to the call site deadline
+        **kwargs: chat.completions.create arguments (messages, response_format, ...)
+
+    Returns:
+        ChatCompletion: SDK response
+    """
+    return call_model(call_site, model, client.chat.completions.create, deadline=deadline, **kwargs)
+
+
+def stream_chat_completion(call_site, model, deadline=None, **kwargs):
+    """
+    Stream a chat completion through the gateway. Retries and fallbacks can only
+    happen before the stream is opened; errors while streaming are raised as is.
+
+    Args:
+        call_site (str): Call site name
+        model (str): Model name
+        deadline (float): Seconds allowed to open the stream (and between chunks)
+        **kwargs: chat.completions.create arguments (messages, ...)
+
+    Yields:
+        str: Content deltas
+    """
+    stream = call_model(call_site, model, client.chat.completions.create, deadline=deadline, stream=True, **kwargs)
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        record(call_site, "failures")
+        get_breaker(model).record(failed=is_retryable(e))
+        print(f"LLM stream {call_site} on {model} failed: {type(e).__name__}: {e}")
+        raise
+    finally:
+        stream.close()
+
+
+def create_embeddings(model, **kwargs):
+    """
+    Create embeddings through the gateway.
+
+    Args:
+        model (str): Embedding model name
+        **kwargs: embeddings.create arguments (input, ...)
+
+    Returns:
+        CreateEmbeddingResponse: SDK response
+    """
+    return call_model("embeddings", model, client.embeddings.create, **kwargs)
+
+
+def get_stats():
+    """
+    Get gateway counters and circuit breaker states.
+
+    Returns:
+        dict: Call, retry and failure counters (total and per call site), breakers per model
+    """
+    with breakers_lock:
+        breaker_states = {model: breaker.snapshot() for model, breaker in breakers.items()}
+    return {
+        **stats,
+        "breakers": breaker_states,
+        "deadlines": CALL_SITE_DEADLINES,
+        "max_attempts": LLM_MAX_ATTEMPTS
+    }
@@ -0,0 +1,264 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+import numpy as np
+from .llm_gateway import chat_completion, stream_chat_completion, get_breaker, is_retryable, CircuitOpenError, CALL_SITE_DEADLINES, DEFAULT_DEADLINE
+
+
+# [analysis_model, preprocessing_model]
+MODELS = os.environ.get("LLM_MODELS", "grok-4-1-fast-reasoning,grok-4-fast-reasoning").split(",")
+# Rolling window of calls kept per model and call site
+ROUTER_WINDOW = int(os.environ.get("ROUTER_WINDOW", 50))
+# Samples needed before a window's latencies are trusted
+ROUTER_MIN_SAMPLES = int(os.environ.get("ROUTER_MIN_SAMPLES", 5))
+# Models failing more often than this are tried after healthier ones
+ROUTER_MAX_ERROR_RATE = float(os.environ.get("ROUTER_MAX_ERROR_RATE", 0.3))
+# Failures older than this many seconds no longer count, so a recovered model gets its traffic back
+ROUTER_ERROR_MAX_AGE = float(os.environ.get("ROUTER_ERROR_MAX_AGE", 300))
+# Share of over-budget calls still sent to the preferred model, so its latency stats stay fresh
+ROUTER_EXPLORE_RATE = float(os.environ.get("ROUTER_EXPLORE_RATE", 0.05))
+# Interactive calls give up on a model after this many times the budget and fall back
+ROUTER_FALLBACK_FACTOR = float(os.environ.get("ROUTER_FALLBACK_FACTOR", 2))
+# Share of the call site deadline kept for the fallback when a model other than the last one is tried
+ROUTER_FALLBACK_RESERVE = float(os.environ.get("ROUTER_FALLBACK_RESERVE", 0.3))
+
+# p95 latency budget in seconds per call site. Interactive call sites move to a
+# faster model when the preferred one is over budget; batch call sites (None)
+# always keep the best-quality model unless it is failing.
+LATENCY_BUDGETS = {
+    "preprocess_chat": 6,
+    "general_question": 15,
+    "chat_tools": 15,
+    "analyse_chat": 15,
+    "summary": 10,
+    "preprocess_msg": None,
+    "analyse_msg": None,
+}
+
+stats = {"fallbacks": 0, "rerouted": 0}
+
+
+class LatencyWindow:
+    """Rolling latencies and outcomes of recent calls."""
+
+    def __init__(self, size=ROUTER_WINDOW):
+        self.latencies = deque(maxlen=size)
+        self.outcomes = deque(maxlen=size)  # (monotonic time, True = failure)
+
+    def add(self, latency, failed):
+        self.outcomes.append((time.monotonic(), failed))
+        if not failed:
+            self.latencies.append(latency)
+
+    def error_rate(self):
+        """Failure rate of the calls made in the last ROUTER_ERROR_MAX_AGE seconds."""
+        since = time.monotonic() - ROUTER_ERROR_MAX_AGE
+        recent = [failed for at, failed in self.outcomes if at >= since]
+        return sum(recent) / len(recent) if recent else 0.0
+
+    def percentile(self, q):
+        if len(self.latencies) < ROUTER_MIN_SAMPLES:
+            return None
+        return float(np.percentile(self.latencies, q))
+
+    def snapshot(self):
+        p50, p95 = self.percentile(50), self.percentile(95)
+        return {
+            "calls": len(self.outcomes),
+            "error_rate": round(self.error_rate(), 4),
+            "p50": round(p50, 3) if p50 is not None else None,
+            "p95": round(p95, 3) if p95 is not None else None
+        }
+
+
+windows = {}  # (model, call_site) -> LatencyWindow
+windows_lock = threading.Lock()
+
+
+def get_window(model, call_site):
+    with windows_lock:
+        key = (model, call_site)
+        if key not in windows:
+            windows[key] = LatencyWindow()
+        return windows[key]
+
+
+def record_call(model, call_site, latency, failed):
+    with windows_lock:
+        for key in ((model, call_site), (model, "*")):
+            windows.setdefault(key, LatencyWindow()).add(latency, failed)
+
+
+def estimate_p95(model, call_site):
+    """p95 latency of a model at a call site, or across call sites while the site has too few samples."""
+    p95 = get_window(model, call_site).percentile(95)
+    if p95 is None:
+        p95 = get_window(model, "*").percentile(95)
+    return p95
+
+
+def select_models(call_site, preferred):
+    """
+    Order the candidate models of a call.
+
+    Args:
+        call_site (str): Call site name
+        preferred (str): Model the call site asked for
+
+    Returns:
+        list: Models to try in order
+    """
+    candidates = [preferred] + [m for m in MODELS if m != preferred]
+    breakers = {m: get_breaker(m) for m in candidates}
+    # Breakers still cooling down go last: they fail fast, so they cost nothing when tried.
+    # Once the cooldown elapsed, the model is eligible again and its next call is the half-open trial.
+    unhealthy = [m for m in candidates if breakers[m].rejecting()]
+    healthy = [m for m in candidates if m not in unhealthy]
+
+    # A model due for its trial call keeps its place: the trial, not the old failures, decides
+    failing = [
+        m for m in healthy
+        if breakers[m].state == "closed" and get_window(m, call_site).error_rate() > ROUTER_MAX_ERROR_RATE
+    ]
+    ordered = [m for m in healthy if m not in failing] + failing + unhealthy
+
+    budget = LATENCY_BUDGETS.get(call_site)
+    if budget and len(ordered) > 1 and random.random() >= ROUTER_EXPLORE_RATE:
+        p95 = estimate_p95(ordered[0], call_site)
+        if p95 is not None and p95 > budget:
+            # Failing models are not promoted: their p95 only counts the calls that succeeded
+            for model in ordered[1:len(ordered) - len(failing) - len(unhealthy)]:
+                alternate_p95 = estimate_p95(model, call_site)
+                if alternate_p95 is not None and alternate_p95 < p95:
+                    ordered.remove(model)
+                    ordered.insert(0, model)
+                    break
+
+    if ordered[0] != preferred:
+        stats["rerouted"] += 1
+    return ordered
+
+
+def attempt_deadline(budget, remaining, last):
+    """
+    Deadline of one model attempt. Every attempt but the last keeps
+    ROUTER_FALLBACK_RESERVE of the remaining time for the fallback; interactive
+    calls also give up on a slow model after ROUTER_FALLBACK_FACTOR times the budget.
+    """
+    if last:
+        return max(remaining, 1.0)
+    deadline = remaining * (1 - ROUTER_FALLBACK_RESERVE)
+    if budget:
+        deadline = min(budget * ROUTER_FALLBACK_FACTOR, deadline)
+    return deadline
+
+
+def routed_completion(call_site, model, **kwargs):
+    """
+    Create a chat completion on the best model for the call site, falling back
+    to the next model on timeouts, unavailability or an open circuit breaker.
+
+    Args:
+        call_site (str): Call site name
+        model (str): Preferred model
+        **kwargs: chat.completions.create arguments (messages, response_format, ...)
+
+    Returns:
+        ChatCompletion: SDK response
+    """
+    models = select_models(call_site, model)
+    budget = LATENCY_BUDGETS.get(call_site)
+    started = time.monotonic()
+    total_deadline = CALL_SITE_DEADLINES.get(call_site, DEFAULT_DEADLINE)
+
+    for i, candidate in enumerate(models):
+        remaining = total_deadline - (time.monotonic() - started)
+        last = i == len(models) - 1
+        if remaining <= 0 and not last:
+            continue
+
+        call_started = time.monotonic()
+        try:
+            completion = chat_completion(
+                call_site, candidate, deadline=attempt_deadline(budget, remaining, last), **kwargs
+            )
+        except CircuitOpenError:
+            if last:
+                raise
+            continue
+        except Exception as e:
+            record_call(candidate, call_site, time.monotonic() - call_started, failed=is_retryable(e))
+            if last or not is_retryable(e):
+                raise
+            stats["fallbacks"] += 1
+            print(f"Model {candidate} failed for {call_site}, falling back to {models[i + 1]}")
+            continue
+
+        record_call(candidate, call_site, time.monotonic() - call_started, failed=False)
+        return completion
+
+
+def routed_stream(call_site, model, **kwargs):
+    """
+    Stream a chat completion on the best model for the call site. Falls back to
+    the next model like routed_completion, as long as no chunk was sent yet.
+
+    Args:
+        call_site (str): Call site name
+        model (str): Preferred model
+        **kwargs: chat.completions.create arguments (messages, ...)
+
+    Yields:
+        str: Content chunks
+    """
+    models = select_models(call_site, model)
+    budget = LATENCY_BUDGETS.get(call_site)
+    started = time.monotonic()
+    total_deadline = CALL_SITE_DEADLINES.get(call_site, DEFAULT_DEADLINE)
+
+    for i, candidate in enumerate(models):
+        remaining = total_deadline - (time.monotonic() - started)
+        last = i == len(models) - 1
+        if remaining <= 0 and not last:
+            continue
+
+        call_started = time.monotonic()
+        stream = stream_chat_completion(
+            call_site, candidate, deadline=attempt_deadline(budget, remaining, last), **kwargs
+        )
+        try:
+            first = next(stream, None)
+        except CircuitOpenError:
+            if last:
+                raise
+            continue
+        except Exception as e:
+            record_call(candidate, call_site, time.monotonic() - call_started, failed=is_retryable(e))
+            if last or not is_retryable(e):
+                raise
+            stats["fallbacks"] += 1
+            print(f"Model {candidate} failed for {call_site}, falling back to {models[i + 1]}")
+            continue
+
+        if first is not None:
+            yield first
+        yield from stream
+        # Full generation time, comparable with non-streamed calls
+        record_call(candidate, call_site, time.monotonic() - call_started, failed=False)
+        return
+
+
+def get_stats():
+    """
+    Get router counters and latency/error windows per model and call site.
+
+    Returns:
+        dict: Counters, budgets and {model: {call_site: window stats}} ("*" = all call sites)
+    """
+    with windows_lock:
+        models = {}
+        for (model, call_site), window in windows.items():
+            models.setdefault(model, {})[call_site] = window.snapshot()
+    return {**stats, "budgets": LATENCY_BUDGETS, "models": models}
@@ -0,0 +1,251 @@
+import os
+import threading
+import time
+from collections import deque
+import mmh3
+import numpy as np
+from .dedup import normalize_text, get_message_text, fingerprint_message, count_as_source
+
+
+# Estimated Jaccard similarity above which two messages are the same alert
+NEAR_DUP_THRESHOLD = float(os.environ.get("NEAR_DUP_THRESHOLD", 0.7))
+# LSH banding: NEAR_DUP_BANDS * NEAR_DUP_ROWS MinHash permutations.
+# Candidate pairs are found from roughly (1 / bands) ** (1 / rows) similarity.
+NEAR_DUP_BANDS = int(os.environ.get("NEAR_DUP_BANDS", 16))
+NEAR_DUP_ROWS = int(os.environ.get("NEAR_DUP_ROWS", 4))
+NEAR_DUP_SHINGLE_SIZE = int(os.environ.get("NEAR_DUP_SHINGLE_SIZE", 3))
+# How long a message stays in the index
+NEAR_DUP_WINDOW_HOURS = float(os.environ.get("NEAR_DUP_WINDOW_HOURS", 6))
+
+MERSENNE_PRIME = (1 << 31) - 1
+NUM_PERM = NEAR_DUP_BANDS * NEAR_DUP_ROWS
+
+# Universal hash permutations h(x) = (a * x + b) mod p, fixed so signatures are stable
+rng = np.random.RandomState(1)
+perm_a = rng.randint(1, MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+perm_b = rng.randint(0, MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+
+stats = {"checked": 0, "index_hits": 0, "batch_groups": 0, "stale_representatives": 0, "forgotten": 0}
+
+
+def get_shingles(text):
+    """
+    Split normalized text into overlapping character shingles.
+    Character shingles tolerate spelling variants (Petyonvil / Pétion-Ville).
+
+    Args:
+        text (str): Raw message text
+
+    Returns:
+        set: Shingles
+    """
+    text = normalize_text(text)
+    k = NEAR_DUP_SHINGLE_SIZE
+    if len(text) <= k:
+        return {text} if text else set()
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+
+def minhash_signature(shingles):
+    """
+    Compute the MinHash signature of a shingle set.
+
+    Args:
+        shingles (set): Shingles
+
+    Returns:
+        numpy.ndarray: NUM_PERM uint64 values, or None for an empty set
+    """
+    if not shingles:
+        return None
+    hashes = np.array([mmh3.hash(s, signed=False) for s in shingles], dtype=np.uint64) % MERSENNE_PRIME
+    permuted = (np.outer(hashes, perm_a) + perm_b) % MERSENNE_PRIME
+    return permuted.min(axis=0)
+
+
+def estimate_similarity(sig1, sig2):
+    """Estimate the Jaccard similarity of two messages from their signatures."""
+    return float(np.mean(sig1 == sig2))
+
+
+class NearDuplicateIndex:
+    """
+    MinHash LSH index over recently received raw messages.
+    Each entry is a representative message; near-identical messages are matched to it.
+    """
+
+    def __init__(self, bands=NEAR_DUP_BANDS, rows=NEAR_DUP_ROWS,
+                 threshold=NEAR_DUP_THRESHOLD, window_hours=NEAR_DUP_WINDOW_HOURS):
+        self.bands = bands
+        self.rows = rows
+        self.threshold = threshold
+        self.window_seconds = window_hours * 3600
+        self.buckets = [{} for _ in range(bands)]  # band -> {band hash: set(entry ids)}
+        self.entries = {}  # entry id -> (signature, fingerprint, added_at)
+        self.order = deque()  # (added_at, entry id), oldest first
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def band_keys(self, signature):
+        return [
+            hash(signature[i * self.rows:(i + 1) * self.rows].tobytes())
+            for i in range(self.bands)
+        ]
+
+    def evict_expired(self):
+        cutoff = time.time() - self.window_seconds
+        while self.order and self.order[0][0] < cutoff:
+            self.remove(self.order.popleft()[1])
+
+    def remove(self, entry_id):
+        entry = self.entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for band, key in enumerate(self.band_keys(entry[0])):
+            bucket = self.buckets[band].get(key)
+            if bucket:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self.buckets[band][key]
+
+    def remove_message(self, signature, fingerprint):
+        """Remove the entries of a message (same signature and fingerprint). Returns the number removed."""
+        candidates = set()
+        for band, key in enumerate(self.band_keys(signature)):
+            candidates.update(self.buckets[band].get(key, ()))
+        removed = [entry_id for entry_id in candidates if self.entries[entry_id][1] == fingerprint]
+        for entry_id in removed:
+            self.remove(entry_id)
+        return len(removed)
+
+    def query(self, signature):
+        """
+        Find the most similar indexed message above the threshold.
+
+        Args:
+            signature (numpy.ndarray): MinHash signature
+
+        Returns:
+            tuple: (entry id, fingerprint, similarity) or None
+        """
+        candidates = set()
+        for band, key in enumerate(self.band_keys(signature)):
+            candidates.update(self.buckets[band].get(key, ()))
+
+        best = None
+        for entry_id in candidates:
+            entry_signature, fingerprint, _ = self.entries[entry_id]
+            similarity = estimate_similarity(signature, entry_signature)
+            if similarity >= self.threshold and (best is None or similarity > best[2]):
+                best = (entry_id, fingerprint, similarity)
+        return best
+
+    def add(self, signature, fingerprint):
+        entry_id = self.next_id
+        self.next_id += 1
+        added_at = time.time()
+        self.entries[entry_id] = (signature, fingerprint, added_at)
+        self.order.append((added_at, entry_id))
+        for band, key in enumerate(self.band_keys(signature)):
+            self.buckets[band].setdefault(key, set()).add(entry_id)
+        return entry_id
+
+
+index = NearDuplicateIndex()
+
+
+def group_near_duplicates(raw_messages):
+    """
+    Collapse near-identical messages into one representative before pretriage.
+    Messages matching one received earlier (within the index window) are dropped
+    and counted against that message; messages matching another one of the same
+    batch are folded into it and counted in its `near_duplicates` field.
+
+    Args:
+        raw_messages (list): Raw messages (exact duplicates already removed)
+
+    Returns:
+        tuple: (representative messages, number of messages collapsed)
+    """
+    representatives = []
+    batch_entries = {}  # entry id -> index in representatives
+    collapsed = 0
+
+    for message in raw_messages:
+        stats["checked"] += 1
+        signature = minhash_signature(get_shingles(get_message_text(message)))
+        if signature is None:
+            representatives.append(message)
+            continue
+
+        with index.lock:
+            index.evict_expired()
+            match = index.query(signature)
+            if match is None:
+                entry_id = index.add(signature, fingerprint_message(message))
+
+        # A representative from an earlier request covers the copy only while it
+        # can still become an event (counted as an extra source once it is one)
+        if match is not None and match[0] not in batch_entries and not count_as_source(match[1]):
+            stats["stale_representatives"] += 1
+            with index.lock:
+                index.remove(match[0])
+                entry_id = index.add(signature, fingerprint_message(message))
+            match = None
+
+        if match is None:
+            batch_entries[entry_id] = len(representatives)
+            representatives.append(message)
+            continue
+
+        collapsed += 1
+        entry_id, fingerprint, similarity = match
+        if entry_id in batch_entries:
+            stats["batch_groups"] += 1
+            representative = representatives[batch_entries[entry_id]]
+            if isinstance(representative, dict):
+                representative['near_duplicates'] = representative.get('near_duplicates', 0) + 1
+        else:
+            stats["index_hits"] += 1
+
+    if collapsed:
+        print(f"Collapsed {collapsed} near-duplicate messages")
+    return representatives, collapsed
+
+
+def forget_messages(raw_messages):
+    """
+    Remove representatives that were dropped before processing (prefilter)
+    from the index, so chatter never suppresses later variants of real alerts.
+
+    Args:
+        raw_messages (list): Messages returned by group_near_duplicates but not enqueued
+    """
+    for message in raw_messages:
+        signature = minhash_signature(get_shingles(get_message_text(message)))
+        if signature is None:
+            continue
+        fingerprint = fingerprint_message(message)
+        with index.lock:
+            stats["forgotten"] += index.remove_message(signature, fingerprint)
+
+
+def get_stats():
+    """
+    Get near-duplicate detection counters and settings for tuning.
+
+    Returns:
+        dict: Counters, hit rate and thresholds
+    """
+    checked = stats["checked"]
+    collapsed = stats["index_hits"] + stats["batch_groups"]
+    return {
+        **stats,
+        "hit_rate": round(collapsed / checked, 4) if checked else 0.0,
+        "indexed_messages": len(index.entries),
+        "threshold": index.threshold,
+        "bands": index.bands,
+        "rows": index.rows,
+        "shingle_size": NEAR_DUP_SHINGLE_SIZE,
+        "window_hours": index.window_seconds / 3600
+    }
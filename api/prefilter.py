@@ -0,0 +1,114 @@
+import os
+from .dedup import normalize_text, get_message_text
+from .gazetteer import TermMatcher, ZONE_ALIASES, WEAK_PLACE_TERMS
+
+
+# off: disabled, shadow: only log what would be dropped, enforce: drop
+PREFILTER_MODE = os.environ.get("PREFILTER_MODE", "shadow").lower()
+# Messages scoring below this are considered irrelevant chatter
+PREFILTER_MIN_SCORE = float(os.environ.get("PREFILTER_MIN_SCORE", 2))
+
+# Creole / French / English terms and their relevance weight.
+# Terms are folded like message text (case, accents and punctuation ignored).
+INCIDENT_TERMS = {
+    # Insecurity, gunshots, kidnapping
+    'tire': 3, 'tirey': 3, 'tiraj': 3, 'rafal': 3, 'zam': 3, 'zam lou': 3, 'koup zam': 3,
+    'bandi': 3, 'gang': 3, 'kidnaping': 3, 'kidnapin': 3, 'kidnapping': 3, 'kidnape': 3,
+    'enlevement': 3, 'fusillade': 3, 'coups de feu': 3, 'shooting': 3, 'gunshots': 3,
+    'ensekirite': 2, 'insecurite': 2, 'insecurity': 2, 'drone': 2,
+    # Roadblocks, protests, traffic
+    'barikad': 3, 'barricade': 3, 'barricades': 3, 'blokis': 3, 'blokaj': 3, 'wout bloke': 3,
+    'roadblock': 3, 'bloke': 2, 'boule kawotchou': 3, 'kawotchou': 2, 'manifestation': 3, 'manifestan': 3,
+    'protest': 3, 'pep pran lari': 3, 'foul': 2, 'circulation': 2, 'trafic': 2, 'traffic': 2,
+    'kamyon pann': 2, 'embouteillage': 2,
+    # Accidents, fires, natural disasters
+    'aksidan': 3, 'accident': 3, 'moto frape': 3, 'machin frape': 3, 'dife': 3, 'incendie': 3,
+    'fire': 2, 'inondasyon': 3, 'inondation': 3, 'flood': 3, 'glisman teren': 3,
+    'tranbleman te': 3, 'tranblemann te': 3, 'seisme': 3, 'earthquake': 3, 'gwo lapli': 2,
+    'siklon': 3, 'cyclone': 3,
+    # Community alert vocabulary
+    'evite': 2, 'pran prekosyon': 2, 'prekosyon': 1, 'danje': 2, 'danger': 2, 'alert': 2,
+    'alerte': 2, 'polis': 1, 'police': 1, 'pnh': 1, 'kouri': 1, 'zon cho': 2, 'zon wouj': 2,
+}
+
+# Every zone alias of the gazetteer; place words that are also common words count less
+ZONE_TERMS = {**{term: 1 for term in WEAK_PLACE_TERMS}, **{alias: 2 for alias in ZONE_ALIASES}}
+
+CHATTER_TERMS = {
+    'bonjou': -1, 'bonswa': -1, 'bonjour': -1, 'bonsoir': -1, 'good morning': -1,
+    'good night': -1, 'mesi': -1, 'merci': -1, 'thanks': -1, 'lol': -2, 'haha': -2,
+    'hahaha': -2, 'mdr': -2, 'bon fet': -2, 'happy birthday': -2, 'joyeux anniversaire': -2,
+    'amen': -2, 'bondye beni': -2, 'beni w': -2, 'promo': -2, 'vann': -1, 'a vendre': -2,
+    'for sale': -2, 'abonnez vous': -2, 'like and share': -2,
+}
+
+TERM_WEIGHTS = {**INCIDENT_TERMS, **ZONE_TERMS, **CHATTER_TERMS}
+# Multi-word terms win over their parts
+TERM_MATCHER = TermMatcher(TERM_WEIGHTS)
+
+stats = {"checked": 0, "dropped": 0}
+
+
+def score_message(text):
+    """
+    Score how likely a message is to describe a security or mobility incident.
+    Each distinct term counts once.
+
+    Args:
+        text (str): Raw message text
+
+    Returns:
+        tuple: (score, list of matched terms)
+    """
+    matched = {term for _, _, term in TERM_MATCHER.find(normalize_text(text))}
+    return sum(TERM_WEIGHTS[term] for term in matched), sorted(matched)
+
+
+def filter_relevant_messages(raw_messages):
+    """
+    Drop obviously irrelevant messages (greetings, memes, chatter) before pretriage.
+    In shadow mode nothing is dropped; would-be drops are only logged and counted.
+
+    Args:
+        raw_messages (list): Raw messages
+
+    Returns:
+        tuple: (messages to pretriage, number of messages dropped)
+    """
+    if PREFILTER_MODE == "off":
+        return raw_messages, 0
+
+    kept = []
+    dropped = 0
+    for message in raw_messages:
+        stats["checked"] += 1
+        text = get_message_text(message)
+        score, terms = score_message(text)
+        if score >= PREFILTER_MIN_SCORE:
+            kept.append(message)
+            continue
+
+        stats["dropped"] += 1
+        if PREFILTER_MODE == "shadow":
+            print(f"Prefilter (shadow) would drop [score={score}, terms={terms}]: {text[:120]}")
+            kept.append(message)
+        else:
+            dropped += 1
+
+    return kept, dropped
+
+
+def get_stats():
+    """
+    Get prefilter counters. In shadow mode `dropped` counts would-be drops.
+
+    Returns:
+        dict: Counters, drop rate and settings
+    """
+    checked = stats["checked"]
+    return {
+        **stats,
+        "drop_rate": round(stats["dropped"] / checked, 4) if checked else 0.0,
+        "mode": PREFILTER_MODE,
+        "min_score": PREFILTER_MIN_SCORE
+    }
@@ -0,0 +1,277 @@
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor
+from .services import preprocess_msg
+from .utils import estimate_tokens
+
+
+# Micro-batching window: messages posted by concurrent requests are pretriaged
+# together once the window elapses or enough messages are waiting.
+# A window of 0 disables batching.
+PRETRIAGE_BATCH_WINDOW = float(os.environ.get("PRETRIAGE_BATCH_WINDOW", 2.0))
+PRETRIAGE_BATCH_MAX_MESSAGES = int(os.environ.get("PRETRIAGE_BATCH_MAX_MESSAGES", 50))
+# Seconds a job waits for its batched pretriage result before giving up
+PRETRIAGE_RESULT_TIMEOUT = float(os.environ.get("PRETRIAGE_RESULT_TIMEOUT", 300))
+
+# Large batches are split into shards of at most this many input tokens,
+# pretriaged concurrently by up to PRETRIAGE_CONCURRENCY calls.
+PRETRIAGE_SHARD_TOKENS = int(os.environ.get("PRETRIAGE_SHARD_TOKENS", 6000))
+PRETRIAGE_CONCURRENCY = int(os.environ.get("PRETRIAGE_CONCURRENCY", 4))
+
+shard_executor = ThreadPoolExecutor(max_workers=PRETRIAGE_CONCURRENCY, thread_name_prefix="pretriage-shard")
+
+
+def tag_messages(raw_messages, start=0):
+    """
+    Give every raw message a numeric `ref` so pretriage results can be routed back.
+
+    Args:
+        raw_messages (list): Raw message dicts (or plain strings)
+        start (int): First ref to assign
+
+    Returns:
+        list: Copies of the messages with a `ref` field
+    """
+    tagged = []
+    for i, message in enumerate(raw_messages):
+        if not isinstance(message, dict):
+            message = {"text": str(message)}
+        tagged.append({**message, "ref": start + i})
+    return tagged
+
+
+def route_results(preprocessed_messages, tagged_messages):
+    """
+    Map pretriaged messages back to the ref of the raw message they came from.
+    Falls back to matching on the original text when the model dropped the ref.
+
+    Args:
+        preprocessed_messages (list): Messages returned by pretriage
+        tagged_messages (list): Raw messages sent to pretriage (with `ref`)
+
+    Returns:
+        dict: ref -> pretriaged message
+    """
+    refs_by_text = {}
+    for message in tagged_messages:
+        refs_by_text.setdefault((message.get('text') or '').strip(), message['ref'])
+    valid_refs = set(refs_by_text.values()) | {message['ref'] for message in tagged_messages}
+
+    routed = {}
+    for message in preprocessed_messages:
+        ref = message.pop('ref', None)
+        if ref not in valid_refs:
+            ref = refs_by_text.get((message.get('original_text') or '').strip())
+        if ref is None:
+            print(f"Pretriage result could not be routed: {message.get('original_text')}")
+            continue
+        routed[ref] = message
+    return routed
+
+
+def split_into_shards(tagged_messages, max_tokens=PRETRIAGE_SHARD_TOKENS):
+    """
+    Split tagged messages into consecutive shards that fit a token budget.
+
+    Args:
+        tagged_messages (list): Raw messages with `ref`
+        max_tokens (int): Maximum estimated input tokens per shard
+
+    Returns:
+        list: List of shards (lists of messages)
+    """
+    shards = []
+    current = []
+    current_tokens = 0
+    for message in tagged_messages:
+        tokens = estimate_tokens(json.dumps(message, ensure_ascii=False))
+        if current and current_tokens + tokens > max_tokens:
+            shards.append(current)
+            current = []
+            current_tokens = 0
+        current.append(message)
+        current_tokens += tokens
+    if current:
+        shards.append(current)
+    return shards
+
+
+def pretriage_shard(shard):
+    """
+    Pretriage one shard of tagged messages in a single LLM call.
+
+    Args:
+        shard (list): Raw messages with `ref`
+
+    Returns:
+        dict: ref -> pretriaged message
+    """
+    content = preprocess_msg(shard)
+    if content is None:
+        raise RuntimeError("Preprocessing failed")
+
+    preprocessed = json.loads(content).get('messages', [])
+    return route_results(preprocessed, shard)
+
+
+def cluster_key(message):
+    """Location/category key of a pretriaged message, or None without a location."""
+    location = unicodedata.normalize("NFKD", (message.get('location_hint') or '').casefold())
+    location = re.sub(r"[^a-z0-9]", "", "".join(c for c in location if not unicodedata.combining(c)))
+    if not location:
+        return None
+    return (location, message.get('category_hint'))
+
+
+def harmonize_cluster_ids(messages):
+    """
+    Give messages pretriaged in different shards the same cluster_id when they
+    share a location and category, so analysis groups them into one event.
+
+    Args:
+        messages (list): Pretriaged messages from all shards (modified in place)
+    """
+    canonical_ids = {}
+    for message in messages:
+        cluster_id = re.sub(r"[^a-z0-9]+", "_", str(message.get('cluster_id') or 'general').lower()).strip("_")
+        key = cluster_key(message)
+        if key is not None:
+            cluster_id = canonical_ids.setdefault(key, cluster_id)
+        message['cluster_id'] = cluster_id or 'general'
+
+
+def run_pretriage(raw_messages):
+    """
+    Pretriage a list of raw messages. Batches larger than the shard budget are
+    split and the shards are pretriaged concurrently.
+
+    Args:
+        raw_messages (list): Raw messages
+
+    Returns:
+        list: Pretriaged messages, each with the `ref` of its raw message
+    """
+    shards = split_into_shards(tag_messages(raw_messages))
+    if len(shards) == 1:
+        routed = pretriage_shard(shards[0])
+    else:
+        print(f"Pretriage: {len(raw_messages)} messages in {len(shards)} shards")
+        routed = {}
+        for shard_result in shard_executor.map(pretriage_shard, shards):
+            routed.update(shard_result)
+
+    messages = [{**message, "ref": ref} for ref, message in sorted(routed.items())]
+    if len(shards) > 1:
+        harmonize_cluster_ids(messages)
+    return messages
+
+
+class PretriageBatcher:
+    """
+    Accumulates raw messages from concurrent ingestion jobs and pretriages
+    them together, then hands each job back only its own results.
+    """
+
+    def __init__(self, window_seconds=PRETRIAGE_BATCH_WINDOW, max_messages=PRETRIAGE_BATCH_MAX_MESSAGES):
+        self.window_seconds = window_seconds
+        self.max_messages = max_messages
+        self.pending = []  # (messages, future)
+        self.pending_count = 0
+        self.first_arrival = None
+        self.condition = threading.Condition()
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="pretriage-batch")
+        self.thread = None
+
+    def submit(self, raw_messages):
+        """
+        Queue messages for the next batch.
+
+        Args:
+            raw_messages (list): Raw messages from one job
+
+        Returns:
+            Future: Resolves to {"messages": [...]} for these messages only
+        """
+        future = Future()
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="pretriage-batcher", daemon=True)
+                self.thread.start()
+            if not self.pending:
+                self.first_arrival = time.monotonic()
+            self.pending.append((list(raw_messages), future))
+            self.pending_count += len(raw_messages)
+            self.condition.notify()
+        return future
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                while self.pending_count < self.max_messages:
+                    remaining = self.first_arrival + self.window_seconds - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch = self.pending
+                self.pending = []
+                self.pending_count = 0
+            self.executor.submit(self.flush, batch)
+
+    def flush(self, batch):
+        combined = []
+        owners = []
+        for owner, (messages, _) in enumerate(batch):
+            combined.extend(messages)
+            owners.extend((owner, i) for i in range(len(messages)))
+
+        print(f"Pretriage batch: {len(combined)} messages from {len(batch)} jobs")
+        error = None
+        try:
+            preprocessed = run_pretriage(combined)
+
+            results = [[] for _ in batch]
+            for message in preprocessed:
+                ref = message.get('ref')
+                if not isinstance(ref, int) or not 0 <= ref < len(owners):
+                    print(f"Pretriage batch: dropping message with invalid ref {ref!r}")
+                    continue
+                owner, message['ref'] = owners[ref]
+                results[owner].append(message)
+            for (_, future), messages in zip(batch, results):
+                future.set_result({"messages": messages})
+        except Exception as e:
+            error = e
+        finally:
+            # Never leave a job waiting on a batch that failed
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error or RuntimeError("Pretriage batch did not complete"))
+
+
+batcher = PretriageBatcher()
+
+
+def pretriage(raw_messages):
+    """
+    Pretriage raw messages, sharing the LLM call with other jobs when batching is enabled.
+
+    Args:
+        raw_messages (list): Raw messages
+
+    Returns:
+        dict: {"messages": [...]} pretriage output for these messages, each
+            with the `ref` (index in raw_messages) of the message it came from
+    """
+    if not raw_messages:
+        return {"messages": []}
+
+    if PRETRIAGE_BATCH_WINDOW <= 0:
+        return {"messages": run_pretriage(raw_messages)}
+
+    return batcher.submit(raw_messages).result(timeout=PRETRIAGE_RESULT_TIMEOUT)
@@ -0,0 +1,83 @@
+import hashlib
+import os
+import threading
+
+
+PROMPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts", "system")
+# Re-read prompt files when they change on disk (development only)
+PROMPT_RELOAD = os.environ.get("PROMPT_RELOAD", os.environ.get("FLASK_DEBUG", "0")).lower() in ("1", "true")
+
+prompts = {}  # name -> {"text", "hash", "mtime", "path"}, replaced as a whole, never mutated
+prompts_lock = threading.Lock()
+
+
+def read_prompt_file(path):
+    """
+    Read a prompt file and compute its content hash.
+
+    Args:
+        path (str): Prompt file path
+
+    Returns:
+        dict: Prompt text, short content hash, mtime and path
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    return {
+        "text": text,
+        "hash": hashlib.sha256(text.encode("utf-8")).hexdigest()[:12],
+        "mtime": os.path.getmtime(path),
+        "path": path
+    }
+
+
+def load_prompts():
+    """Load every prompt file under prompts/system/, keyed by file name without extension."""
+    global prompts
+    loaded = {}
+    for filename in sorted(os.listdir(PROMPT_DIR)):
+        name, ext = os.path.splitext(filename)
+        if ext in (".txt", ".md"):
+            loaded[name] = read_prompt_file(os.path.join(PROMPT_DIR, filename))
+
+    with prompts_lock:
+        prompts = loaded
+    print(f"Loaded {len(loaded)} prompts: " + ", ".join(f"{n}@{p['hash']}" for n, p in loaded.items()))
+
+
+def get_prompt_entry(name):
+    """
+    Get a cached prompt, reloading it first if PROMPT_RELOAD is on and the file changed.
+
+    Args:
+        name (str): Prompt name (file name without extension)
+
+    Returns:
+        dict: Prompt text, hash, mtime and path
+
+    Raises:
+        KeyError: If no prompt file has this name
+    """
+    global prompts
+    with prompts_lock:
+        entry = prompts[name]
+    if PROMPT_RELOAD and os.path.getmtime(entry["path"]) != entry["mtime"]:
+        entry = read_prompt_file(entry["path"])
+        with prompts_lock:
+            prompts = {**prompts, name: entry}
+        print(f"Reloaded prompt {name}@{entry['hash']}")
+    return entry
+
+
+# Loaded once at import: requests only read the dict, reloads swap in a new one
+load_prompts()
+
+
+def get_prompt(name):
+    """Get the text of a system prompt."""
+    return get_prompt_entry(name)["text"]
+
+
+def get_prompt_hash(name):
+    """Get the content hash of a system prompt, for logs and cache keys."""
+    return get_prompt_entry(name)["hash"]
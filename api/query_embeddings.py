@@ -0,0 +1,63 @@
+import os
+import threading
+import numpy as np
+from cachetools import LRUCache
+from .llm_gateway import create_embeddings
+from .llm_cache import normalize_content
+from .event_embeddings import EVENT_EMBEDDING_MODEL, EVENT_EMBEDDING_VERSION
+
+
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", 2000))
+
+# (model, version, normalized text) -> embedding. Questions are embedded with the
+# model of the stored event embeddings only: vectors of different models are not
+# comparable (nor always of the same dimension), so no other model is tried.
+lru = LRUCache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)
+lru_lock = threading.Lock()
+
+stats = {"hits": 0, "misses": 0, "failed_calls": 0}
+
+
+def get_query_embedding(query_text):
+    """
+    Embed a user question, from the cache when the same question was embedded before.
+
+    Args:
+        query_text (str): User query text
+
+    Returns:
+        numpy.ndarray: Query embedding vector (read-only) or None
+    """
+    key = (EVENT_EMBEDDING_MODEL, EVENT_EMBEDDING_VERSION, normalize_content(query_text))
+    with lru_lock:
+        cached = lru.get(key)
+    if cached is not None:
+        stats["hits"] += 1
+        return cached
+    stats["misses"] += 1
+
+    try:
+        response = create_embeddings(model=EVENT_EMBEDDING_MODEL, input=query_text)
+    except Exception as e:
+        # The gateway's circuit breaker makes repeated failures fail fast
+        stats["failed_calls"] += 1
+        print(f"Query embedding with {EVENT_EMBEDDING_MODEL} failed: {e}")
+        return None
+
+    embedding = np.asarray(response.data[0].embedding, dtype=np.float32)
+    embedding.flags.writeable = False
+    with lru_lock:
+        lru[key] = embedding
+    return embedding
+
+
+def get_stats():
+    """
+    Get query embedding cache counters and the embedding model.
+
+    Returns:
+        dict: Hits, misses, failed calls, cache size and model
+    """
+    with lru_lock:
+        size = len(lru)
+    return {**stats, "size": size, "model": EVENT_EMBEDDING_MODEL}
@@ -0,0 +1,230 @@
+import os
+import re
+from .dedup import normalize_text
+from .gazetteer import TermMatcher, ZONES, ZONE_ALIASES, gazetteer
+
+
+# Questions parsed with at least this confidence skip the LLM preprocessing call
+QUERY_PARSER_MIN_CONFIDENCE = float(os.environ.get("QUERY_PARSER_MIN_CONFIDENCE", 0.8))
+QUERY_PARSER_ENABLED = os.environ.get("QUERY_PARSER_ENABLED", "true").lower() == "true"
+
+# Terms are folded like message text (case, accents and punctuation ignored).
+# Number after a zone with numbered subzones (Delmas 33, Tabarre 52, Pèlerin 5, Thomassin 32)
+SUBZONE_NUMBER = re.compile(r" (\d{1,3}[a-z]?)\b")
+
+EVENT_TYPE_TERMS = {
+    'barikad': 'roadblock', 'barricade': 'roadblock', 'barricades': 'roadblock', 'blokaj': 'roadblock',
+    'blockage': 'roadblock', 'roadblock': 'roadblock', 'roadblocks': 'roadblock', 'wout bloke': 'roadblock',
+    'tire': 'shooting', 'tir': 'shooting', 'tirs': 'shooting', 'fusillade': 'shooting',
+    'fusillades': 'shooting', 'gunfire': 'shooting', 'shooting': 'shooting', 'shootings': 'shooting',
+    'gunshots': 'shooting', 'coups de feu': 'shooting',
+    'ensekirite': 'insecurity', 'insecurite': 'insecurity', 'insecurity': 'insecurity',
+    'danger': 'insecurity', 'danje': 'insecurity',
+    'kidnapping': 'kidnapping', 'kidnappings': 'kidnapping', 'kidnap': 'kidnapping',
+    'kidnaping': 'kidnapping', 'kidnape': 'kidnapping', 'enlevement': 'kidnapping', 'enlevements': 'kidnapping',
+    'manifestasyon': 'protest', 'manifestation': 'protest', 'manifestations': 'protest',
+    'manif': 'protest', 'protest': 'protest', 'protests': 'protest',
+    'trafik': 'traffic', 'circulation': 'traffic', 'traffic': 'traffic', 'blokis': 'traffic',
+    'embouteillage': 'traffic',
+    'aksidan': 'accident', 'accident': 'accident', 'accidents': 'accident',
+    'move tan': 'weather', 'mauvais temps': 'weather', 'weather': 'weather',
+    'dife': 'fire', 'feu': 'fire', 'fire': 'fire', 'fires': 'fire', 'incendie': 'fire',
+}
+
+SEVERITY_TERMS = {
+    'kritik': 'critical', 'critique': 'critical', 'critiques': 'critical', 'critical': 'critical',
+    'urgent': 'critical', 'urgents': 'critical', 'ijan': 'critical',
+    'wo': 'high', 'eleve': 'high', 'high': 'high', 'serious': 'high', 'serye': 'high', 'grave': 'high',
+    'mwayen': 'medium', 'moyen': 'medium', 'medium': 'medium',
+    'faible': 'low', 'low': 'low', 'minor': 'low',
+}
+
+TIME_TERMS = {
+    'jodi a': 'today', 'jodia': 'today', 'jodi': 'today', 'kounye a': 'today', 'kounya': 'today',
+    'now': 'today', 'right now': 'today', 'today': 'today', 'aujourd hui': 'today', 'tonight': 'today',
+    'ce soir': 'today', 'aswe a': 'today', 'maten an': 'today', 'ce matin': 'today', 'this morning': 'today',
+    'yer': 'yesterday', 'yeswa': 'yesterday', 'hier': 'yesterday', 'hier soir': 'yesterday',
+    'yesterday': 'yesterday', 'last night': 'yesterday',
+    'denye 24 edtan': 'last_24h', '24 edtan': 'last_24h', 'dernieres 24 heures': 'last_24h',
+    '24 heures': 'last_24h', 'last 24 hours': 'last_24h', '24 hours': 'last_24h', '24h': 'last_24h',
+    'semen pase a': 'last_week', 'semen pase': 'last_week', 'semaine passee': 'last_week',
+    'semaine derniere': 'last_week', 'last week': 'last_week', 'this week': 'last_week',
+    'semen sa a': 'last_week', 'cette semaine': 'last_week',
+}
+
+# Safety / situation questions: general query over the last 24h
+SITUATION_TERMS = dict.fromkeys(gazetteer['topics'].get('situation', []), 'situation')
+
+# Words that carry no query parameter (question words, pronouns, articles, generic nouns)
+FILLER_WORDS = {
+    # Creole
+    'eske', 'esk', 'es', 'gen', 'genyen', 'ki', 'kisa', 'kisak', 'sak', 'sa', 'kote', 'koman', 'kijan',
+    'ye', 'la', 'a', 'an', 'yo', 'nan', 'ak', 'pou', 'sou', 'se', 'li', 'm', 'mwen', 'mw', 'nou', 'ou',
+    'w', 'te', 'ap', 'pral', 'pa', 'k', 'kap', 'ka', 'fe', 'fin', 'deja', 'konn', 'tout', 'bagay',
+    'nouvel', 'enfomasyon', 'pase', 'zon', 'bo', 'bay', 'rapo', 'anko', 'toujou', 'laria', 'lari',
+    'sitiyasyon', 'evenman', 'okipe', 'kounye', 'gade', 'di', 'soti', 'ale', 'al', 'vin', 'gin', 'genle',
+    'gendwa', 'sekirite', 'anyen', 'janm', 'mache', 'wout', 'on', 'yon',
+    # French
+    'le', 'les', 'de', 'des', 'du', 'un', 'une', 'et', 'est', 'ce', 'c', 'qu', 'que', 'qui', 'quoi',
+    'quel', 'quelle', 'quels', 'quelles', 'il', 'y', 'en', 'au', 'aux', 'dans', 'sur', 'pour', 'avec',
+    'par', 'pas', 'ont', 'se', 'passe', 'quelque', 'chose', 'situation', 'zone', 'nouvelles', 't',
+    'comment', 'ou', 'je', 'peux', 'sortir', 'evenements', 'evenement', 'incidents', 'incident',
+    'signale', 'signales', 'securite', 'dangereux', 'niveau',
+    # English
+    'the', 'is', 'are', 'any', 'anything', 'in', 'at', 'of', 'what', 'whats', 's', 'there', 'was',
+    'were', 'to', 'and', 'or', 'for', 'near', 'around', 'happening', 'happened', 'going', 'how', 'it',
+    'can', 'i', 'go', 'out', 'should', 'safe', 'area', 'news', 'update', 'updates', 'events', 'event',
+    'report', 'reports', 'reported', 'latest', 'recent', 'severity', 'level', 'status', 'me', 'do',
+    'you', 'have', 'has', 'been', 'some', 'right', 'dangerous', 'alerts', 'alert',
+}
+
+# Words that mark a language, for questions that extract nothing else
+LANGUAGE_MARKERS = {
+    'ht': {'eske', 'esk', 'gen', 'genyen', 'ki', 'kisa', 'kisak', 'sak', 'nan', 'ak', 'mwen', 'kijan',
+           'koman', 'ye', 'laria', 'jodi', 'jodia', 'kounye', 'yo', 'ka', 'soti', 'pase', 'kap', 'ap',
+           'pral', 'sitiyasyon', 'yer', 'sekirite', 'bo', 'lari', 'zon', 'gin', 'genle', 'barikad', 'tire',
+           'dife', 'aksidan', 'manifestasyon', 'trafik', 'ensekirite', 'kidnape', 'blokaj', 'kafou', 'kritik'},
+    'fr': {'est', 'ce', 'qu', 'que', 'qui', 'quoi', 'quel', 'quelle', 'il', 'y', 'des', 'les', 'dans',
+           'aujourd', 'hui', 'hier', 'passe', 'comment', 'je', 'peux', 'sortir', 'une', 'du', 'situation',
+           'securite', 'dangereux', 'semaine', 'heures', 'fusillade', 'enlevement', 'incendie',
+           'embouteillage', 'evenements', 'critique', 'urgents'},
+    'en': {'is', 'are', 'any', 'what', 'whats', 'the', 'there', 'how', 'can', 'i', 'today', 'yesterday',
+           'happening', 'happened', 'in', 'near', 'safe', 'going', 'out', 'week', 'hours', 'last', 'now',
+           'events', 'event', 'news', 'update', 'updates', 'shootings', 'roadblocks', 'critical'},
+}
+
+# Zones come from the gazetteer: a hierarchical zone alone is a general location
+TERM_KINDS = {alias: ('parent_zone' if ZONES[name]['hierarchical'] else 'location', name)
+              for alias, name in ZONE_ALIASES.items()}
+for kind, terms in (('event_type', EVENT_TYPE_TERMS), ('severity', SEVERITY_TERMS),
+                    ('time_range', TIME_TERMS), ('situation', SITUATION_TERMS)):
+    for term, value in terms.items():
+        TERM_KINDS[term] = (kind, value)
+# "carrefour feuilles" wins over "carrefour"
+TERM_MATCHER = TermMatcher(TERM_KINDS)
+
+stats = {"parsed": 0, "local": 0, "fallback": 0}
+
+
+def detect_language(words):
+    """Language with the most marker words (Creole on ties), or None if no word marks one."""
+    counts = {language: len(words & markers) for language, markers in LANGUAGE_MARKERS.items()}
+    best = max(counts.values())
+    if not best:
+        return None
+    if counts['ht'] == best:
+        return 'ht'
+    return 'fr' if counts['fr'] == best else 'en'
+
+
+def parse_query(message):
+    """
+    Extract chat query parameters locally with the zone gazetteer and keyword grammar.
+
+    Args:
+        message (str): User's question
+
+    Returns:
+        tuple: (query_params with the same fields as preprocess_chat_prompt, confidence 0-1).
+            Confidence is the share of content words explained by a known term, lowered
+            when the question is ambiguous (several locations, severities or time ranges).
+    """
+    text = normalize_text(message or '')
+    stats["parsed"] += 1
+
+    locations = []
+    spans = []
+    found = {"event_type": [], "severity": [], "time_range": [], "situation": []}
+    for start, end, term in TERM_MATCHER.find(text):
+        if spans and start < spans[-1][1]:
+            # Inside the number of a subzone
+            continue
+        kind, value = TERM_KINDS[term]
+        if kind in ('location', 'parent_zone'):
+            subzone = SUBZONE_NUMBER.match(text, end) if ZONES[value]['numbered'] else None
+            if subzone:
+                locations.append((f"{value} {subzone.group(1).upper()}", False))
+                end = subzone.end()
+            else:
+                locations.append((value, kind == 'parent_zone'))
+        else:
+            found[kind].append(value)
+        spans.append((start, end))
+
+    # Words outside matched terms must all be known filler for the parse to be trusted
+    leftover = text
+    for start, end in sorted(spans, reverse=True):
+        leftover = leftover[:start] + " " + leftover[end:]
+    content_words = [w for w in leftover.split() if w not in FILLER_WORDS]
+    total_words = len(content_words) + len(spans)
+    confidence = len(spans) / total_words if total_words else 1.0
+
+    distinct_locations = list(dict.fromkeys(locations))
+    severities = list(dict.fromkeys(found['severity']))
+    time_ranges = list(dict.fromkeys(found['time_range']))
+    language = detect_language(set(text.split()))
+    if len(distinct_locations) > 1 or len(severities) > 1 or len(time_ranges) > 1 or language is None:
+        confidence = min(confidence, 0.5)
+
+    location, location_is_general = distinct_locations[0] if distinct_locations else (None, False)
+    event_types = list(dict.fromkeys(found['event_type']))
+    severity = severities[0] if severities else None
+    time_range = time_ranges[0] if time_ranges else 'any'
+
+    filters = [name for name, value in (
+        ('location', location), ('event_type', event_types), ('severity', severity),
+        ('time_range', time_ranges)
+    ) if value]
+    if found['situation']:
+        # Safety questions always look at the last 24h
+        time_range = 'last_24h'
+        filters = [name for name in filters if name != 'time_range']
+        query_type = 'combined' if len(filters) > 1 else 'general'
+    elif not filters:
+        query_type = 'general'
+    else:
+        query_type = filters[0] if len(filters) == 1 else 'combined'
+
+    query_params = {
+        'query_type': query_type,
+        'location': location,
+        'location_is_general': location_is_general,
+        'event_types': event_types,
+        'severity': severity,
+        'time_range': time_range,
+        'language': language or 'ht',
+        'original_question': message
+    }
+    return query_params, round(confidence, 3)
+
+
+def parse_query_locally(message):
+    """
+    Parse a chat question locally if the parse is confident enough.
+
+    Args:
+        message (str): User's question
+
+    Returns:
+        dict: Query parameters, or None when the LLM preprocessing should be used
+    """
+    if not QUERY_PARSER_ENABLED:
+        return None
+    query_params, confidence = parse_query(message)
+    if confidence < QUERY_PARSER_MIN_CONFIDENCE:
+        stats["fallback"] += 1
+        print(f"Local query parse not confident ({confidence}), using LLM preprocessing")
+        return None
+    stats["local"] += 1
+    print(f"Parsed query locally (confidence {confidence}): {query_params}")
+    return query_params
+
+
+def get_stats():
+    """
+    Get local query parser counters.
+
+    Returns:
+        dict: Questions parsed, answered locally and sent to the LLM, and the threshold
+    """
+    return {**stats, "enabled": QUERY_PARSER_ENABLED, "min_confidence": QUERY_PARSER_MIN_CONFIDENCE}
@@ -2,49 +2,43 @@ import json
 import os
 import numpy as np
 from flask import abort
-from openai import OpenAI
 from pydantic.types import T
 from .utils import strip_markdown_fences
+from .prompt_registry import get_prompt, get_prompt_hash
+from .llm_cache import cached_completion, cached_stream
+from .context_packer import pack_events_context
+from .vector_index import search_events as search_vector_events
+from .keyword_index import search_events as search_keyword_events, rank_events, reciprocal_rank_fusion
+from .query_embeddings import get_query_embedding
+from .query_parser import parse_query_locally
+from .gazetteer import find_zones, find_topics, get_numbered_zones, get_lookalike_zones
+from .speculation import start_speculative_retrieval
+from .event_embeddings import (
+    embed_events, get_stored_embedding, EVENT_EMBEDDING_MODEL
+)
+from .model_router import MODELS
 from .db.models import *
 from datetime import datetime, UTC, timedelta                   
 
 
 
-GROK_TOKEN = os.environ.get("GROK_TOKEN")
-if not GROK_TOKEN:
-    raise RuntimeError(
-        "Missing GROK_API_KEY or XAI_API_KEY environment variable.\n"
-        "Get your API key from https://console.x.ai/\n"
-        "Then set it: export GROK_API_KEY='your-api-key-here'"
-    )
-
-# Grok AI uses OpenAI-compatible API
-client = OpenAI(
-    base_url="https://api.x.ai/v1",
-    api_key=GROK_TOKEN,
-)
-
-
-model_list = ['grok-4-1-fast-reasoning', 'grok-4-fast-reasoning']  # [analysis_model, preprocessing_model] 
-
-def load_prompt(path):
-    with open(path, "r", encoding="utf-8") as f:
-        return f.read()
+model_list = MODELS  # [analysis_model, preprocessing_model], preferred models of the router
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DEEP_SYSTEM_PROMPT = os.path.join(BASE_DIR, "prompts/system/deepseek_pretriage.txt")
-GPT_SYSTEM_PROMPT = os.path.join(BASE_DIR, "prompts/system/gpt_analysis.txt")
-DEEPSEEK_CHAT_SYSTEM_PROMPT = os.path.join(BASE_DIR, "prompts/system/deepseek_for_chat.txt")
-GPT_CHAT_SYSTEM_PROMPT = os.path.join(BASE_DIR, "prompts/system/gpt_for_chat.txt")
-# USER_PROMPT   = load_prompt("prompts/user/chatbot_query.md")
+# System prompt names in the prompt registry (files under prompts/system/)
+DEEP_SYSTEM_PROMPT = "deepseek_pretriage"
+GPT_SYSTEM_PROMPT = "gpt_analysis"
+DEEPSEEK_CHAT_SYSTEM_PROMPT = "deepseek_for_chat"
+GPT_CHAT_SYSTEM_PROMPT = "gpt_for_chat"
 
 
-def preprocess_chat_prompt(message):
+def preprocess_chat_prompt(message, parse_locally=True):
     """
     Preprocess user message to extract query parameters.
+    Clear questions are parsed locally; Grok only handles the others.
     
     Args:
         message (str): User's question/prompt
+        parse_locally (bool): Try the local parser before Grok
     
     Returns:
         dict: Extracted query parameters including:
@@ -57,12 +51,17 @@ def preprocess_chat_prompt(message):
             - language: Detected language (ht, fr, en)
             - original_question: Original user question
     """
+    query_params = parse_query_locally(message) if parse_locally else None
+    if query_params is not None:
+        return query_params
+    
     try:
-        system_prompt = load_prompt(DEEPSEEK_CHAT_SYSTEM_PROMPT)
+        system_prompt = get_prompt(DEEPSEEK_CHAT_SYSTEM_PROMPT)
         user_prompt = f"User question: {message}"
-        print(f"Preprocessing User prompt: {user_prompt}")
+        print(f"Preprocessing User prompt ({DEEPSEEK_CHAT_SYSTEM_PROMPT}@{get_prompt_hash(DEEPSEEK_CHAT_SYSTEM_PROMPT)}): {user_prompt}")
         
-        completion = client.chat.completions.create(
+        content = cached_completion(
+            "preprocess_chat",
             response_format={"type": "json_object"},
             model=model_list[1], 
             messages=[
@@ -71,7 +70,7 @@ def preprocess_chat_prompt(message):
             ]
         )
         
-        preprocessed_msg = strip_markdown_fences(completion.choices[0].message.content)
+        preprocessed_msg = strip_markdown_fences(content)
         print(f"Preprocessed message: {preprocessed_msg}")
         
         query_params = json.loads(preprocessed_msg)
@@ -103,112 +102,26 @@ def preprocess_chat_prompt(message):
         }
 
 
-def format_events_for_rag(events):
+def format_events_for_rag(events, query_params=None, question=''):
     """
-    Format events list into readable RAG context string.
+    Format events list into a token-budgeted RAG context string.
     
     Args:
         events (list): List of event dictionaries
+        query_params (dict): Query parameters used to rank events
+        question (str): Original user question used to rank events
     
     Returns:
         str: Formatted events string or "NO_EVENTS"
     """
-    if not events or len(events) == 0:
-        return "NO_EVENTS"
-    
-    formatted_events = []
-    for e in events:
-        event_str = f"- [{e.get('timestamp_start', 'Unknown time')}] {e.get('summary', 'No summary')} "
-        event_str += f"(Type: {e.get('event_type', 'unknown')}, "
-        event_str += f"Severity: {e.get('severity', 'unknown')}, "
-        event_str += f"Location: {e.get('location', 'unknown')}"
-        
-        if e.get('sources'):
-            event_str += f", Sources: {e.get('sources')}"
-        
-        if e.get('recommended_action'):
-            event_str += f", Action: {e.get('recommended_action')}"
-        
-        event_str += ")"
-        formatted_events.append(event_str)
-    
-    return "\n".join(formatted_events)
-
-
-def create_event_searchable_text(event):
-    """
-    Create a searchable text representation of an event for embedding.
-    
-    Args:
-        event (dict): Event dictionary
-    
-    Returns:
-        str: Searchable text combining summary, location, event_type, etc.
-    """
-    parts = []
-    
-    # Add summary (most important)
-    if event.get('summary'):
-        parts.append(event['summary'])
-    
-    # Add event type
-    if event.get('event_type'):
-        parts.append(f"Event type: {event['event_type']}")
-    
-    # Add location
-    if event.get('location'):
-        parts.append(f"Location: {event['location']}")
-    
-    # Add severity if high/critical
-    if event.get('severity') in ['critical', 'high']:
-        parts.append(f"Severity: {event['severity']}")
-    
-    # Add recommended action if available
-    if event.get('recommended_action'):
-        parts.append(event['recommended_action'])
-    
-    return " ".join(parts)
-
-
-def get_query_embedding_grok(query_text):
-    """
-    Generate embedding for user query using Grok AI embeddings API.
-    
-    Args:
-        query_text (str): User query text
-    
-    Returns:
-        numpy.ndarray: Query embedding vector or None
-    """
-    try:
-        # Try different Grok embedding models
-        # Note: Grok may use different model names for embeddings
-        embedding_models = ["grok-2-1212", "grok-2", "grok-beta"]
-        
-        for model_name in embedding_models:
-            try:
-                response = client.embeddings.create(
-                    model=model_name,
-                    input=query_text
-                )
-                
-                embedding = np.array(response.data[0].embedding)
-                print(f"Successfully generated embedding using {model_name}")
-                return embedding
-            except Exception as model_error:
-                print(f"Model {model_name} failed: {model_error}, trying next...")
-                continue
-        
-        print("All Grok embedding models failed")
-        return None
-    except Exception as e:
-        print(f"Error generating query embedding with Grok: {e}")
-        return None
+    context, _ = pack_events_context(events, query_params, question)
+    return context
 
 
 def get_event_embeddings_grok(events):
     """
-    Generate embeddings for a list of events using Grok AI.
+    Get embeddings for a list of events: the embedding stored at ingestion time
+    when it is current, otherwise one computed now with Grok AI.
     
     Args:
         events (list): List of event dictionaries
@@ -219,38 +132,27 @@ def get_event_embeddings_grok(events):
     if not events:
         return {}
     
-    try:
-        # Create searchable texts
-        searchable_texts = [create_event_searchable_text(e) for e in events]
-        
-        # Try different Grok embedding models
-        embedding_models = ["grok-code-fast-1"]
-        
-        for model_name in embedding_models:
-            try:
-                # Batch embed using Grok API
-                response = client.embeddings.create(
-                    model=model_name,
-                    input=searchable_texts
-                )
-                
-                event_embeddings = {}
-                for i, embedding_data in enumerate(response.data):
-                    if i < len(events):
-                        event_embeddings[i] = np.array(embedding_data.embedding)
-                
-                print(f"Successfully generated {len(event_embeddings)} embeddings using {model_name}")
-                return event_embeddings
-            except Exception as model_error:
-                print(f"Model {model_name} failed: {model_error}, trying next...")
-                continue
-        
-        print("All Grok embedding models failed")
-        return {}
-        
-    except Exception as e:
-        print(f"Error generating event embeddings with Grok: {e}")
-        return {}
+    event_embeddings = {}
+    missing = []
+    for i, event in enumerate(events):
+        embedding = get_stored_embedding(event)
+        if embedding is not None:
+            event_embeddings[i] = embedding
+        else:
+            missing.append(i)
+    
+    if missing:
+        try:
+            # Events saved before embeddings existed (or while embedding failed) until the backfill ran
+            embeddings = embed_events([events[i] for i in missing])
+            for i, embedding in zip(missing, embeddings):
+                event_embeddings[i] = embedding
+            print(f"Embedded {len(embeddings)} events without a stored embedding using {EVENT_EMBEDDING_MODEL}")
+        except Exception as e:
+            print(f"Error generating event embeddings with Grok: {e}")
+    
+    print(f"Event embeddings: {len(events) - len(missing)} stored, {len(missing)} computed")
+    return event_embeddings
 
 
 def cosine_similarity(vec1, vec2):
@@ -269,7 +171,7 @@ def cosine_similarity(vec1, vec2):
         return 0.0
 
 
-def vector_search_events_grok(query_text, events, top_k=10):
+def vector_search_events_grok(query_text, events, top_k=10, query_embedding=None):
     """
     Perform vector search using Grok embeddings to find most relevant events.
     
@@ -277,6 +179,7 @@ def vector_search_events_grok(query_text, events, top_k=10):
         query_text (str): User query
         events (list): List of candidate events
         top_k (int): Number of top results to return
+        query_embedding (numpy.ndarray): Query embedding if already computed
     
     Returns:
         list: Top K most relevant events sorted by relevance
@@ -286,15 +189,19 @@ def vector_search_events_grok(query_text, events, top_k=10):
     
     try:
         # Generate query embedding
-        query_embedding = get_query_embedding_grok(query_text)
+        if query_embedding is None:
+            query_embedding = get_query_embedding(query_text)
         if query_embedding is None:
             print("Query embedding failed, returning recent events")
             return events[:top_k] if len(events) > top_k else events
         
-        # Generate event embeddings
-        event_embeddings = get_event_embeddings_grok(events)
+        # Generate event embeddings, keeping only those comparable with the query
+        event_embeddings = {
+            i: embedding for i, embedding in get_event_embeddings_grok(events).items()
+            if embedding.shape == query_embedding.shape
+        }
         if not event_embeddings:
-            print("Event embedding failed, returning recent events")
+            print("No event embedding comparable with the query embedding, returning recent events")
             return events[:top_k] if len(events) > top_k else events
         
         # Calculate similarities
@@ -319,14 +226,54 @@ def vector_search_events_grok(query_text, events, top_k=10):
         return events[:top_k] if len(events) > top_k else events
 
 
-def get_events_with_vector_search(query_params, original_question):
+def search_hot_window(query_embedding, keyword_query, query_params, time_range, top_k):
+    """
+    Search the in-memory indexes of recent events: vector similarity and BM25
+    keyword scores, fused by reciprocal rank. Without a query embedding, or
+    when the vector index has no hits (empty, disabled, other dimension), the
+    keyword index answers alone.
+    
+    Args:
+        query_embedding (numpy.ndarray): Query embedding, or None if embedding failed
+        keyword_query (str): Query text for keyword search
+        query_params (dict): Query parameters (event_types, severity)
+        time_range (str): Time range of the query
+        top_k (int): Number of results
+    
+    Returns:
+        list: Matching events most relevant first, or None if the indexes cannot answer
+    """
+    params = {**query_params, 'since': get_time_cutoff(time_range)}
+    rankings = []
+    vector_hits = search_vector_events(query_embedding, params, top_k=top_k) if query_embedding is not None else None
+    if vector_hits:
+        rankings.append([event_id for event_id, _ in vector_hits])
+    
+    keyword_hits = search_keyword_events(keyword_query, params, top_k=top_k)
+    if keyword_hits:
+        rankings.append([event_id for event_id, _ in keyword_hits])
+    if not rankings:
+        return None
+    
+    event_ids = reciprocal_rank_fusion(rankings)[:top_k]
+    events = {e['_id']: e for e in get_events_by_ids(event_ids, include_embeddings=False)}
+    print(f"Hot window search: Found {len(events)} most relevant events "
+          f"({len(vector_hits or [])} vector, {len(keyword_hits or [])} keyword hits)")
+    return [
+        {k: v for k, v in events[event_id].items() if k != '_id'}
+        for event_id in event_ids if event_id in events
+    ]
+
+
+def get_events_with_vector_search(query_params, original_question, speculation=None):
     """
-    Get events using Grok vector search when no location is specified.
+    Get events using hybrid search (Grok embeddings + BM25 keywords) when no location is specified.
     This prevents loading all events and instead finds semantically relevant ones.
     
     Args:
         query_params (dict): Query parameters
         original_question (str): Original user question for semantic search
+        speculation (SpeculativeRetrieval): Retrieval started during preprocessing, if any
     
     Returns:
         list: Most relevant events
@@ -341,15 +288,6 @@ def get_events_with_vector_search(query_params, original_question):
         candidate_params['time_range'] = 'last_24h'
         print("No time range specified for general query - defaulting to last_24h")
     
-    # Get candidate events (limited by time and other filters)
-    candidate_events = get_events_for_chat(candidate_params)
-    
-    if not candidate_events:
-        print("No candidate events found for vector search")
-        return []
-    
-    print(f"Found {len(candidate_events)} candidate events for Grok vector search")
-    
     # Build enhanced search query from original question and extracted filters
     # This helps the vector search understand the user's intent better
     search_query = original_question
@@ -357,14 +295,52 @@ def get_events_with_vector_search(query_params, original_question):
     # Enhance search query with extracted filters for better semantic matching
     if query_params.get('event_types'):
         search_query += " " + " ".join(query_params['event_types'])
+    # Keyword search matches words literally: leave out the severity wording
+    keyword_query = search_query
     if query_params.get('severity'):
         search_query += " " + query_params['severity'] + " severity urgent"
     
-    # Perform vector search using Grok embeddings to get top relevant events
+    # A speculative embedding is of the raw question: the filters still apply as hard filters
+    query_embedding = speculation.query_embedding() if speculation else get_query_embedding(search_query)
+    
+    # Recent events: filter and rank in memory, without loading candidates from Mongo
+    try:
+        top_events = search_hot_window(
+            query_embedding, keyword_query, candidate_params, candidate_params.get('time_range', 'any'), top_k=15
+        )
+        if top_events:
+            return top_events
+    except Exception as e:
+        print(f"Hot window search failed: {e}, using stored candidates")
+    
+    # Get candidate events (limited by time and other filters)
+    candidate_events = speculation.candidates(candidate_params, include_embeddings=True) if speculation else None
+    if candidate_events is None:
+        candidate_events = get_events_for_chat(candidate_params, include_embeddings=True)
+    
+    if not candidate_events:
+        print("No candidate events found for vector search")
+        return []
+    
+    print(f"Found {len(candidate_events)} candidate events for hybrid search")
+    keyword_ranking = rank_events(keyword_query, candidate_events)
+    
+    if query_embedding is None:
+        # Keyword matches first, then the most recent events
+        print(f"Query embedding failed, ranking by keywords ({len(keyword_ranking)} matches)")
+        matched = set(keyword_ranking)
+        ranking = keyword_ranking + [i for i in range(len(candidate_events)) if i not in matched]
+        return [candidate_events[i] for i in ranking[:15]]
+    
+    # Perform vector search using Grok embeddings, fused with the keyword ranking
     # Limit to top 15 most relevant to keep response focused
     try:
-        top_events = vector_search_events_grok(search_query, candidate_events, top_k=15)
-        return top_events
+        vector_ranked = vector_search_events_grok(
+            search_query, candidate_events, top_k=len(candidate_events), query_embedding=query_embedding
+        )
+        positions = {id(event): i for i, event in enumerate(candidate_events)}
+        vector_ranking = [positions[id(event)] for event in vector_ranked]
+        return [candidate_events[i] for i in reciprocal_rank_fusion([vector_ranking, keyword_ranking])[:15]]
     except Exception as e:
         print(f"Grok vector search failed: {e}, falling back to recent events")
         # Fallback: return most recent events if vector search fails
@@ -392,24 +368,11 @@ def is_patrolx_related(query_params, original_question):
     if query_type in ['location', 'event_type', 'severity', 'combined']:
         return True
     
-    # Check if question contains Patrol-X related keywords
-    question_lower = original_question.lower()
-    patrolx_keywords = [
-        # Locations (Haitian zones)
-        'delmas', 'pétion-ville', 'petionville', 'tabarre', 'cité soleil', 'site solèy',
-        'carrefour', 'martissant', 'croix-des-bouquets', 'pèlerin', 'thomassin',
-        'canapé-vert', 'laboule', 'kenscoff', 'bel-air', 'la saline', 'fontamara',
-        # Event types
-        'barikad', 'barricade', 'tire', 'shooting', 'kidnapping', 'enlèvement',
-        'manifestation', 'protest', 'accident', 'aksidan', 'roadblock', 'blokaj',
-        # Security/events related
-        'kisa k ap pase', 'what happened', 'quoi de neuf', 'événement', 'event',
-        'sécurité', 'security', 'danger', 'dangerous', 'insecurity', 'ensekirite',
-        'situation', 'alert', 'alerte', 'crisis', 'crise'
-    ]
+    # Check if question mentions a zone or Patrol-X related keywords (gazetteer)
+    topics = find_topics(original_question)
     
-    # If question contains any Patrol-X keywords, it's related
-    if any(keyword in question_lower for keyword in patrolx_keywords):
+    # If question contains any Patrol-X or situation keywords, it's related
+    if 'patrolx' in topics or 'situation' in topics or find_zones(original_question):
         return True
     
     # If user explicitly asks about location, events, or security, it's related
@@ -419,14 +382,9 @@ def is_patrolx_related(query_params, original_question):
     # If query type is general but contains location/event hints, check more carefully
     if query_type == 'general':
         # Very general questions like "what's the weather" or "tell me a joke" are not Patrol-X related
-        general_questions = [
-            'weather', 'météo', 'tan', 'joke', 'blague', 'joke', 'funny',
-            'recipe', 'recette', 'cooking', 'cuisine', 'how to', 'comment faire',
-            'what is', 'qu\'est-ce que', 'kisa se', 'definition', 'définition'
-        ]
-        if any(gq in question_lower for gq in general_questions):
+        if 'general_question' in topics:
             # Check if it's also about Haiti/Patrol-X context
-            if not any(pk in question_lower for pk in ['haiti', 'haitian', 'ayiti', 'haitien']):
+            if 'haiti' not in topics:
                 return False
     
     # Default: if we extracted any Patrol-X parameters, assume it's related
@@ -434,6 +392,44 @@ def is_patrolx_related(query_params, original_question):
     return has_location or has_event_types or has_severity
 
 
+def get_chat_error_message(language):
+    """
+    Get the chat error message in the user's language.
+
+    Args:
+        language (str): Detected language (ht, fr, en)
+
+    Returns:
+        str: Error message
+    """
+    if language == 'ht':
+        return "Désolé, mwen pa ka reponn kèksyon ou a kounye a. Tanpri eseye ankò."
+    elif language == 'fr':
+        return "Désolé, je n'ai pas pu traiter votre question. Veuillez réessayer."
+    else:
+        return "Sorry, I couldn't process your question. Please try again."
+
+
+def build_general_question_messages(original_question, language='ht'):
+    """
+    Build the chat messages answering a general question from Grok's knowledge.
+
+    Args:
+        original_question (str): User's question
+        language (str): Detected language (ht, fr, en)
+
+    Returns:
+        list: Chat messages
+    """
+    system_prompt = f"""You are a helpful AI assistant. Answer the user's question clearly and accurately using your knowledge.
+        
+Respond in {language} language if the question is in that language, otherwise respond in the same language as the question."""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": original_question}
+    ]
+
+
 def answer_general_question(original_question, language='ht'):
     """
     Answer general questions using Grok's knowledge (not Patrol-X related).
@@ -447,40 +443,98 @@ def answer_general_question(original_question, language='ht'):
     """
     try:
         # Use Grok directly for general knowledge questions
-        system_prompt = f"""You are a helpful AI assistant. Answer the user's question clearly and accurately using your knowledge.
-        
-Respond in {language} language if the question is in that language, otherwise respond in the same language as the question."""
-        
-        completion = client.chat.completions.create(
+        answer = cached_completion(
+            "general_question",
             model=model_list[0],  # grok-4-1-fast-reasoning for general knowledge
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": original_question}
-            ]
+            messages=build_general_question_messages(original_question, language)
         )
-        
-        answer = completion.choices[0].message.content
         print(f"Answered general question using Grok knowledge")
         return answer
         
     except Exception as e:
         print(f"Error answering general question: {e}")
-        lang = language
-        if lang == 'ht':
-            return "Désolé, mwen pa ka reponn kèksyon ou a kounye a. Tanpri eseye ankò."
-        elif lang == 'fr':
-            return "Désolé, je n'ai pas pu traiter votre question. Veuillez réessayer."
-        else:
-            return "Sorry, I couldn't process your question. Please try again."
+        return get_chat_error_message(language)
 
 
-def analyse_chat_prompt(preprocessed_message):
+def build_event_chat_messages(preprocessed_message, speculation=None):
+    """
+    Retrieve the events matching a Patrol-X question and build the chat messages answering it.
+
+    Args:
+        preprocessed_message (dict): Query parameters from preprocessing
+        speculation (SpeculativeRetrieval): Retrieval started during preprocessing, if any
+
+    Returns:
+        tuple: (chat messages, retrieved events)
+    """
+    original_question = preprocessed_message.get('original_question', '')
+    system_prompt = get_prompt(GPT_CHAT_SYSTEM_PROMPT)
+    
+    # Determine if we should use vector search (no location specified)
+    location = preprocessed_message.get('location')
+    query_type = preprocessed_message.get('query_type', 'general')
+    
+    # For general situation questions, ensure we use last_24h events
+    if query_type == 'general':
+        # Check if it's a general situation question (safety, can I go out, etc.)
+        is_situation_question = 'situation' in find_topics(original_question)
+        
+        if is_situation_question:
+            # Force last_24h for situation questions
+            preprocessed_message['time_range'] = 'last_24h'
+            print("General situation question detected - using last_24h events")
+    
+    if not location or not location.strip():
+        # No location: use Grok vector search to find semantically relevant events
+        print("No location specified - using Grok vector search")
+        events = get_events_with_vector_search(preprocessed_message, original_question, speculation)
+    else:
+        # Location specified: use traditional filtered query
+        print("Location specified - using filtered query")
+        events = speculation.candidates(preprocessed_message) if speculation else None
+        if events is None:
+            events = get_events_for_chat(preprocessed_message)
+    
+    events_context = format_events_for_rag(events, preprocessed_message, original_question)
+    # Compact parameters: empty values dropped, no indentation
+    query_params = {k: v for k, v in preprocessed_message.items() if v not in (None, '', [], {})}
+    
+    # Build user prompt with context
+    user_prompt = f"""
+                User question context (extracted parameters):
+                {json.dumps(query_params, ensure_ascii=False, separators=(',', ':'))}
+
+                Database events (RAG context):
+                {events_context}
+
+                Original user question: "{preprocessed_message.get('original_question', '')}"
+
+                Today's date: {datetime.now(UTC).strftime("%Y-%m-%d")}
+
+                Respond in {preprocessed_message.get('language', 'ht')} language.
+                """
+    
+    print(f"Query type: {preprocessed_message.get('query_type')}")
+    print(f"Events found: {len(events)}")
+    print(f"Answering with {GPT_CHAT_SYSTEM_PROMPT}@{get_prompt_hash(GPT_CHAT_SYSTEM_PROMPT)}")
+
+    # The system prompt is kept byte-identical across calls so provider-side
+    # prompt caching can reuse it; per-request data goes in the user message.
+    messages = [
+        {"role": "system", "content": system_prompt}, 
+        {"role": "user", "content": user_prompt}
+    ]
+    return messages, events
+
+
+def analyse_chat_prompt(preprocessed_message, speculation=None):
     """
     Analyze user query and generate response using Grok.
     Routes to Patrol-X event search or general knowledge based on question type.
     
     Args:
         preprocessed_message (dict): Query parameters from preprocessing
+        speculation (SpeculativeRetrieval): Retrieval started during preprocessing, if any
     
     Returns:
         str: Generated response in the detected language
@@ -499,73 +553,37 @@ def analyse_chat_prompt(preprocessed_message):
         
         # Patrol-X related: use event-based search
         print("Question is Patrol-X related - using event search")
-        system_prompt = load_prompt(GPT_CHAT_SYSTEM_PROMPT)
-        
-        # Determine if we should use vector search (no location specified)
-        location = preprocessed_message.get('location')
-        query_type = preprocessed_message.get('query_type', 'general')
-        
-        # For general situation questions, ensure we use last_24h events
-        if query_type == 'general':
-            # Check if it's a general situation question (safety, can I go out, etc.)
-            situation_keywords = ['koman laria', 'eske m ka soti', 'how is the area', 'can i go out', 
-                                 'is it safe', 'kijan sitiyasyon', 'eske li an sekirite', 'should i go out']
-            question_lower = original_question.lower()
-            is_situation_question = any(keyword in question_lower for keyword in situation_keywords)
-            
-            if is_situation_question:
-                # Force last_24h for situation questions
-                preprocessed_message['time_range'] = 'last_24h'
-                print("General situation question detected - using last_24h events")
-        
-        if not location or not location.strip():
-            # No location: use Grok vector search to find semantically relevant events
-            print("No location specified - using Grok vector search")
-            events = get_events_with_vector_search(preprocessed_message, original_question)
-        else:
-            # Location specified: use traditional filtered query
-            print("Location specified - using filtered query")
-            events = get_events_for_chat(preprocessed_message)
-        
-        events_context = format_events_for_rag(events)
-        
-        # Build user prompt with context
-        user_prompt = f"""
-                    User question context (extracted parameters):
-                    {json.dumps(preprocessed_message, ensure_ascii=False, indent=2)}
-
-                    Database events (RAG context):
-                    {events_context}
-
-                    Original user question: "{preprocessed_message.get('original_question', '')}"
-
-                    Respond in {preprocessed_message.get('language', 'ht')} language.
-                    """
-        
-        print(f"Query type: {preprocessed_message.get('query_type')}")
-        print(f"Events found: {len(events)}")
-        
-        completion = client.chat.completions.create(
+        messages, _ = build_event_chat_messages(preprocessed_message, speculation)
+        analysed_msg = cached_completion(
+            "analyse_chat",
             model=model_list[0],  
-            messages=[
-                {"role": "system", "content": system_prompt + "\n\nToday's date: " + datetime.now(UTC).strftime("%Y-%m-%d")}, 
-                {"role": "user", "content": user_prompt}
-            ]
+            messages=messages
         )
-
-        analysed_msg = completion.choices[0].message.content
         return analysed_msg
        
     except Exception as e:
         print(f"Error analysing chat prompt: {e}")
         # Return helpful error message in detected language
-        lang = preprocessed_message.get('language', 'ht')
-        if lang == 'ht':
-            return "Désolé, mwen pa ka reponn kèksyon ou a kounye a. Tanpri eseye ankò."
-        elif lang == 'fr':
-            return "Désolé, je n'ai pas pu traiter votre question. Veuillez réessayer."
-        else:
-            return "Sorry, I couldn't process your question. Please try again."
+        return get_chat_error_message(preprocessed_message.get('language', 'ht'))
+
+
+def understand_question(message):
+    """
+    Extract the query parameters of a chat question. When Grok has to
+    preprocess it, the retrieval likely to be needed starts at the same time.
+    
+    Args:
+        message (str): User's question/prompt
+    
+    Returns:
+        tuple: (query parameters or None, SpeculativeRetrieval or None)
+    """
+    query_params = parse_query_locally(message)
+    if query_params is not None:
+        return query_params, None
+    
+    speculation = start_speculative_retrieval(message)
+    return preprocess_chat_prompt(message, parse_locally=False), speculation
 
 
 def chat_with_gpt(message):
@@ -581,7 +599,7 @@ def chat_with_gpt(message):
     print(f"Chat with Grok: {message}")
     
     # Step 1: Preprocess to extract query parameters
-    preprocessed_msg = preprocess_chat_prompt(message)
+    preprocessed_msg, speculation = understand_question(message)
     
     if not preprocessed_msg:
         return {
@@ -590,7 +608,7 @@ def chat_with_gpt(message):
         }
     
     # Step 2: Analyze and generate response
-    analysed_msg = analyse_chat_prompt(preprocessed_msg)
+    analysed_msg = analyse_chat_prompt(preprocessed_msg, speculation)
     
     if not analysed_msg:
         return {
@@ -603,6 +621,88 @@ def chat_with_gpt(message):
         "answer": analysed_msg
     }
 
+
+def stream_chat_with_gpt(message):
+    """
+    Streaming variant of chat_with_gpt. Progress events are sent as soon as each
+    step is done, then the answer is sent chunk by chunk as Grok generates it.
+    
+    Args:
+        message (str): User's question/prompt
+    
+    Yields:
+        tuple: (event name, data) with events:
+            progress: {"stage": "understood", "query": {...}} then {"stage": "retrieved", "events": N}
+            token: {"text": "..."}
+            done: {"status": "ok"}
+            error: {"status": "error", "answer": "..."}
+    """
+    print(f"Streaming chat with Grok: {message}")
+
+    preprocessed_msg, speculation = understand_question(message)
+    if not preprocessed_msg:
+        yield "error", {"status": "error", "answer": "Error preprocessing your question. Please try again."}
+        return
+
+    language = preprocessed_msg.get('language', 'ht')
+    yield "progress", {"stage": "understood", "query": preprocessed_msg}
+
+    try:
+        original_question = preprocessed_msg.get('original_question', '')
+        if is_patrolx_related(preprocessed_msg, original_question):
+            messages, events = build_event_chat_messages(preprocessed_msg, speculation)
+            call_site, model = "analyse_chat", model_list[0]
+            yield "progress", {"stage": "retrieved", "events": len(events)}
+        else:
+            messages = build_general_question_messages(original_question, language)
+            call_site, model = "general_question", model_list[0]
+
+        for chunk in cached_stream(call_site, model=model, messages=messages):
+            yield "token", {"text": chunk}
+    except Exception as e:
+        # Tokens already sent (if any) should be discarded by the client
+        print(f"Error streaming chat answer: {e}")
+        yield "error", {"status": "error", "answer": get_chat_error_message(language)}
+        return
+
+    yield "done", {"status": "ok"}
+
+def get_zone_rules():
+    """
+    Write the zone naming rules of the summary prompt from the gazetteer:
+    zones with numbered subzones, and zones sharing a name root without being related.
+
+    Returns:
+        str: Rules text, indented for the summary prompt
+    """
+    lines = []
+    numbered = get_numbered_zones()
+    if numbered:
+        names = " and ".join([", ".join(numbered[:-1]), numbered[-1]]) if len(numbered) > 1 else numbered[0]
+        examples = ", ".join(f'"{name} 19", "{name} 33"' for name in numbered)
+        lines += [
+            f"    • **{names} rule**  ",
+            f"        - Locations like {examples}, etc. ",
+            f"        ARE official subdivisions of {names}.  ",
+            f"        - When the selected location is {names.replace(' and ', ' or ')}, include and summarize ",
+            f'        all events from its numbered zones (e.g. "{numbered[0]} X") together.',
+            f"        - Only {names} have numbered subzones.",
+            "",
+        ]
+    for root, others in get_lookalike_zones().items():
+        listed = ", ".join(f'"{other}"' for other in others)
+        lines += [
+            f'    • **"{root}" rule**  ',
+            f'        - "{root}" is a standalone zone. It does NOT contain {listed}.  ',
+            f'        - Any location that STARTS WITH "{root}" followed by another name is NOT a subzone of "{root}".  ',
+            "        - They are separate zones that merely share a name root.  ",
+            f'        - When the selected location is "{root}", DO NOT merge or treat these other zones as "{root}".  ',
+            "        - Report them separately and clearly as distinct areas.",
+            "",
+        ]
+    return "\n".join(lines)
+
+
 def get_summary_prompt(events_list, location):
     # Build RAG context from events
     context = "\n".join([
@@ -624,42 +724,8 @@ def get_summary_prompt(events_list, location):
     2. Haitian locations follow different naming conventions. 
     Apply these rules to interpret event locations correctly:
 
-    • **Delmas, Pelerin, Martissant and Tabarre rule**  
-        - Locations like "Delmas 19", "Delmas 33", "Delmas 75", "Pelerin 19", "Pelerin 33", "Pelerin 75", "Martissant 19", "Martissant 33", "Martissant 75", "Tabarre 19", "Tabarre 33", "Tabarre 75", etc. 
-        ARE official subdivisions of Delmas, Pelerin, Martissant and Tabarre.  
-        - When the selected location is "Delmas", "Pelerin", "Martissant" or "Tabarre", include and summarize 
-        all events from "Delmas X", "Pelerin X", "Martissant X" or "Tabarre X" zones together.
-
-    • **Non-numbered commune rule (e.g., Carrefour, Pétion-Ville)**  
-        - Locations such as "Carrefour Drouillard", "Carrefour Feuilles", 
-        "Carrefour Vincent", etc. are NOT subdivisions of Carrefour.  
-        - They are separate zones that merely share a name root.  
-        - When the selected location is "Carrefour", DO NOT merge or treat 
-        these other zones as Carrefour.  
-        - Report them separately and clearly as distinct areas.
-
-        IMPORTANT GEOGRAPHIC RULES (HAITI):
-
-        1. "Carrefour" is a standalone commune. 
-        It does NOT contain: 
-        - Carrefour Feuilles
-        - Carrefour Drouillard
-        - Carrefour Vincent
-
-        2. Any location that STARTS WITH "Carrefour " is NOT a subzone of the commune “Carrefour”.
-        Example:
-        - "Carrefour Feuilles" ≠ "Carrefour"
-        - "Carrefour Drouillard" ≠ "Carrefour"
-        - "Carrefour Vincent" ≠ "Carrefour"
-        Treat them as completely independent locations.
-        - If user ask about "Carrefour", you should not include "Carrefour Feuilles", 
-        "Carrefour Drouillard", "Carrefour Vincent" in the result. Keep it simple and clear.
-
-        3. Only Delmas is hierarchical:
-        - Delmas 19, Delmas 40B, Delmas 75 → subzones of Delmas.
-        But "Carrefour X" does NOT follow this rule.
-
-        You MUST respect these rules. Never merge, relate, or assume hierarchy between them.
+{get_zone_rules()}
+    You MUST respect these rules. Never merge, relate, or assume hierarchy between them.
 
 
     3. NEVER invent locations, subdivisions, or relations between zones.  
@@ -692,12 +758,50 @@ def generate_summary(events_list, location):
     if not events_list:
         return f"No events detected in the last 24 hours for {location}. The area appears calm."
     prompt = get_summary_prompt(events_list, location)
-    result = client.chat.completions.create(
+    return cached_completion(
+        "summary",
         model=model_list[1],  # grok-2 for summarization
         messages=[{"role": "user", "content": prompt}],
     )
 
-    return result.choices[0].message.content
+
+def stream_summary(events_list, location):
+    """
+    Streaming variant of generate_summary. The matched events are sent first so
+    the list can be shown right away, then the summary chunk by chunk.
+
+    Args:
+        events_list (list): Events matched for the location
+        location (str): Requested location
+
+    Yields:
+        tuple: (event name, data) with events:
+            events: {"location": ..., "events": [...]}
+            token: {"text": "..."}
+            done: {"status": "ok"}
+            error: {"status": "error", "message": "..."}
+    """
+    yield "events", {"location": location, "events": events_list}
+
+    if not events_list:
+        yield "token", {"text": generate_summary(events_list, location)}
+        yield "done", {"status": "ok"}
+        return
+
+    try:
+        prompt = get_summary_prompt(events_list, location)
+        for chunk in cached_stream(
+            "summary",
+            model=model_list[1],
+            messages=[{"role": "user", "content": prompt}],
+        ):
+            yield "token", {"text": chunk}
+    except Exception as e:
+        print(f"Error streaming summary: {e}")
+        yield "error", {"status": "error", "message": "Error generating summary. Please try again."}
+        return
+
+    yield "done", {"status": "ok"}
 
 
 def preprocess_msg(messages: list):
@@ -711,18 +815,19 @@ def preprocess_msg(messages: list):
     """
     try:
         # Load system prompt
-        system_prompt = load_prompt(DEEP_SYSTEM_PROMPT)
+        system_prompt = get_prompt(DEEP_SYSTEM_PROMPT)
 
         # Build user prompt cleanly
         user_prompt = (
             "Here is a list of messages. Analyze each message independently.\n"
             "Return JSON ONLY.\n\n"
-            f"{messages}"
+            f"{json.dumps(messages, ensure_ascii=False)}"
         )
 
-        print("Preprocessing...")
+        print(f"Preprocessing with {DEEP_SYSTEM_PROMPT}@{get_prompt_hash(DEEP_SYSTEM_PROMPT)}...")
 
-        completion = client.chat.completions.create(
+        content = cached_completion(
+            "preprocess_msg",
             model=model_list[1],          # grok-2 for preprocessing
             response_format={"type": "json_object"},
             messages=[
@@ -731,7 +836,7 @@ def preprocess_msg(messages: list):
             ]
         )
         # Extract content
-        content = strip_markdown_fences(completion.choices[0].message.content)
+        content = strip_markdown_fences(content)
         print("Preprocessing DONE")
         return content
 
@@ -748,7 +853,7 @@ def analyse_msg(preprocessed_msg: dict):
     """
     try:
         # Load system prompt (Haiti-optimized analysis)
-        system_prompt = load_prompt(GPT_SYSTEM_PROMPT)
+        system_prompt = get_prompt(GPT_SYSTEM_PROMPT)
 
         # Build user prompt - ALWAYS JSON-encode the data
         user_prompt = (
@@ -757,9 +862,10 @@ def analyse_msg(preprocessed_msg: dict):
             f"PREPROCESSED_MESSAGES = {json.dumps(preprocessed_msg, ensure_ascii=False, indent=2)}"
         )
 
-        print("Analysing...")
+        print(f"Analysing with {GPT_SYSTEM_PROMPT}@{get_prompt_hash(GPT_SYSTEM_PROMPT)}...")
 
-        completion = client.chat.completions.create(
+        content = cached_completion(
+            "analyse_msg",
             model=model_list[0],  # grok-2 for deep analysis
             response_format={"type": "json_object"},
             messages=[
@@ -769,7 +875,6 @@ def analyse_msg(preprocessed_msg: dict):
         )
 
         # Extract content and parse JSON
-        content = completion.choices[0].message.content
         event = json.loads(content)
 
         print("Analysing DONE")
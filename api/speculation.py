@@ -0,0 +1,122 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, UTC, timedelta
+from .query_embeddings import get_query_embedding
+from .db.models import (
+    get_events_for_chat, get_event_embeddings, build_chat_query, match_chat_query, get_time_cutoff, EVENT_PROJECTION
+)
+
+
+CHAT_SPECULATION_ENABLED = os.environ.get("CHAT_SPECULATION_ENABLED", "true").lower() == "true"
+CHAT_SPECULATION_WORKERS = int(os.environ.get("CHAT_SPECULATION_WORKERS", 8))
+# The broad fetch can answer a question only if it returned fewer events than this
+SPECULATIVE_CANDIDATE_LIMIT = int(os.environ.get("SPECULATIVE_CANDIDATE_LIMIT", 500))
+# Seconds to wait for a speculative result once the filters are known
+SPECULATION_WAIT_SECONDS = float(os.environ.get("SPECULATION_WAIT_SECONDS", 10))
+# Events returned to a chat question, like get_events_for_chat
+CHAT_EVENTS_LIMIT = 100
+
+speculation_executor = ThreadPoolExecutor(max_workers=CHAT_SPECULATION_WORKERS, thread_name_prefix="chat-speculation")
+
+stats = {"started": 0, "candidates_used": 0, "candidates_missed": 0, "embeddings_used": 0}
+
+
+class SpeculativeRetrieval:
+    """
+    Retrieval started while the question is being preprocessed: the query
+    embedding of the raw question and every event of the last 24h, without
+    their embeddings. Once the filters are known, the candidates are narrowed
+    in memory instead of querying Mongo again; the embeddings of the matching
+    events are only loaded when the caller needs them.
+    """
+
+    def __init__(self, question):
+        self.question = question
+        self.fetched_cutoff = None
+        self.embedding_future = speculation_executor.submit(get_query_embedding, question)
+        self.candidates_future = speculation_executor.submit(self.fetch_candidates)
+        stats["started"] += 1
+
+    def fetch_candidates(self):
+        events = get_events_for_chat({'time_range': 'last_24h'}, include_ids=True,
+                                     limit=SPECULATIVE_CANDIDATE_LIMIT)
+        # Taken after the query, so it is never older than the cutoff Mongo used
+        self.fetched_cutoff = datetime.now(UTC) - timedelta(hours=24)
+        return events
+
+    def query_embedding(self):
+        """
+        Get the speculative query embedding, or compute it now if it is not ready in time.
+
+        Returns:
+            numpy.ndarray: Query embedding or None
+        """
+        try:
+            embedding = self.embedding_future.result(timeout=SPECULATION_WAIT_SECONDS)
+        except Exception as e:
+            print(f"Speculative query embedding unavailable: {e}")
+            embedding = None
+        if embedding is None:
+            return get_query_embedding(self.question)
+        stats["embeddings_used"] += 1
+        return embedding
+
+    def candidates(self, query_params, include_embeddings=False):
+        """
+        Narrow the speculative candidates to the filters of the question.
+
+        Args:
+            query_params (dict): Query parameters (see get_events_for_chat)
+            include_embeddings (bool): Load the stored embedding fields of the matching events
+
+        Returns:
+            list: Matching events like get_events_for_chat would return, or None
+                if the broad fetch cannot answer (older time range, truncated, failed)
+        """
+        try:
+            events = self.candidates_future.result(timeout=SPECULATION_WAIT_SECONDS)
+        except Exception as e:
+            print(f"Speculative candidates unavailable: {e}")
+            events = None
+        # Taken after the wait, so a fetch that just finished still covers the last 24h
+        cutoff = get_time_cutoff(query_params.get('time_range', 'any'))
+        if (events is None or cutoff is None or cutoff < self.fetched_cutoff
+                or len(events) >= SPECULATIVE_CANDIDATE_LIMIT):
+            stats["candidates_missed"] += 1
+            return None
+
+        query = build_chat_query(query_params)
+        matched = [e for e in events if match_chat_query(e, query)][:CHAT_EVENTS_LIMIT]
+        embeddings = get_event_embeddings([e['_id'] for e in matched]) if include_embeddings else {}
+        matched = [
+            {**{k: v for k, v in e.items() if k not in EVENT_PROJECTION}, **embeddings.get(e['_id'], {})}
+            for e in matched
+        ]
+        stats["candidates_used"] += 1
+        print(f"Narrowed {len(events)} speculative candidates to {len(matched)} events")
+        return matched
+
+
+def start_speculative_retrieval(question):
+    """
+    Start retrieval for a question whose filters are not known yet.
+
+    Args:
+        question (str): User's question
+
+    Returns:
+        SpeculativeRetrieval: Running retrieval, or None if speculation is disabled
+    """
+    if not CHAT_SPECULATION_ENABLED:
+        return None
+    return SpeculativeRetrieval(question)
+
+
+def get_stats():
+    """
+    Get speculative retrieval counters.
+
+    Returns:
+        dict: Speculations started and how often their results were used
+    """
+    return {**stats, "enabled": CHAT_SPECULATION_ENABLED}
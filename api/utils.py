@@ -1,3 +1,6 @@
+import json
+
+
 def strip_markdown_fences(text: str) -> str:
     """
     Remove ```json ... ``` or ``` ... ``` blocks from model output.
@@ -13,4 +16,18 @@ def strip_markdown_fences(text: str) -> str:
     if text.endswith("```"):
         text = text[: -3]
 
-    return text.strip()
\ No newline at end of file
+    return text.strip()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count of a text (about 4 characters per token).
+    """
+    return len(text) // 4 + 1
+
+
+def format_sse(event: str, data) -> str:
+    """
+    Format one Server-Sent Events message with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
@@ -0,0 +1,382 @@
+import os
+import threading
+import time
+from datetime import datetime, UTC, timedelta
+import numpy as np
+from .event_embeddings import EVENT_EMBEDDING_MODEL, EVENT_EMBEDDING_VERSION, get_stored_embedding
+from .vector_snapshot import save_snapshot, load_snapshot, append_log, get_snapshot_stats, VECTOR_SNAPSHOT_LOG_LIMIT
+from .db.models import SEVERITY_RANK, get_embedded_events, parse_timestamp
+
+
+VECTOR_INDEX_ENABLED = os.environ.get("VECTOR_INDEX_ENABLED", "true").lower() == "true"
+# Events older than this (by start time) are evicted from the index
+VECTOR_INDEX_WINDOW_HOURS = float(os.environ.get("VECTOR_INDEX_WINDOW_HOURS", 72))
+# How often the index pulls events saved by other instances
+VECTOR_INDEX_REFRESH_SECONDS = float(os.environ.get("VECTOR_INDEX_REFRESH_SECONDS", 60))
+# Each refresh also pulls events updated this many seconds before the previous one,
+# covering clock skew between instances and writes still in flight
+VECTOR_INDEX_REFRESH_OVERLAP_SECONDS = float(os.environ.get("VECTOR_INDEX_REFRESH_OVERLAP_SECONDS", 120))
+# Persist the index to disk (memory-mapped snapshot + append log) for fast cold starts
+VECTOR_SNAPSHOT_ENABLED = os.environ.get("VECTOR_SNAPSHOT_ENABLED", "true").lower() == "true"
+
+
+class EventVectorIndex:
+    """
+    In-memory cosine similarity index over event embeddings.
+    Rows of a contiguous float32 matrix hold L2-normalized embeddings; parallel
+    arrays hold the metadata used by filter masks. Removal swaps the last row
+    into the freed slot so the live rows stay contiguous.
+    """
+
+    def __init__(self, capacity=1024):
+        self.dim = None
+        self.size = 0
+        self.matrix = None
+        self.ids = []  # row -> event id
+        self.rows = {}  # event id -> row
+        self.severity = np.zeros(capacity, dtype=np.int8)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.event_types = np.empty(capacity, dtype=object)
+        self.capacity = capacity
+        self.lock = threading.RLock()
+
+    def grow(self):
+        self.capacity *= 2
+        matrix = np.zeros((self.capacity, self.dim), dtype=np.float32)
+        matrix[:self.size] = self.matrix[:self.size]
+        self.matrix = matrix
+        self.severity = np.resize(self.severity, self.capacity)
+        self.timestamps = np.resize(self.timestamps, self.capacity)
+        event_types = np.empty(self.capacity, dtype=object)
+        event_types[:self.size] = self.event_types[:self.size]
+        self.event_types = event_types
+
+    def add(self, event_id, embedding, severity=None, event_type=None, timestamp=None):
+        """
+        Add an event, or update it if already indexed.
+
+        Args:
+            event_id (str): Event ID
+            embedding (numpy.ndarray): Event embedding
+            severity (str): Event severity
+            event_type (str): Event type
+            timestamp (datetime): Event start time
+
+        Returns:
+            bool: False if the embedding does not match the index dimension
+        """
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return False
+
+        with self.lock:
+            if self.dim is None:
+                self.dim = vector.shape[0]
+                self.matrix = np.zeros((self.capacity, self.dim), dtype=np.float32)
+            if vector.shape[0] != self.dim:
+                return False
+
+            row = self.rows.get(event_id)
+            if row is None:
+                if self.size == self.capacity:
+                    self.grow()
+                row = self.size
+                self.size += 1
+                self.ids.append(event_id)
+                self.rows[event_id] = row
+
+            self.matrix[row] = vector / norm
+            self.severity[row] = SEVERITY_RANK.get(severity, 0)
+            self.timestamps[row] = timestamp.timestamp() if timestamp else 0.0
+            self.event_types[row] = event_type
+            return True
+
+    def remove(self, event_id):
+        with self.lock:
+            row = self.rows.pop(event_id, None)
+            if row is None:
+                return
+            last = self.size - 1
+            if row != last:
+                # Move the last row into the freed slot
+                moved_id = self.ids[last]
+                self.matrix[row] = self.matrix[last]
+                self.severity[row] = self.severity[last]
+                self.timestamps[row] = self.timestamps[last]
+                self.event_types[row] = self.event_types[last]
+                self.ids[row] = moved_id
+                self.rows[moved_id] = row
+            self.ids.pop()
+            self.event_types[last] = None
+            self.size -= 1
+
+    def evict_older_than(self, cutoff):
+        """Remove events that started before the cutoff (datetime). Returns the number removed."""
+        with self.lock:
+            expired = np.nonzero(self.timestamps[:self.size] < cutoff.timestamp())[0]
+            expired_ids = [self.ids[row] for row in expired]
+            for event_id in expired_ids:
+                self.remove(event_id)
+            return len(expired_ids)
+
+    def search(self, query, top_k=10, min_severity=None, event_types=None, since=None):
+        """
+        Find the events most similar to a query embedding, filtering and ranking in one pass.
+
+        Args:
+            query (numpy.ndarray): Query embedding
+            top_k (int): Number of results
+            min_severity (str): Only events at or above this severity
+            event_types (list): Only events of these types
+            since (datetime): Only events started at or after this time
+
+        Returns:
+            list: (event id, cosine similarity) pairs, most similar first
+        """
+        with self.lock:
+            if not self.size:
+                return []
+            query = np.asarray(query, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if query.shape[0] != self.dim or norm == 0:
+                return []
+
+            scores = self.matrix[:self.size] @ (query / norm)
+
+            mask = np.ones(self.size, dtype=bool)
+            if min_severity:
+                mask &= self.severity[:self.size] >= SEVERITY_RANK.get(min_severity, 0)
+            if event_types:
+                mask &= np.isin(self.event_types[:self.size], list(event_types))
+            if since:
+                mask &= self.timestamps[:self.size] >= since.timestamp()
+            scores = np.where(mask, scores, -np.inf)
+
+            candidates = int(mask.sum())
+            k = min(top_k, candidates)
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self.ids[row], float(scores[row])) for row in top]
+
+    def load(self, ids, matrix, severity, timestamps, event_types):
+        """Replace the index content with snapshot arrays (matrix rows already normalized)."""
+        with self.lock:
+            self.dim = matrix.shape[1]
+            self.size = len(ids)
+            self.capacity = max(self.size, 1)
+            # A memory-mapped matrix is used as is until the first add needs more room
+            self.matrix = matrix if self.size else np.zeros((1, self.dim), dtype=np.float32)
+            self.ids = list(ids)
+            self.rows = {event_id: row for row, event_id in enumerate(self.ids)}
+            self.severity = np.array(severity, dtype=np.int8).reshape(-1)[:self.size].copy()
+            self.timestamps = np.array(timestamps, dtype=np.float64).reshape(-1)[:self.size].copy()
+            self.event_types = np.empty(self.capacity, dtype=object)
+            self.event_types[:self.size] = list(event_types)
+            if not self.size:
+                self.severity = np.zeros(1, dtype=np.int8)
+                self.timestamps = np.zeros(1, dtype=np.float64)
+
+    def export(self):
+        """Copy of the live rows, for snapshots."""
+        with self.lock:
+            return {
+                "ids": list(self.ids),
+                "matrix": np.array(self.matrix[:self.size]) if self.size else np.zeros((0, self.dim), dtype=np.float32),
+                "severity": self.severity[:self.size].copy(),
+                "timestamps": self.timestamps[:self.size].copy(),
+                "event_types": list(self.event_types[:self.size]),
+            }
+
+    def get_record(self, event_id):
+        """(event id, normalized vector, severity rank, timestamp, event type) of an indexed event."""
+        with self.lock:
+            row = self.rows[event_id]
+            return (event_id, self.matrix[row].copy(), int(self.severity[row]),
+                    float(self.timestamps[row]), self.event_types[row])
+
+    def __len__(self):
+        return self.size
+
+
+index = EventVectorIndex()
+loaded_until = None  # start of the last refresh: events updated before it are loaded
+last_refresh = 0.0
+refresh_lock = threading.Lock()
+
+
+def add_events(events):
+    """
+    Add saved events that carry a current embedding to the index.
+
+    Args:
+        events (list): Events with _id and embedding fields
+
+    Returns:
+        int: Number of events indexed
+    """
+    if not VECTOR_INDEX_ENABLED:
+        return 0
+    added = []
+    for event in events:
+        embedding = get_stored_embedding(event)
+        if embedding is None or not event.get('_id'):
+            continue
+        event_id = str(event['_id'])
+        if index.add(
+            event_id,
+            embedding,
+            severity=event.get('severity'),
+            event_type=event.get('event_type'),
+            timestamp=parse_timestamp(event.get('timestamp_start'))
+        ):
+            added.append(event_id)
+
+    if added and VECTOR_SNAPSHOT_ENABLED:
+        try:
+            log_size = append_log([index.get_record(event_id) for event_id in added], index.dim)
+            if log_size and log_size >= VECTOR_SNAPSHOT_LOG_LIMIT:
+                write_snapshot()
+        except Exception as e:
+            print(f"Error appending to vector index log: {e}")
+    return len(added)
+
+
+def write_snapshot():
+    """Persist the whole index, which also empties the append log."""
+    if index.dim is None:
+        return
+    save_snapshot(index.export(), {
+        "dim": index.dim,
+        "model": EVENT_EMBEDDING_MODEL,
+        "version": EVENT_EMBEDDING_VERSION,
+        "loaded_until": loaded_until.isoformat() if loaded_until else None
+    })
+
+
+def load_from_snapshot():
+    """
+    Restore the index from the on-disk snapshot and its append log.
+
+    Returns:
+        bool: True if a snapshot was loaded
+    """
+    global loaded_until
+    started = time.time()
+    loaded = load_snapshot(EVENT_EMBEDDING_MODEL, EVENT_EMBEDDING_VERSION)
+    if loaded is None:
+        return False
+
+    header, arrays, log = loaded
+    index.load(arrays["ids"], arrays["matrix"], arrays["severity"], arrays["timestamps"], arrays["event_types"])
+    severity_names = {rank: name for name, rank in SEVERITY_RANK.items()}
+    for record in log:
+        index.add(
+            record["id"].decode(),
+            record["vector"],
+            severity=severity_names.get(int(record["severity"])),
+            event_type=record["event_type"].decode() or None,
+            timestamp=datetime.fromtimestamp(record["timestamp"], UTC) if record["timestamp"] else None
+        )
+    # Snapshots without a watermark are completed by a full load of the window
+    loaded_until = datetime.fromisoformat(header["loaded_until"]) if header.get("loaded_until") else None
+    print(f"Vector index loaded from snapshot in {(time.time() - started) * 1000:.0f} ms: "
+          f"{header['size']} events + {len(log)} from the log")
+    return True
+
+
+def refresh():
+    """
+    Load events saved, merged or embedded since the last refresh (by any
+    instance) and evict old ones. The first call restores the on-disk snapshot,
+    or loads the whole window from Mongo and writes a snapshot.
+    """
+    global loaded_until, last_refresh
+    if time.time() - last_refresh < VECTOR_INDEX_REFRESH_SECONDS:
+        return
+    with refresh_lock:
+        if time.time() - last_refresh < VECTOR_INDEX_REFRESH_SECONDS:
+            return
+        first_load = last_refresh == 0.0
+        snapshot_loaded = False
+        if first_load and VECTOR_SNAPSHOT_ENABLED:
+            try:
+                snapshot_loaded = load_from_snapshot()
+            except Exception as e:
+                print(f"Vector index snapshot load failed: {e}")
+
+        started = datetime.now(UTC)
+        cutoff = started - timedelta(hours=VECTOR_INDEX_WINDOW_HOURS)
+        updated_since = None
+        if loaded_until:
+            updated_since = loaded_until - timedelta(seconds=VECTOR_INDEX_REFRESH_OVERLAP_SECONDS)
+        events = get_embedded_events(
+            EVENT_EMBEDDING_MODEL, EVENT_EMBEDDING_VERSION, since=cutoff, updated_since=updated_since
+        )
+        added = add_events(events)
+        loaded_until = started
+        evicted = index.evict_older_than(cutoff)
+        last_refresh = time.time()
+        if first_load and not snapshot_loaded and VECTOR_SNAPSHOT_ENABLED:
+            # Next cold start maps this instead of rebuilding from Mongo
+            try:
+                write_snapshot()
+            except Exception as e:
+                print(f"Vector index snapshot write failed: {e}")
+        if added or evicted:
+            print(f"Vector index: {added} events added, {evicted} evicted, {len(index)} indexed")
+
+
+def search_events(query_embedding, query_params=None, top_k=10):
+    """
+    Search the indexed hot window with the filters of a chat query.
+
+    Args:
+        query_embedding (numpy.ndarray): Query embedding
+        query_params (dict): Query parameters (event_types, severity, time cutoff as 'since')
+        top_k (int): Number of results
+
+    Returns:
+        list: (event id, similarity) pairs, or None if the index cannot answer
+            (disabled, empty, embedded with another dimension or time range beyond the window)
+    """
+    if not VECTOR_INDEX_ENABLED:
+        return None
+    query_params = query_params or {}
+    # The index only holds the hot window: older time ranges need the database
+    since = query_params.get('since')
+    if since is None or since < datetime.now(UTC) - timedelta(hours=VECTOR_INDEX_WINDOW_HOURS):
+        return None
+    try:
+        refresh()
+    except Exception as e:
+        print(f"Vector index refresh failed: {e}")
+    if not len(index) or index.dim != np.asarray(query_embedding).shape[0]:
+        return None
+
+    return index.search(
+        query_embedding,
+        top_k=top_k,
+        min_severity=(query_params.get('severity') or '').lower() or None,
+        event_types=query_params.get('event_types') or None,
+        since=since
+    )
+
+
+def get_stats():
+    """
+    Get vector index size and settings.
+
+    Returns:
+        dict: Indexed events, dimension, settings and snapshot state
+    """
+    return {
+        "enabled": VECTOR_INDEX_ENABLED,
+        "indexed_events": len(index),
+        "dimension": index.dim,
+        "window_hours": VECTOR_INDEX_WINDOW_HOURS,
+        "refresh_seconds": VECTOR_INDEX_REFRESH_SECONDS,
+        "snapshot": get_snapshot_stats() if VECTOR_SNAPSHOT_ENABLED else None
+    }
@@ -0,0 +1,167 @@
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+
+
+# Where the vector index is persisted between cold starts (/tmp is writable on serverless hosts)
+VECTOR_SNAPSHOT_DIR = os.environ.get("VECTOR_SNAPSHOT_DIR", "/tmp/patrolx_vector_index")
+# A new snapshot is written once the append log holds this many records
+VECTOR_SNAPSHOT_LOG_LIMIT = int(os.environ.get("VECTOR_SNAPSHOT_LOG_LIMIT", 500))
+
+ID_BYTES = 24  # ObjectId hex
+EVENT_TYPE_BYTES = 32
+
+log_lock = threading.Lock()
+
+
+def snapshot_path(name, directory=None):
+    return os.path.join(directory or VECTOR_SNAPSHOT_DIR, name)
+
+
+def log_record_dtype(dim):
+    """Fixed-size append log record, readable in one np.fromfile call."""
+    return np.dtype([
+        ("id", f"S{ID_BYTES}"),
+        ("severity", "i1"),
+        ("timestamp", "f8"),
+        ("event_type", f"S{EVENT_TYPE_BYTES}"),
+        ("vector", "f4", (dim,)),
+    ])
+
+
+def save_snapshot(arrays, header):
+    """
+    Write the index arrays as raw .npy files and an empty append log.
+    The snapshot is written next to the current one, then swapped in.
+
+    Args:
+        arrays (dict): ids (str), matrix (float32, normalized), severity (int8),
+            timestamps (float64) and event_types (str) of the live rows
+        header (dict): dim, model, version and loaded_until
+    """
+    tmp_dir = f"{VECTOR_SNAPSHOT_DIR}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    np.save(snapshot_path("matrix.npy", tmp_dir), np.ascontiguousarray(arrays["matrix"], dtype=np.float32))
+    np.save(snapshot_path("ids.npy", tmp_dir), np.array(arrays["ids"], dtype=f"S{ID_BYTES}"))
+    np.save(snapshot_path("severity.npy", tmp_dir), np.asarray(arrays["severity"], dtype=np.int8))
+    np.save(snapshot_path("timestamps.npy", tmp_dir), np.asarray(arrays["timestamps"], dtype=np.float64))
+    np.save(
+        snapshot_path("event_types.npy", tmp_dir),
+        np.array([t or "" for t in arrays["event_types"]], dtype=f"S{EVENT_TYPE_BYTES}")
+    )
+    open(snapshot_path("append.log", tmp_dir), "wb").close()
+    with open(snapshot_path("header.json", tmp_dir), "w") as f:
+        json.dump({**header, "size": len(arrays["ids"]), "created_at": time.time()}, f)
+
+    with log_lock:
+        old_dir = f"{VECTOR_SNAPSHOT_DIR}.old-{os.getpid()}"
+        if os.path.exists(VECTOR_SNAPSHOT_DIR):
+            os.replace(VECTOR_SNAPSHOT_DIR, old_dir)
+        os.replace(tmp_dir, VECTOR_SNAPSHOT_DIR)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    print(f"Vector index snapshot written: {len(arrays['ids'])} events")
+
+
+def load_snapshot(model, version):
+    """
+    Memory-map the snapshot and read its append log.
+
+    Args:
+        model (str): Current embedding model
+        version (int): Current embedding version
+
+    Returns:
+        tuple: (header, arrays, log records) or None if there is no usable snapshot.
+            matrix is a copy-on-write memmap: pages are read lazily and changes stay in memory.
+    """
+    try:
+        with open(snapshot_path("header.json")) as f:
+            header = json.load(f)
+        if header.get("model") != model or header.get("version") != version:
+            print("Vector index snapshot made with another embedding model, ignoring it")
+            return None
+
+        arrays = {
+            "matrix": np.load(snapshot_path("matrix.npy"), mmap_mode="c"),
+            "ids": [i.decode() for i in np.load(snapshot_path("ids.npy"))],
+            "severity": np.load(snapshot_path("severity.npy")),
+            "timestamps": np.load(snapshot_path("timestamps.npy")),
+            "event_types": [t.decode() or None for t in np.load(snapshot_path("event_types.npy"))],
+        }
+        if len(arrays["ids"]) != header["size"] or arrays["matrix"].shape[0] != header["size"]:
+            print("Vector index snapshot is incomplete, ignoring it")
+            return None
+        return header, arrays, read_log(header["dim"])
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error loading vector index snapshot: {e}")
+        return None
+
+
+def read_log(dim):
+    """
+    Read the append log of the current snapshot. A partially written last record is ignored.
+
+    Args:
+        dim (int): Embedding dimension
+
+    Returns:
+        numpy.ndarray: Structured log records
+    """
+    dtype = log_record_dtype(dim)
+    path = snapshot_path("append.log")
+    with log_lock:
+        count = os.path.getsize(path) // dtype.itemsize
+        return np.fromfile(path, dtype=dtype, count=count)
+
+
+def append_log(records, dim):
+    """
+    Append events added to the index since the snapshot.
+
+    Args:
+        records (list): (event id, normalized vector, severity rank, timestamp, event type) tuples
+        dim (int): Embedding dimension
+
+    Returns:
+        int: Number of records in the log, or None if there is no snapshot to append to
+    """
+    path = snapshot_path("append.log")
+    dtype = log_record_dtype(dim)
+    data = np.zeros(len(records), dtype=dtype)
+    for i, (event_id, vector, severity, timestamp, event_type) in enumerate(records):
+        data[i] = (event_id.encode(), severity, timestamp, (event_type or "").encode()[:EVENT_TYPE_BYTES], vector)
+
+    with log_lock:
+        if not os.path.exists(path):
+            return None
+        with open(path, "ab") as f:
+            f.write(data.tobytes())
+        return os.path.getsize(path) // dtype.itemsize
+
+
+def get_snapshot_stats():
+    """
+    Get the state of the on-disk snapshot.
+
+    Returns:
+        dict: Directory, snapshot size and age, and append log size in bytes
+    """
+    try:
+        with open(snapshot_path("header.json")) as f:
+            header = json.load(f)
+        return {
+            "dir": VECTOR_SNAPSHOT_DIR,
+            "events": header.get("size"),
+            "age_seconds": round(time.time() - header.get("created_at", 0)),
+            "log_bytes": os.path.getsize(snapshot_path("append.log")),
+            "log_limit": VECTOR_SNAPSHOT_LOG_LIMIT
+        }
+    except (OSError, ValueError):
+        return {"dir": VECTOR_SNAPSHOT_DIR, "events": None}
@@ -0,0 +1,24 @@
+import os
+import sys
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+# The LLM gateway refuses to import without a key; no test reaches the API
+os.environ.setdefault("GROK_TOKEN", "test")
+# Count tokens from text length instead of downloading a tokenizer
+os.environ.setdefault("RAG_TOKENIZER", "")
+
+
+def stub_database():
+    """
+    Import api.db.models without a database: the Mongo client is a MagicMock,
+    so every collection is one too, while the query builders, parsers and
+    constants are the real ones. Tests patch the collections they use.
+
+    Returns:
+        module: api.db.models
+    """
+    if "api.db.models" not in sys.modules:
+        with mock.patch("pymongo.mongo_client.MongoClient"):
+            import api.db.models  # noqa: F401
+    return sys.modules["api.db.models"]
@@ -0,0 +1,67 @@
+import unittest
+from datetime import datetime, UTC, timedelta
+
+from stubs import stub_database
+
+stub_database()
+
+from api.context_packer import count_tokens, format_event_line, pack_events_context, score_event  # noqa: E402
+
+
+def event(summary, location="Martissant", event_type="shooting", severity="medium", hours_ago=1, **fields):
+    start = (datetime.now(UTC) - timedelta(hours=hours_ago)).isoformat()
+    return {"summary": summary, "location": location, "event_type": event_type,
+            "severity": severity, "timestamp_start": start, **fields}
+
+
+class ScoreEventTest(unittest.TestCase):
+
+    def test_relevant_severe_recent_and_corroborated_rank_higher(self):
+        now = datetime.now(UTC)
+        terms = {"delmas"}
+        base = event("Blokis", location="Delmas")
+        self.assertGreater(score_event(base, terms, now), score_event(event("Blokis"), terms, now))
+        self.assertGreater(score_event({**base, "severity": "critical"}, terms, now), score_event(base, terms, now))
+        self.assertGreater(score_event(base, terms, now), score_event(event("Blokis", location="Delmas", hours_ago=12), terms, now))
+        self.assertGreater(score_event({**base, "sources_count": 5}, terms, now), score_event(base, terms, now))
+
+
+class PackEventsContextTest(unittest.TestCase):
+
+    def test_no_events(self):
+        self.assertEqual(pack_events_context([]), ("NO_EVENTS", 0))
+        # Nothing fits the budget
+        self.assertEqual(pack_events_context([event("Tire")], max_tokens=1), ("NO_EVENTS", 0))
+
+    def test_most_relevant_events_first(self):
+        events = [event("Blokis", location="Delmas", event_type="roadblock"), event("Tire anpil")]
+        context, count = pack_events_context(events, {"location": "Martissant"}, "Sa k ap pase Martissant?")
+        self.assertEqual(count, 2)
+        self.assertIn("Martissant", context.splitlines()[0])
+
+    def test_near_identical_events_are_folded(self):
+        events = [
+            event("Tire nan Martissant, moun ap kouri"),
+            event("Tire nan Martissant, moun ap kouri!", location="martissant"),
+            event("Tire nan Martissant, moun ap kouri", location="Delmas"),
+        ]
+        context, count = pack_events_context(events)
+        self.assertEqual(count, 2)
+        self.assertIn("| x2 similar", context)
+
+    def test_context_stays_within_the_budget(self):
+        events = [event(f"Evenman {i} " + "detay " * 20, location=f"Zone {i}") for i in range(20)]
+        budget = 200
+        context, count = pack_events_context(events, max_tokens=budget)
+        self.assertLess(count, 20)
+        self.assertLessEqual(sum(count_tokens(line) + 1 for line in context.splitlines()), budget)
+
+    def test_format_event_line(self):
+        line = format_event_line(event("Tire", sources=["WhatsApp", "X"], recommended_action="Evite zon nan",
+                                       timestamp_start="2026-05-01T14:30:00Z"), reports=3)
+        self.assertEqual(line, "- [05-01 14:30] medium shooting @ Martissant: Tire | src: WhatsApp, X"
+                               " | x3 similar | action: Evite zon nan")
+
+
+if __name__ == "__main__":
+    unittest.main()
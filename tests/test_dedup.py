@@ -0,0 +1,114 @@
+import unittest
+from datetime import datetime, UTC, timedelta
+from unittest import mock
+
+from stubs import stub_database
+
+stub_database()
+
+from api import dedup  # noqa: E402
+from api.dedup import (  # noqa: E402
+    fingerprint_message, filter_duplicate_messages, get_fingerprint_state, link_event_fingerprints,
+    normalize_text, release_fingerprints
+)
+
+
+class FingerprintTest(unittest.TestCase):
+
+    def test_trivial_variants_share_a_fingerprint(self):
+        original = fingerprint_message({"text": "Tire nan Martissant!"})
+        for variant in ["tire nan martissant", "Fwd: TIRE   nan Martissant 🔫", "  Tiré nan Martissant..."]:
+            self.assertEqual(fingerprint_message({"text": variant}), original, variant)
+        self.assertEqual(fingerprint_message("Tire nan Martissant"), original)
+        self.assertNotEqual(fingerprint_message({"text": "Tire nan Delmas"}), original)
+
+    def test_empty_text_has_no_fingerprint(self):
+        self.assertEqual(normalize_text("🔫 !!"), "")
+        for message in [{"text": ""}, {"text": None}, {"image": "x.jpg"}, {"text": "🔫🔫"}]:
+            self.assertIsNone(fingerprint_message(message), message)
+
+
+class FingerprintStateTest(unittest.TestCase):
+
+    def test_states(self):
+        now = datetime.now(UTC)
+        with mock.patch.object(dedup, "get_ingestion_job", side_effect=lambda job_id: {"status": job_id}):
+            self.assertEqual(get_fingerprint_state({"event_id": "e1"}), "linked")
+            self.assertEqual(get_fingerprint_state({"job_id": "running"}), "pending")
+            self.assertEqual(get_fingerprint_state({"job_id": "failed"}), "stale")
+        self.assertEqual(get_fingerprint_state({"claimed_at": now}), "pending")
+        # Naive datetimes from Mongo are UTC
+        self.assertEqual(get_fingerprint_state({"claimed_at": (now - timedelta(hours=1)).replace(tzinfo=None)}), "stale")
+        self.assertEqual(get_fingerprint_state({}), "stale")
+
+
+class FilterDuplicatesTest(unittest.TestCase):
+
+    def setUp(self):
+        dedup.fingerprint_cache.clear()
+        self.seen = {}
+        patches = [
+            mock.patch.object(dedup, "indexes_ready", True),
+            mock.patch.object(dedup, "record_message_fingerprint", side_effect=self.record),
+            mock.patch.object(dedup, "increment_event_sources"),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def record(self, fingerprint):
+        # Returns the previous record, like the upsert in models
+        previous = self.seen.get(fingerprint)
+        self.seen.setdefault(fingerprint, {"claimed_at": datetime.now(UTC)})
+        return previous
+
+    def test_drops_copies_and_keeps_empty_messages(self):
+        messages = [{"text": "blokis Delmas"}, {"text": "Blokis delmas!"}, {"text": ""}, {"text": ""}]
+        new_messages, duplicates = filter_duplicate_messages(messages)
+        self.assertEqual(new_messages, [messages[0], messages[2], messages[3]])
+        self.assertEqual(duplicates, 1)
+
+    def test_linked_copy_counts_as_a_source(self):
+        fingerprint = fingerprint_message({"text": "blokis Delmas"})
+        self.seen[fingerprint] = {"event_id": "e1"}
+        new_messages, duplicates = filter_duplicate_messages([{"text": "blokis Delmas"}])
+        self.assertEqual((new_messages, duplicates), ([], 1))
+        dedup.increment_event_sources.assert_called_once_with("e1")
+        self.assertEqual(dedup.fingerprint_cache[fingerprint], "e1")
+
+    def test_stale_copy_is_processed_again(self):
+        fingerprint = fingerprint_message({"text": "blokis Delmas"})
+        self.seen[fingerprint] = {"claimed_at": datetime.now(UTC) - timedelta(hours=1)}
+        with mock.patch.object(dedup, "reclaim_message_fingerprint", return_value=True):
+            new_messages, duplicates = filter_duplicate_messages([{"text": "blokis Delmas"}])
+        self.assertEqual(duplicates, 0)
+        self.assertEqual(len(new_messages), 1)
+
+
+class LinkFingerprintsTest(unittest.TestCase):
+
+    def test_links_fingerprints_and_near_duplicates(self):
+        dedup.fingerprint_cache.clear()
+        raw = [{"text": "tire Martissant", "near_duplicates": 2}, {"text": ""}, {"text": "blokis Delmas"}]
+        preprocessed = [
+            {"ref": 0, "cluster_id": "a"}, {"ref": 1, "cluster_id": "a"},
+            {"ref": 2, "cluster_id": "b"}, {"ref": 7, "cluster_id": "a"},
+        ]
+        events = [{"_id": "e1", "cluster_id": "a"}, {"_id": None, "cluster_id": "b"}]
+        with mock.patch.object(dedup, "link_fingerprints_to_event") as link, \
+                mock.patch.object(dedup, "increment_event_sources") as increment:
+            link_event_fingerprints(raw, preprocessed, events)
+
+        link.assert_called_once_with([fingerprint_message(raw[0])], "e1")
+        increment.assert_called_once_with("e1", 2)
+
+    def test_release_skips_messages_without_fingerprint(self):
+        with mock.patch.object(dedup, "release_message_fingerprints") as release:
+            release_fingerprints([{"text": ""}])
+            release.assert_not_called()
+            release_fingerprints([{"text": "blokis Delmas"}, {"text": "🔫"}])
+            release.assert_called_once_with([fingerprint_message({"text": "blokis Delmas"})])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import threading
+import time
+import unittest
+from datetime import datetime, UTC, timedelta
+from unittest import mock
+
+from stubs import stub_database
+
+models = stub_database()
+
+from bson import ObjectId  # noqa: E402
+
+STORED_ID = "64b7f0c2a1b2c3d4e5f60718"
+
+
+def hours_ago(hours):
+    return (datetime.now(UTC) - timedelta(hours=hours)).isoformat()
+
+
+def report(**fields):
+    return {
+        "title": "Tire", "location": "Martissant", "event_type": "shooting", "severity": "medium",
+        "timestamp_start": hours_ago(0), "messages_used": ["m"], **fields
+    }
+
+
+class MergeHelpersTest(unittest.TestCase):
+
+    def test_canonical_location(self):
+        self.assertEqual(models.canonical_location("Pétion-Ville "), "petion ville")
+        self.assertEqual(models.canonical_location("PETION VILLE!"), "petion ville")
+        for location in [None, "", "Unknown", " null ", 12]:
+            self.assertIsNone(models.canonical_location(location), location)
+
+    def test_find_merge_target(self):
+        candidate = {"location_key": "martissant", "event_type": "gunshots", "timestamp_start": hours_ago(1)}
+        event = {"location_key": "martissant", "event_type": "shooting", "timestamp_start": hours_ago(0)}
+        self.assertIs(models.find_merge_target(event, [candidate]), candidate)
+        self.assertIsNone(models.find_merge_target({**event, "event_type": "traffic"}, [candidate]))
+        self.assertIsNone(models.find_merge_target({**event, "location_key": "delmas"}, [candidate]))
+        self.assertIsNone(models.find_merge_target({**event, "location_key": None}, [candidate]))
+        stale = {**candidate, "timestamp_start": hours_ago(models.EVENT_MERGE_WINDOW_HOURS + 1)}
+        self.assertIsNone(models.find_merge_target(event, [stale]))
+
+    def test_merge_into_only_raises_fields(self):
+        target = {"severity": "high", "priority": 1, "probability": 0.9, "sources_count": 2, "messages_used": ["a"]}
+        changes = models.merge_into(target, {"severity": "low", "probability": 0.5, "messages_used": ["b"], "cluster_id": "c"})
+        self.assertEqual(set(changes), {"last_seen_at"})
+        self.assertEqual((target["sources_count"], target["messages_used"]), (3, ["a", "b"]))
+        self.assertEqual(target["merged_cluster_ids"], ["c"])
+
+        changes = models.merge_into(target, {"severity": "critical", "priority": 0, "probability": 0.95})
+        self.assertEqual((changes["severity"], changes["priority"], changes["probability"]), ("critical", 0, 0.95))
+        self.assertTrue(target["escalated"])
+
+
+class SaveEventTest(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = mock.MagicMock()
+        self.collection.find.return_value.sort.return_value = []
+        self.collection.insert_many.side_effect = lambda docs: mock.Mock(inserted_ids=[ObjectId() for _ in docs])
+        patch = mock.patch.object(models, "event_collection", self.collection)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_reports_of_one_batch_are_inserted_once(self):
+        saved = models.save_event({"events": [report(cluster_id="a"), report(cluster_id="b", location="martissant.")]})
+        inserted = self.collection.insert_many.call_args.args[0]
+        self.assertEqual(len(inserted), 1)
+        self.assertEqual(inserted[0]["sources_count"], 2)
+        self.assertEqual(inserted[0]["messages_used"], ["m", "m"])
+        self.assertIn("updated_at", inserted[0])
+        self.assertNotIn("merged_cluster_ids", inserted[0])
+        self.assertEqual(saved["events"][0]["merged_cluster_ids"], ["b"])
+        self.collection.bulk_write.assert_not_called()
+
+    def test_report_of_a_stored_event_is_merged_with_operators(self):
+        stored = {"_id": ObjectId(STORED_ID), "location_key": "martissant", "event_type": "gunshots",
+                  "severity": "medium", "timestamp_start": hours_ago(1), "sources_count": 3}
+        self.collection.find.return_value.sort.return_value = [stored]
+
+        saved = models.save_event({"events": [report(severity="high", priority=1, sources_count=2)]})
+
+        self.collection.insert_many.assert_not_called()
+        self.assertEqual(saved["events"][0]["_id"], STORED_ID)
+        self.assertTrue(saved["events"][0]["merged"])
+        merge, escalation = self.collection.bulk_write.call_args.args[0]
+        self.assertEqual(merge._filter, {"_id": ObjectId(STORED_ID)})
+        self.assertEqual(merge._doc["$inc"], {"sources_count": 2})
+        self.assertEqual(merge._doc["$push"], {"messages_used": {"$each": ["m"]}})
+        self.assertIn("last_seen_at", merge._doc["$max"])
+        # Escalation only applies while the stored severity is lower
+        self.assertEqual(escalation._filter, {"_id": ObjectId(STORED_ID), "severity": {"$in": ["low", "medium", None]}})
+        self.assertEqual({k: v for k, v in escalation._doc["$set"].items() if k != "updated_at"},
+                         {"severity": "high", "priority": 1})
+
+    def test_saves_at_the_same_location_are_serialized(self):
+        # Each save sees what the previous one inserted, as Mongo would return it
+        inserted = []
+
+        def find(query):
+            cursor = mock.MagicMock()
+            cursor.sort.return_value = [dict(doc) for doc in inserted]
+            # Slow query: without the lock, both saves would read before either inserts
+            time.sleep(0.05)
+            return cursor
+
+        def insert_many(docs):
+            ids = [ObjectId() for _ in docs]
+            inserted.extend({**doc, "_id": i} for doc, i in zip(docs, ids))
+            return mock.Mock(inserted_ids=ids)
+
+        self.collection.find.side_effect = find
+        self.collection.insert_many.side_effect = insert_many
+        barrier = threading.Barrier(2)
+
+        def save():
+            barrier.wait()
+            models.save_event({"events": [report()]})
+
+        threads = [threading.Thread(target=save) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(inserted), 1)
+        self.collection.bulk_write.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from stubs import stub_database
+
+stub_database()
+
+from api.gazetteer import TermMatcher, find_topics, find_zones  # noqa: E402
+
+
+class FindTopicsTest(unittest.TestCase):
+
+    def test_situation_questions_keep_patrolx_terms(self):
+        # Situation phrases contain patrolx terms ("situation", "dangerous")
+        for question in ["How is the situation?", "Is it dangerous?", "comment est la situation"]:
+            topics = find_topics(question)
+            self.assertIn("situation", topics, question)
+            self.assertIn("patrolx", topics, question)
+
+    def test_general_question(self):
+        self.assertEqual(find_topics("Tell me a joke"), {"general_question"})
+        self.assertEqual(find_topics(""), set())
+
+
+class TermMatcherTest(unittest.TestCase):
+
+    def test_longest_match_wins_within_a_matcher(self):
+        matcher = TermMatcher({"carrefour": 1, "carrefour feuilles": 2})
+        self.assertEqual(matcher.find_values("Tire nan Carrefour-Feuilles"), [2])
+
+    def test_zones(self):
+        self.assertEqual(find_zones("eske gen tire Martissant ak Kafou?"), ["Martissant", "Carrefour"])
+
+
+if __name__ == "__main__":
+    unittest.main()
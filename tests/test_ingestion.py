@@ -0,0 +1,120 @@
+import unittest
+from unittest import mock
+
+from stubs import stub_database
+
+stub_database()
+
+from pymongo.errors import DuplicateKeyError  # noqa: E402
+from api import ingestion  # noqa: E402
+from api.ingestion import derive_idempotency_key, enqueue_messages, find_existing_job, group_by_cluster, process_messages  # noqa: E402
+
+PRETRIAGED = [
+    {"ref": 0, "cluster_id": "delmas", "category_hint": "roadblock", "risk_hint": "medium"},
+    {"ref": 1, "cluster_id": "martissant", "category_hint": "gunshots", "risk_hint": "low"},
+    {"ref": 2, "cluster_id": "noise", "is_relevant": False},
+]
+ANALYSED = {"events": [{"title": "Blokis Delmas", "cluster_id": "delmas"}]}
+
+
+class IdempotencyKeyTest(unittest.TestCase):
+
+    def test_message_ids_identify_the_delivery(self):
+        key = derive_idempotency_key([{"id": "a", "text": "x"}, {"message_id": "b"}])
+        self.assertEqual(derive_idempotency_key([{"message_id": "b"}, {"id": "a", "text": "changed"}]), key)
+        self.assertNotEqual(derive_idempotency_key([{"id": "a"}, {"id": "c"}]), key)
+
+    def test_content_keys_only_match_within_the_window(self):
+        window = ingestion.IDEMPOTENCY_CONTENT_WINDOW_MINUTES * 60
+        messages = [{"text": "blokis Delmas"}, {"id": "a", "text": "tire"}]
+        with mock.patch.object(ingestion.time, "time", return_value=10 * window + 1):
+            key = derive_idempotency_key(messages)
+            self.assertNotEqual(derive_idempotency_key(messages[:1]), key)
+        with mock.patch.object(ingestion.time, "time", return_value=11 * window - 1):
+            self.assertEqual(derive_idempotency_key(messages), key)
+        with mock.patch.object(ingestion.time, "time", return_value=11 * window + 1):
+            self.assertNotEqual(derive_idempotency_key(messages), key)
+
+
+class ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        patches = [mock.patch.object(ingestion, name) for name in (
+            "update_ingestion_job", "complete_ingestion_job_stage", "save_processed_messages",
+            "get_processed_messages", "pretriage", "analyse_msg", "save_and_notify",
+        )]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        ingestion.pretriage.return_value = {"messages": PRETRIAGED}
+        ingestion.get_processed_messages.return_value = PRETRIAGED
+        ingestion.analyse_msg.return_value = ANALYSED
+        ingestion.save_and_notify.return_value = ([{"_id": "e1"}], 3)
+
+    def test_fresh_job_runs_every_stage(self):
+        result = process_messages({"_id": "j1", "messages": ["a", "b", "c"], "pipelined": False})
+        self.assertEqual(result, {"events_saved": 1, "notifications_sent": 3})
+        stored = ingestion.save_processed_messages.call_args.args[0]
+        self.assertEqual([m["_id"] for m in stored], ["j1:0", "j1:1", "j1:2"])
+        self.assertEqual([c.args[1] for c in ingestion.complete_ingestion_job_stage.call_args_list],
+                         ["pretriage", "analysis", "saved"])
+
+    def test_resumed_job_reuses_completed_stages(self):
+        job = {"_id": "j1", "messages": ["a", "b", "c"], "pipelined": False,
+               "completed_stages": ["pretriage", "analysis"], "analysed_events": ANALYSED}
+        self.assertEqual(process_messages(job), {"events_saved": 1, "notifications_sent": 3})
+        ingestion.pretriage.assert_not_called()
+        ingestion.analyse_msg.assert_not_called()
+        ingestion.get_processed_messages.assert_called_once_with("j1")
+        ingestion.save_and_notify.assert_called_once_with(ANALYSED, ["a", "b", "c"], PRETRIAGED)
+
+    def test_saved_job_is_not_notified_twice(self):
+        job = {"_id": "j1", "pipelined": False, "completed_stages": ["pretriage", "analysis", "saved"],
+               "saved_event_ids": ["e1", "e2"], "notifications_sent": 4}
+        self.assertEqual(process_messages(job), {"events_saved": 2, "notifications_sent": 4})
+        ingestion.save_and_notify.assert_not_called()
+
+    def test_pipelined_job_skips_completed_clusters(self):
+        job = {"_id": "j1", "messages": ["a", "b", "c"], "pipelined": True,
+               "completed_stages": ["pretriage", "cluster:martissant"], "events_saved": 2, "notifications_sent": 1}
+        self.assertEqual(process_messages(job), {"events_saved": 3, "notifications_sent": 4})
+        ingestion.analyse_msg.assert_called_once_with({"messages": PRETRIAGED[:1]})
+        ingestion.complete_ingestion_job_stage.assert_called_once_with("j1", "cluster:delmas")
+
+    def test_clusters_are_ordered_by_urgency(self):
+        self.assertEqual([c for c, _ in group_by_cluster(PRETRIAGED)], ["martissant", "delmas"])
+
+
+class DuplicateDeliveryTest(unittest.TestCase):
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(ingestion, "indexes_ready", True),
+            mock.patch.object(ingestion, "queue_job"),
+            mock.patch.object(ingestion, "assign_job_fingerprints"),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_retry_returns_the_existing_job(self):
+        with mock.patch.object(ingestion, "create_ingestion_job", side_effect=DuplicateKeyError("dup")), \
+                mock.patch.object(ingestion, "get_ingestion_job_by_key", return_value={"_id": "j1", "status": "done"}):
+            self.assertEqual(enqueue_messages(["a"], idempotency_key="k"), "j1")
+        ingestion.queue_job.assert_not_called()
+
+    def test_failed_job_is_resumed(self):
+        with mock.patch.object(ingestion, "get_ingestion_job_by_key", return_value={"_id": "j1", "status": "failed"}), \
+                mock.patch.object(ingestion, "requeue_ingestion_job", return_value=True):
+            self.assertEqual(find_existing_job("k"), "j1")
+        ingestion.queue_job.assert_called_once_with("j1")
+
+    def test_new_delivery_is_queued(self):
+        with mock.patch.object(ingestion, "create_ingestion_job", return_value="j2"):
+            self.assertEqual(enqueue_messages(["a"], idempotency_key="k"), "j2")
+        ingestion.assign_job_fingerprints.assert_called_once_with(["a"], "j2")
+        ingestion.queue_job.assert_called_once_with("j2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from datetime import datetime, UTC, timedelta
+from unittest import mock
+
+from stubs import stub_database
+
+stub_database()
+
+from api import services  # noqa: E402
+from api.keyword_index import EventKeywordIndex, rank_events, reciprocal_rank_fusion, tokenize  # noqa: E402
+
+
+def event(summary, location, event_type="shooting", severity="medium", hours_ago=1):
+    start = (datetime.now(UTC) - timedelta(hours=hours_ago)).isoformat()
+    return {"summary": summary, "location": location, "event_type": event_type,
+            "severity": severity, "timestamp_start": start}
+
+
+class TokenizeTest(unittest.TestCase):
+
+    def test_variants_share_a_term(self):
+        for text in ["tirè", "tirs", "Tiré", "TIRE"]:
+            self.assertEqual(tokenize(text), ["tir"], text)
+        self.assertEqual(tokenize("Eske gen blokis nan Delmas?"), ["bloki", "delma"])
+        self.assertEqual(tokenize(None), [])
+
+
+class EventKeywordIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = EventKeywordIndex()
+        self.index.add("martissant", event("Tire nan zòn nan", "Martissant", severity="high"))
+        self.index.add("delmas", event("Moun ap pale de Martissant", "Delmas 33", event_type="roadblock"))
+        self.index.add("old", event("Tire", "Martissant", hours_ago=48))
+
+    def test_location_matches_rank_above_mentions(self):
+        ranked = [i for i, _ in self.index.search("Martissant")]
+        self.assertEqual(sorted(ranked[:2]), ["martissant", "old"])
+        self.assertEqual(ranked[2], "delmas")
+        self.assertEqual(self.index.search("Kafou"), [])
+        self.assertEqual(self.index.search("nan"), [])
+
+    def test_filters(self):
+        search = lambda **filters: [i for i, _ in self.index.search("Martissant", **filters)]  # noqa: E731
+        self.assertEqual(search(min_severity="high"), ["martissant"])
+        self.assertEqual(search(event_types=["roadblock"]), ["delmas"])
+        self.assertEqual(sorted(search(since=datetime.now(UTC) - timedelta(hours=24))), ["delmas", "martissant"])
+
+    def test_update_remove_and_evict(self):
+        self.index.add("delmas", event("Blokis", "Delmas 33", event_type="roadblock"))
+        self.assertNotIn("delmas", [i for i, _ in self.index.search("Martissant")])
+        self.index.remove("martissant")
+        self.assertEqual(self.index.evict_older_than(datetime.now(UTC) - timedelta(hours=24)), 1)
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.total_length, sum(self.index.doc_lengths.values()))
+        self.assertNotIn("tir", self.index.postings)
+
+
+class FusionTest(unittest.TestCase):
+
+    def test_reciprocal_rank_fusion(self):
+        self.assertEqual(reciprocal_rank_fusion([["a", "b"], ["b", "c"]]), ["b", "a", "c"])
+        self.assertEqual(reciprocal_rank_fusion([]), [])
+
+    def test_rank_events(self):
+        events = [event("Blokis", "Delmas"), event("Tire", "Martissant"), event("Tire ankò", "Kafou")]
+        self.assertEqual(rank_events("tirs Martissant", events), [1, 2])
+
+
+class SearchHotWindowTest(unittest.TestCase):
+
+    def setUp(self):
+        patch = mock.patch.object(services, "get_events_by_ids",
+                                  side_effect=lambda ids, **kwargs: [{"_id": i, "title": i} for i in ids])
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def search(self, vector_hits, keyword_hits, query_embedding=(1.0, 0.0)):
+        with mock.patch.object(services, "search_vector_events", return_value=vector_hits), \
+                mock.patch.object(services, "search_keyword_events", return_value=keyword_hits):
+            return services.search_hot_window(query_embedding, "tire", {}, "last_24h", top_k=3)
+
+    def test_rankings_are_fused(self):
+        results = self.search([("a", 0.9), ("b", 0.8)], [("b", 3.0), ("c", 1.0)])
+        self.assertEqual([e["title"] for e in results], ["b", "a", "c"])
+        self.assertNotIn("_id", results[0])
+
+    def test_keyword_hits_answer_alone(self):
+        self.assertEqual([e["title"] for e in self.search(None, [("c", 1.0)])], ["c"])
+        self.assertEqual([e["title"] for e in self.search([], [("c", 1.0)])], ["c"])
+        self.assertEqual([e["title"] for e in self.search(None, [("c", 1.0)], query_embedding=None)], ["c"])
+
+    def test_no_hits(self):
+        self.assertIsNone(self.search(None, None))
+        self.assertIsNone(self.search([], []))
+
+
+if __name__ == "__main__":
+    unittest.main()
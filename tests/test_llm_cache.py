@@ -0,0 +1,100 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from stubs import stub_database
+
+stub_database()
+
+from api import llm_cache  # noqa: E402
+from api.llm_cache import cached_completion, cached_stream, make_cache_key  # noqa: E402
+
+
+def request(user="Kijan sitiyasyon an ye?", system="You are PatrolX", **params):
+    return {"model": "grok", "messages": [{"role": "system", "content": system}, {"role": "user", "content": user}], **params}
+
+
+def completion(content, tokens=42):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                           usage=SimpleNamespace(total_tokens=tokens))
+
+
+class CacheKeyTest(unittest.TestCase):
+
+    def test_user_content_is_normalized(self):
+        key = make_cache_key("summary", 120, request())
+        self.assertEqual(make_cache_key("summary", 120, request(user="  kijan SITIYASYON an   ye? ")), key)
+        self.assertNotEqual(make_cache_key("summary", 120, request(user="Kijan Delmas ye?")), key)
+
+    def test_everything_else_is_part_of_the_key(self):
+        key = make_cache_key("summary", 120, request())
+        self.assertNotEqual(make_cache_key("analyse_chat", 120, request()), key)
+        self.assertNotEqual(make_cache_key("summary", 120, request(system="you are patrolx")), key)
+        self.assertNotEqual(make_cache_key("summary", 120, {**request(), "model": "other"}), key)
+        self.assertNotEqual(make_cache_key("summary", 120, request(temperature=0)), key)
+
+    def test_keys_change_with_the_time_bucket(self):
+        with mock.patch.object(llm_cache.time, "time", return_value=1000 * 120 + 1):
+            key = make_cache_key("summary", 120, request())
+        with mock.patch.object(llm_cache.time, "time", return_value=1001 * 120 - 1):
+            self.assertEqual(make_cache_key("summary", 120, request()), key)
+        with mock.patch.object(llm_cache.time, "time", return_value=1001 * 120 + 1):
+            self.assertNotEqual(make_cache_key("summary", 120, request()), key)
+
+
+class CachedCompletionTest(unittest.TestCase):
+
+    def setUp(self):
+        llm_cache.lru.clear()
+        patches = [
+            mock.patch.object(llm_cache, "LLM_CACHE_ENABLED", True),
+            mock.patch.object(llm_cache, "LLM_CACHE_SHARED", False),
+            mock.patch.object(llm_cache, "stats", {"hits": 0, "shared_hits": 0, "misses": 0, "saved_tokens": 0, "by_call_site": {}}),
+            mock.patch.object(llm_cache, "routed_completion", return_value=completion("Tout bagay anfòm")),
+            mock.patch.object(llm_cache, "routed_stream", side_effect=lambda call_site, **kwargs: iter(["Tout ", "bagay"])),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_repeated_request_is_served_from_the_cache(self):
+        self.assertEqual(cached_completion("summary", **request()), "Tout bagay anfòm")
+        self.assertEqual(cached_completion("summary", **request(user="kijan sitiyasyon an ye?")), "Tout bagay anfòm")
+        llm_cache.routed_completion.assert_called_once()
+        self.assertEqual(llm_cache.get_stats()["by_call_site"]["summary"], {"hits": 1, "misses": 1, "saved_tokens": 42})
+
+    def test_entries_expire_after_the_call_site_ttl(self):
+        with mock.patch.object(llm_cache.time, "time", return_value=1000 * 120):
+            cached_completion("summary", **request())
+        with mock.patch.object(llm_cache.time, "time", return_value=1000 * 120 + 121):
+            cached_completion("summary", **request())
+        self.assertEqual(llm_cache.routed_completion.call_count, 2)
+
+    def test_call_sites_without_ttl_are_not_cached(self):
+        with mock.patch.dict(llm_cache.CALL_SITE_TTLS, {"summary": 0}):
+            cached_completion("summary", **request())
+            cached_completion("summary", **request())
+        self.assertEqual(llm_cache.routed_completion.call_count, 2)
+        self.assertEqual(len(llm_cache.lru), 0)
+
+    def test_streams_share_entries_with_completions(self):
+        self.assertEqual(list(cached_stream("summary", **request())), ["Tout ", "bagay"])
+        self.assertEqual(cached_completion("summary", **request()), "Tout bagay")
+        self.assertEqual(list(cached_stream("summary", **request())), ["Tout bagay"])
+        llm_cache.routed_completion.assert_not_called()
+        llm_cache.routed_stream.assert_called_once()
+
+    def test_shared_tier_fills_the_lru(self):
+        shared = {"content": "From another instance", "tokens": 7}
+        with mock.patch.object(llm_cache, "LLM_CACHE_SHARED", True), \
+                mock.patch.object(llm_cache, "indexes_ready", True), \
+                mock.patch.object(llm_cache, "get_cached_llm_response", return_value=shared) as get_shared:
+            self.assertEqual(cached_completion("summary", **request()), "From another instance")
+            self.assertEqual(cached_completion("summary", **request()), "From another instance")
+        get_shared.assert_called_once()
+        llm_cache.routed_completion.assert_not_called()
+        self.assertEqual(llm_cache.stats["shared_hits"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
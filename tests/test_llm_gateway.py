@@ -0,0 +1,112 @@
+import time
+import unittest
+from unittest import mock
+
+from stubs import stub_database
+
+stub_database()
+
+import httpx  # noqa: E402
+import openai  # noqa: E402
+from api import llm_gateway  # noqa: E402
+from api.llm_gateway import CircuitBreaker, CircuitOpenError, call_model  # noqa: E402
+
+
+def timeout_error():
+    return openai.APITimeoutError(request=httpx.Request("POST", "https://api.x.ai/v1/chat/completions"))
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_opens_on_error_rate_and_recovers_after_a_trial(self):
+        breaker = CircuitBreaker(window=4, min_calls=4, error_rate=0.5, cooldown=60)
+        for failed in (True, False, True):
+            breaker.record(failed)
+        self.assertEqual(breaker.state, "closed")
+        breaker.record(False)
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        self.assertTrue(breaker.rejecting())
+
+        breaker.opened_at -= 60
+        self.assertFalse(breaker.rejecting())
+        self.assertEqual(breaker.state, "open")
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, "half_open")
+        # One trial at a time
+        self.assertFalse(breaker.allow())
+        self.assertTrue(breaker.rejecting())
+
+        breaker.record(False)
+        self.assertEqual(breaker.snapshot(), {"state": "closed", "recent_calls": 0, "recent_failures": 0})
+
+    def test_failed_trial_opens_again(self):
+        breaker = CircuitBreaker(window=2, min_calls=1, error_rate=0.5, cooldown=60)
+        breaker.record(True)
+        breaker.opened_at -= 60
+        self.assertTrue(breaker.allow())
+        breaker.record(True)
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+
+class CallModelTest(unittest.TestCase):
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(llm_gateway, "breakers", {}),
+            mock.patch.object(llm_gateway, "LLM_RETRY_MAX_WAIT", 0.01),
+            mock.patch.object(llm_gateway, "stats", {"calls": 0, "retries": 0, "failures": 0, "fast_failures": 0, "by_call_site": {}}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_retries_retryable_errors(self):
+        request = mock.Mock(side_effect=[timeout_error(), "response"])
+        self.assertEqual(call_model("summary", "grok", request, messages=[]), "response")
+        self.assertEqual(request.call_count, 2)
+        self.assertLessEqual(request.call_args.kwargs["timeout"], llm_gateway.CALL_SITE_DEADLINES["summary"])
+        self.assertEqual(llm_gateway.stats["by_call_site"]["summary"]["retries"], 1)
+        self.assertEqual(llm_gateway.get_breaker("grok").snapshot()["recent_failures"], 1)
+
+    def test_client_errors_are_not_retried_nor_held_against_the_model(self):
+        request = mock.Mock(side_effect=ValueError("bad request"))
+        with self.assertRaises(ValueError):
+            call_model("summary", "grok", request)
+        request.assert_called_once()
+        self.assertEqual(llm_gateway.get_breaker("grok").snapshot()["recent_failures"], 0)
+        self.assertEqual(llm_gateway.stats["failures"], 1)
+
+    def test_gives_up_after_max_attempts(self):
+        request = mock.Mock(side_effect=[timeout_error() for _ in range(llm_gateway.LLM_MAX_ATTEMPTS + 1)])
+        with self.assertRaises(openai.APITimeoutError):
+            call_model("summary", "grok", request)
+        self.assertEqual(request.call_count, llm_gateway.LLM_MAX_ATTEMPTS)
+
+    def test_no_retry_starts_after_the_deadline(self):
+        def slow_failure(**kwargs):
+            time.sleep(0.2)
+            raise timeout_error()
+
+        request = mock.Mock(side_effect=slow_failure)
+        with mock.patch.object(llm_gateway, "LLM_MAX_ATTEMPTS", 10), \
+                mock.patch.object(llm_gateway, "LLM_RETRY_MAX_WAIT", 5):
+            started = time.monotonic()
+            with self.assertRaises(openai.APITimeoutError):
+                call_model("summary", "grok", request, deadline=0.5)
+        # The backoff is clamped to the deadline instead of sleeping up to 5s
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertLess(request.call_count, 4)
+
+    def test_open_circuit_fails_fast(self):
+        llm_gateway.get_breaker("grok").open()
+        request = mock.Mock()
+        with self.assertRaises(CircuitOpenError):
+            call_model("summary", "grok", request)
+        request.assert_not_called()
+        self.assertEqual(llm_gateway.stats["fast_failures"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+from unittest import mock
+
+from stubs import stub_database
+
+stub_database()
+
+import httpx  # noqa: E402
+import openai  # noqa: E402
+from api import llm_gateway, model_router  # noqa: E402
+from api.model_router import attempt_deadline, record_call, routed_completion, select_models  # noqa: E402
+
+
+def record_calls(model, latency, count, failed=False, call_site="summary"):
+    for _ in range(count):
+        record_call(model, call_site, latency, failed)
+
+
+class SelectModelsTest(unittest.TestCase):
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(model_router, "MODELS", ["best", "fast"]),
+            mock.patch.object(model_router, "windows", {}),
+            mock.patch.object(model_router, "stats", {"fallbacks": 0, "rerouted": 0}),
+            mock.patch.object(model_router.random, "random", return_value=0.5),
+            mock.patch.object(llm_gateway, "breakers", {}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_preferred_model_first(self):
+        self.assertEqual(select_models("summary", "best"), ["best", "fast"])
+        self.assertEqual(select_models("summary", "fast"), ["fast", "best"])
+
+    def test_slow_model_is_rerouted_to_a_faster_one(self):
+        record_calls("best", 20, 10)
+        record_calls("fast", 2, 10)
+        self.assertEqual(select_models("summary", "best"), ["fast", "best"])
+        self.assertEqual(model_router.stats["rerouted"], 1)
+        # Batch call sites have no budget and keep the best model
+        self.assertEqual(select_models("analyse_msg", "best"), ["best", "fast"])
+
+    def test_explored_calls_keep_the_preferred_model(self):
+        record_calls("best", 20, 10)
+        record_calls("fast", 2, 10)
+        with mock.patch.object(model_router.random, "random", return_value=0.0):
+            self.assertEqual(select_models("summary", "best"), ["best", "fast"])
+
+    def test_failing_models_go_last_and_are_never_promoted(self):
+        record_calls("best", 1, 10, failed=True)
+        self.assertEqual(select_models("summary", "best"), ["fast", "best"])
+
+        # Slow preferred model, fast but failing alternate
+        model_router.windows.clear()
+        record_calls("best", 20, 10)
+        record_calls("fast", 2, 10)
+        record_calls("fast", 2, 10, failed=True)
+        self.assertEqual(select_models("summary", "best"), ["best", "fast"])
+
+    def test_old_failures_expire(self):
+        record_calls("best", 1, 10, failed=True)
+        with mock.patch.object(model_router, "ROUTER_ERROR_MAX_AGE", -1):
+            self.assertEqual(select_models("summary", "best"), ["best", "fast"])
+
+    def test_open_breakers_go_last_until_their_trial(self):
+        breaker = llm_gateway.get_breaker("best")
+        breaker.open()
+        self.assertEqual(select_models("summary", "best"), ["fast", "best"])
+        # Cooldown elapsed: the next call is the trial, its old failures do not count
+        breaker.opened_at -= breaker.cooldown
+        record_calls("best", 1, 10, failed=True)
+        self.assertEqual(select_models("summary", "best"), ["best", "fast"])
+
+
+class RoutedCompletionTest(unittest.TestCase):
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(model_router, "select_models", return_value=["best", "fast"]),
+            mock.patch.object(model_router, "windows", {}),
+            mock.patch.object(model_router, "stats", {"fallbacks": 0, "rerouted": 0}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_attempt_deadline(self):
+        with mock.patch.object(model_router, "ROUTER_FALLBACK_RESERVE", 0.3), \
+                mock.patch.object(model_router, "ROUTER_FALLBACK_FACTOR", 2):
+            self.assertAlmostEqual(attempt_deadline(None, 100, last=False), 70)
+            self.assertAlmostEqual(attempt_deadline(10, 100, last=False), 20)
+            self.assertAlmostEqual(attempt_deadline(10, 100, last=True), 100)
+            self.assertAlmostEqual(attempt_deadline(10, 0.2, last=True), 1.0)
+
+    def test_falls_back_on_retryable_errors(self):
+        error = openai.APITimeoutError(request=httpx.Request("POST", "https://api.x.ai/v1/chat/completions"))
+        with mock.patch.object(model_router, "chat_completion", side_effect=[error, "response"]) as chat_completion:
+            self.assertEqual(routed_completion("summary", "best", messages=[]), "response")
+        self.assertEqual([c.args[1] for c in chat_completion.call_args_list], ["best", "fast"])
+        self.assertEqual(model_router.stats["fallbacks"], 1)
+        self.assertEqual(model_router.get_window("best", "summary").error_rate(), 1.0)
+
+    def test_skips_open_circuits_and_raises_client_errors(self):
+        with mock.patch.object(model_router, "chat_completion",
+                               side_effect=[llm_gateway.CircuitOpenError("open"), "response"]):
+            self.assertEqual(routed_completion("summary", "best", messages=[]), "response")
+        self.assertEqual(model_router.stats["fallbacks"], 0)
+
+        with mock.patch.object(model_router, "chat_completion", side_effect=ValueError("bad request")) as chat_completion:
+            with self.assertRaises(ValueError):
+                routed_completion("summary", "best", messages=[])
+        chat_completion.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from unittest import mock
+
+from stubs import stub_database
+
+stub_database()
+
+from api import near_dup  # noqa: E402
+from api.near_dup import (  # noqa: E402
+    NearDuplicateIndex, estimate_similarity, forget_messages, get_shingles, group_near_duplicates, minhash_signature
+)
+
+ALERT = "Tire nan Martissant kounye a, tout moun ap kouri sou wout Carrefour"
+VARIANT = "Tire nan Martissant kounye a, tout moun ap kouri sou wout Kafou"
+OTHER = "Blokis nan Delmas 33, machin pa ka pase"
+
+
+def signature(text):
+    return minhash_signature(get_shingles(text))
+
+
+class MinHashTest(unittest.TestCase):
+
+    def test_similarity(self):
+        self.assertGreaterEqual(estimate_similarity(signature(ALERT), signature(VARIANT)), near_dup.NEAR_DUP_THRESHOLD)
+        self.assertLess(estimate_similarity(signature(ALERT), signature(OTHER)), near_dup.NEAR_DUP_THRESHOLD)
+        # Stable across calls, so signatures can be compared between requests
+        self.assertTrue((signature(ALERT) == signature(ALERT)).all())
+
+    def test_empty_text_has_no_signature(self):
+        self.assertEqual(get_shingles("🔫"), set())
+        self.assertIsNone(signature("!!"))
+
+
+class NearDuplicateIndexTest(unittest.TestCase):
+
+    def test_query_add_and_remove(self):
+        index = NearDuplicateIndex()
+        entry_id = index.add(signature(ALERT), "f1")
+        match = index.query(signature(VARIANT))
+        self.assertEqual(match[:2], (entry_id, "f1"))
+        self.assertIsNone(index.query(signature(OTHER)))
+
+        self.assertEqual(index.remove_message(signature(ALERT), "other fingerprint"), 0)
+        self.assertEqual(index.remove_message(signature(ALERT), "f1"), 1)
+        self.assertIsNone(index.query(signature(ALERT)))
+        self.assertEqual(index.buckets, [{} for _ in range(index.bands)])
+
+    def test_expired_entries_are_evicted(self):
+        index = NearDuplicateIndex(window_hours=-1)
+        index.add(signature(ALERT), "f1")
+        index.evict_expired()
+        self.assertEqual(index.entries, {})
+        self.assertIsNone(index.query(signature(ALERT)))
+
+
+class GroupNearDuplicatesTest(unittest.TestCase):
+
+    def setUp(self):
+        patch = mock.patch.object(near_dup, "index", NearDuplicateIndex())
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_batch_copies_are_folded_into_the_first_message(self):
+        messages = [{"text": ALERT}, {"text": OTHER}, {"text": VARIANT}, {"text": ""}]
+        representatives, collapsed = group_near_duplicates(messages)
+        self.assertEqual(collapsed, 1)
+        self.assertEqual([m["text"] for m in representatives], [ALERT, OTHER, ""])
+        self.assertEqual(representatives[0]["near_duplicates"], 1)
+
+    def test_copy_of_an_earlier_request(self):
+        group_near_duplicates([{"text": ALERT}])
+
+        with mock.patch.object(near_dup, "count_as_source", return_value=True) as count:
+            self.assertEqual(group_near_duplicates([{"text": VARIANT}]), ([], 1))
+        count.assert_called_once()
+
+        # The earlier message never became an event: the copy takes its place
+        with mock.patch.object(near_dup, "count_as_source", return_value=False):
+            self.assertEqual(group_near_duplicates([{"text": VARIANT}]), ([{"text": VARIANT}], 0))
+        self.assertEqual(len(near_dup.index.entries), 1)
+
+    def test_forgotten_messages_no_longer_match(self):
+        representatives, _ = group_near_duplicates([{"text": ALERT}, {"text": OTHER}])
+        forget_messages(representatives[:1] + [{"text": ""}])
+        self.assertEqual(len(near_dup.index.entries), 1)
+        self.assertEqual(group_near_duplicates([{"text": VARIANT}]), ([{"text": VARIANT}], 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import json
+import unittest
+from unittest import mock
+
+from stubs import stub_database
+
+stub_database()
+
+from api import pretriage  # noqa: E402
+from api.pretriage import (  # noqa: E402
+    PretriageBatcher, harmonize_cluster_ids, route_results, run_pretriage, split_into_shards, tag_messages
+)
+
+
+def echo_pretriage(raw_messages):
+    """Pretriage stand-in returning one message per raw message, with its batch ref."""
+    return [{"original_text": m["text"], "ref": ref} for ref, m in enumerate(raw_messages)]
+
+
+def half_shard_messages(count):
+    """Messages of a bit less than half the shard budget each: two fit in a shard."""
+    return [f"{i} " + "x" * (pretriage.PRETRIAGE_SHARD_TOKENS * 2 - 40) for i in range(count)]
+
+
+class PretriageBatcherTest(unittest.TestCase):
+
+    def test_flush_hands_each_job_its_own_results(self):
+        batcher = PretriageBatcher()
+        batch = [
+            ([{"text": "a"}, {"text": "b"}], pretriage.Future()),
+            ([{"text": "c"}], pretriage.Future()),
+        ]
+        with mock.patch.object(pretriage, "run_pretriage", echo_pretriage):
+            batcher.flush(batch)
+
+        first, second = (future.result(timeout=0) for _, future in batch)
+        self.assertEqual(first["messages"], [{"original_text": "a", "ref": 0}, {"original_text": "b", "ref": 1}])
+        self.assertEqual(second["messages"], [{"original_text": "c", "ref": 0}])
+
+    def test_flush_drops_invalid_refs(self):
+        batcher = PretriageBatcher()
+        batch = [([{"text": "a"}], pretriage.Future())]
+        results = [{"original_text": "a", "ref": 0}, {"original_text": "?", "ref": 5}, {"original_text": "?"}]
+        with mock.patch.object(pretriage, "run_pretriage", return_value=results):
+            batcher.flush(batch)
+
+        self.assertEqual(batch[0][1].result(timeout=0), {"messages": [{"original_text": "a", "ref": 0}]})
+
+    def test_flush_fails_every_future_when_pretriage_fails(self):
+        batcher = PretriageBatcher()
+        batch = [([{"text": "a"}], pretriage.Future()), ([{"text": "b"}], pretriage.Future())]
+        with mock.patch.object(pretriage, "run_pretriage", side_effect=RuntimeError("Preprocessing failed")):
+            batcher.flush(batch)
+
+        for _, future in batch:
+            with self.assertRaisesRegex(RuntimeError, "Preprocessing failed"):
+                future.result(timeout=0)
+
+    def test_submissions_in_one_window_share_a_call(self):
+        batcher = PretriageBatcher(window_seconds=0.2, max_messages=3)
+        calls = []
+
+        def run(raw_messages):
+            calls.append([m["text"] for m in raw_messages])
+            return echo_pretriage(raw_messages)
+
+        with mock.patch.object(pretriage, "run_pretriage", run):
+            first = batcher.submit([{"text": "a"}])
+            second = batcher.submit([{"text": "b"}, {"text": "c"}])
+            self.assertEqual(first.result(timeout=5)["messages"], [{"original_text": "a", "ref": 0}])
+            self.assertEqual(second.result(timeout=5)["messages"],
+                             [{"original_text": "b", "ref": 0}, {"original_text": "c", "ref": 1}])
+
+        self.assertEqual(calls, [["a", "b", "c"]])
+
+
+class ShardingTest(unittest.TestCase):
+
+    def test_tag_messages(self):
+        self.assertEqual(tag_messages([{"text": "a", "id": 7}, "b"], start=3),
+                         [{"text": "a", "id": 7, "ref": 3}, {"text": "b", "ref": 4}])
+
+    def test_split_into_shards_keeps_order_within_budget(self):
+        tagged = tag_messages(["x" * 40] * 5)
+        shards = split_into_shards(tagged, max_tokens=40)
+        self.assertEqual([[m["ref"] for m in shard] for shard in shards], [[0, 1], [2, 3], [4]])
+        # A message over the budget still gets a shard of its own
+        self.assertEqual(len(split_into_shards(tag_messages(["x" * 400]), max_tokens=40)), 1)
+
+    def test_route_results_falls_back_to_original_text(self):
+        tagged = tag_messages(["tire nan Martissant", "blokis Delmas"])
+        routed = route_results([
+            {"original_text": "blokis Delmas", "ref": 99},
+            {"original_text": " tire nan Martissant "},
+            {"original_text": "unknown"},
+        ], tagged)
+        self.assertEqual(routed, {1: {"original_text": "blokis Delmas"}, 0: {"original_text": " tire nan Martissant "}})
+
+    def test_harmonize_cluster_ids_across_shards(self):
+        messages = [
+            {"cluster_id": "Tirs Martissant", "location_hint": "Martissant", "category_hint": "shooting"},
+            {"cluster_id": "shooting_2", "location_hint": "martissant", "category_hint": "shooting"},
+            {"cluster_id": "other", "location_hint": "Martissant", "category_hint": "roadblock"},
+            {"cluster_id": None, "location_hint": None},
+        ]
+        harmonize_cluster_ids(messages)
+        self.assertEqual([m["cluster_id"] for m in messages], ["tirs_martissant", "tirs_martissant", "other", "general"])
+
+    def test_run_pretriage_merges_shards_in_ref_order(self):
+        def preprocess(shard):
+            return json.dumps({"messages": [
+                {"original_text": m["text"], "ref": m["ref"], "cluster_id": f"c{m['ref']}",
+                 "location_hint": "Delmas", "category_hint": "roadblock"}
+                for m in reversed(shard)
+            ]})
+
+        with mock.patch.object(pretriage, "preprocess_msg", side_effect=preprocess) as preprocess_msg:
+            messages = run_pretriage(half_shard_messages(5))
+
+        self.assertEqual(preprocess_msg.call_count, 3)
+        self.assertEqual([m["ref"] for m in messages], [0, 1, 2, 3, 4])
+        self.assertEqual({m["cluster_id"] for m in messages}, {"c0"})
+
+    def test_run_pretriage_fails_when_a_shard_fails(self):
+        with mock.patch.object(pretriage, "preprocess_msg", side_effect=[json.dumps({"messages": []}), None, None]):
+            with self.assertRaises(RuntimeError):
+                run_pretriage(half_shard_messages(5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from unittest import mock
+
+from stubs import stub_database
+
+stub_database()
+
+from api import query_parser  # noqa: E402
+from api.query_parser import detect_language, parse_query, parse_query_locally  # noqa: E402
+
+
+class ParseQueryTest(unittest.TestCase):
+
+    def assertParsed(self, question, confidence=1.0, **expected):
+        query_params, parsed_confidence = parse_query(question)
+        self.assertEqual({k: query_params[k] for k in expected}, expected, question)
+        self.assertEqual(parsed_confidence, confidence, question)
+
+    def test_creole_question_with_subzone(self):
+        self.assertParsed("Eske gen tire nan Delmas 33 jodi a?", query_type="combined", location="Delmas 33",
+                          location_is_general=False, event_types=["shooting"], time_range="today", language="ht")
+
+    def test_parent_zone_is_a_general_location(self):
+        self.assertParsed("ki sa k ap pase Delmas?", query_type="location", location="Delmas",
+                          location_is_general=True, time_range="any", language="ht")
+
+    def test_longest_zone_name_wins(self):
+        self.assertParsed("Quelle est la situation à Carrefour-Feuilles?", location="Carrefour-Feuilles",
+                          language="fr")
+
+    def test_severity_and_time_range(self):
+        self.assertParsed("critical events last week", query_type="combined", location=None,
+                          severity="critical", time_range="last_week", language="en")
+
+    def test_situation_questions_look_at_the_last_24h(self):
+        self.assertParsed("How is the situation?", query_type="general", time_range="last_24h", language="en")
+        self.assertParsed("Eske m ka soti jodi a?", query_type="general", time_range="last_24h", language="ht")
+
+    def test_ambiguous_or_unknown_questions_are_not_confident(self):
+        self.assertParsed("Tire nan Martissant ak Delmas", confidence=0.5, location="Martissant")
+        self.assertParsed("Eske gen tire grav yer nan Tabarre 52?", confidence=0.75, location="Tabarre 52")
+        self.assertParsed("My cousin wants to know about the price of rice", confidence=0.0, query_type="general")
+
+    def test_detect_language(self):
+        self.assertEqual(detect_language({"eske", "gen"}), "ht")
+        self.assertEqual(detect_language({"quelle", "est"}), "fr")
+        self.assertEqual(detect_language({"what", "is"}), "en")
+        self.assertIsNone(detect_language({"martissant"}))
+
+
+class ParseQueryLocallyTest(unittest.TestCase):
+
+    def test_falls_back_below_the_threshold(self):
+        with mock.patch.object(query_parser, "QUERY_PARSER_MIN_CONFIDENCE", 0.8):
+            self.assertEqual(parse_query_locally("Tire nan Martissant jodi a")["location"], "Martissant")
+            self.assertIsNone(parse_query_locally("Tire nan Martissant ak Delmas"))
+        with mock.patch.object(query_parser, "QUERY_PARSER_ENABLED", False):
+            self.assertIsNone(parse_query_locally("Tire nan Martissant jodi a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
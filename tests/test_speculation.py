@@ -0,0 +1,91 @@
+import unittest
+from datetime import datetime, UTC, timedelta
+from unittest import mock
+
+import numpy as np
+
+from stubs import stub_database
+
+stub_database()
+
+from api import speculation  # noqa: E402
+from api.speculation import SpeculativeRetrieval, start_speculative_retrieval  # noqa: E402
+
+
+def event(event_id, location, event_type="shooting", hours_ago=1):
+    start = (datetime.now(UTC) - timedelta(hours=hours_ago)).isoformat()
+    return {"_id": event_id, "location": location, "event_type": event_type, "severity": "high",
+            "timestamp_start": start, "summary": f"{event_type} @ {location}"}
+
+
+EVENTS = [
+    event("1", "Delmas 33"),
+    event("2", "Delmas 19", event_type="roadblock"),
+    event("3", "Martissant"),
+    event("4", "Delmas 33", hours_ago=20),
+]
+
+
+class SpeculativeRetrievalTest(unittest.TestCase):
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(speculation, "stats", {"started": 0, "candidates_used": 0, "candidates_missed": 0, "embeddings_used": 0}),
+            mock.patch.object(speculation, "get_query_embedding", return_value=np.ones(3)),
+            mock.patch.object(speculation, "get_events_for_chat", return_value=EVENTS),
+            mock.patch.object(speculation, "get_event_embeddings",
+                              side_effect=lambda ids: {i: {"embedding": f"vector {i}"} for i in ids}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_candidates_are_narrowed_in_memory(self):
+        retrieval = SpeculativeRetrieval("Eske gen tire Delmas jodi a?")
+        candidates = retrieval.candidates({"location": "Delmas", "location_is_general": True,
+                                           "event_types": ["shooting"], "time_range": "last_24h"})
+        self.assertEqual([e["summary"] for e in candidates], ["shooting @ Delmas 33"] * 2)
+        self.assertNotIn("_id", candidates[0])
+        speculation.get_events_for_chat.assert_called_once_with(
+            {"time_range": "last_24h"}, include_ids=True, limit=speculation.SPECULATIVE_CANDIDATE_LIMIT
+        )
+        speculation.get_event_embeddings.assert_not_called()
+        self.assertEqual(speculation.stats["candidates_used"], 1)
+
+    def test_embeddings_are_loaded_for_matching_events_only(self):
+        retrieval = SpeculativeRetrieval("Tire Martissant")
+        candidates = retrieval.candidates({"location": "Martissant", "time_range": "today"}, include_embeddings=True)
+        speculation.get_event_embeddings.assert_called_once_with(["3"])
+        self.assertEqual(candidates[0]["embedding"], "vector 3")
+
+    def test_cannot_answer_beyond_the_broad_fetch(self):
+        retrieval = SpeculativeRetrieval("Tire semen pase")
+        self.assertIsNone(retrieval.candidates({"time_range": "last_week"}))
+        self.assertIsNone(retrieval.candidates({"time_range": "any"}))
+
+        with mock.patch.object(speculation, "SPECULATIVE_CANDIDATE_LIMIT", len(EVENTS)):
+            self.assertIsNone(SpeculativeRetrieval("Tire").candidates({"time_range": "last_24h"}))
+
+        with mock.patch.object(speculation, "get_events_for_chat", side_effect=RuntimeError("down")):
+            self.assertIsNone(SpeculativeRetrieval("Tire").candidates({"time_range": "last_24h"}))
+        self.assertEqual(speculation.stats["candidates_missed"], 4)
+
+    def test_query_embedding(self):
+        retrieval = SpeculativeRetrieval("Tire")
+        np.testing.assert_array_equal(retrieval.query_embedding(), np.ones(3))
+        self.assertEqual(speculation.stats["embeddings_used"], 1)
+
+        # A failed speculative embedding is computed again and not counted as used
+        speculation.get_query_embedding.side_effect = [None, np.zeros(3)]
+        retrieval = SpeculativeRetrieval("Tire")
+        np.testing.assert_array_equal(retrieval.query_embedding(), np.zeros(3))
+        self.assertEqual(speculation.stats["embeddings_used"], 1)
+
+    def test_disabled(self):
+        with mock.patch.object(speculation, "CHAT_SPECULATION_ENABLED", False):
+            self.assertIsNone(start_speculative_retrieval("Tire"))
+        speculation.get_events_for_chat.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
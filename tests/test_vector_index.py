@@ -0,0 +1,107 @@
+import unittest
+from datetime import datetime, UTC, timedelta
+from unittest import mock
+
+import numpy as np
+
+from stubs import stub_database
+
+stub_database()
+
+from api import vector_index  # noqa: E402
+from api.event_embeddings import EVENT_EMBEDDING_MODEL, EVENT_EMBEDDING_VERSION, encode_embedding  # noqa: E402
+from api.vector_index import EventVectorIndex, search_events  # noqa: E402
+
+
+def hours_ago(hours):
+    return datetime.now(UTC) - timedelta(hours=hours)
+
+
+def stored_event(event_id, vector, **fields):
+    return {"_id": event_id, "embedding": encode_embedding(vector), "embedding_model": EVENT_EMBEDDING_MODEL,
+            "embedding_version": EVENT_EMBEDDING_VERSION, **fields}
+
+
+class EventVectorIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = EventVectorIndex(capacity=2)
+        self.index.add("a", [1, 0, 0], severity="low", event_type="roadblock", timestamp=hours_ago(1))
+        self.index.add("b", [1, 1, 0], severity="high", event_type="shooting", timestamp=hours_ago(2))
+        self.index.add("c", [0, 0, 1], severity="critical", event_type="shooting", timestamp=hours_ago(30))
+
+    def test_search_ranks_by_cosine_similarity(self):
+        results = self.index.search([2, 0, 0], top_k=2)
+        self.assertEqual([event_id for event_id, _ in results], ["a", "b"])
+        self.assertAlmostEqual(results[0][1], 1.0, places=5)
+        self.assertAlmostEqual(results[1][1], 2 ** -0.5, places=5)
+
+    def test_filters(self):
+        search = lambda **filters: [event_id for event_id, _ in self.index.search([1, 0, 0], **filters)]  # noqa: E731
+        self.assertEqual(search(min_severity="high"), ["b", "c"])
+        self.assertEqual(search(event_types=["shooting"]), ["b", "c"])
+        self.assertEqual(search(since=hours_ago(24)), ["a", "b"])
+        self.assertEqual(search(min_severity="critical", since=hours_ago(24)), [])
+
+    def test_update_remove_and_evict_keep_rows_contiguous(self):
+        self.index.add("a", [0, 1, 0], severity="low")
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.search([0, 1, 0], top_k=1)[0][0], "a")
+
+        self.index.remove("a")
+        self.assertEqual(self.index.ids, ["c", "b"])
+        self.assertEqual(self.index.rows, {"c": 0, "b": 1})
+        self.assertEqual(self.index.search([0, 0, 1], top_k=1)[0][0], "c")
+
+        self.assertEqual(self.index.evict_older_than(hours_ago(24)), 1)
+        self.assertEqual(self.index.ids, ["b"])
+
+    def test_rejects_other_dimensions_and_zero_vectors(self):
+        self.assertFalse(self.index.add("d", [1, 0]))
+        self.assertFalse(self.index.add("d", [0, 0, 0]))
+        self.assertEqual(self.index.search([1, 0]), [])
+        self.assertEqual(len(self.index), 3)
+
+
+class RefreshTest(unittest.TestCase):
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(vector_index, "index", EventVectorIndex()),
+            mock.patch.object(vector_index, "loaded_until", None),
+            mock.patch.object(vector_index, "last_refresh", 0.0),
+            mock.patch.object(vector_index, "VECTOR_INDEX_ENABLED", True),
+            mock.patch.object(vector_index, "VECTOR_SNAPSHOT_ENABLED", False),
+            mock.patch.object(vector_index, "get_embedded_events", return_value=[
+                stored_event("a", [1, 0], severity="high", timestamp_start=hours_ago(1).isoformat()),
+                stored_event("b", [0, 1], timestamp_start=hours_ago(2).isoformat()),
+                {**stored_event("c", [1, 1]), "embedding_version": EVENT_EMBEDDING_VERSION - 1},
+            ]),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_refresh_loads_updates_since_the_last_refresh(self):
+        started = datetime.now(UTC)
+        vector_index.refresh()
+        self.assertIsNone(vector_index.get_embedded_events.call_args.kwargs["updated_since"])
+        self.assertEqual(sorted(vector_index.index.ids), ["a", "b"])
+
+        vector_index.last_refresh = 0.1
+        vector_index.refresh()
+        updated_since = vector_index.get_embedded_events.call_args.kwargs["updated_since"]
+        overlap = timedelta(seconds=vector_index.VECTOR_INDEX_REFRESH_OVERLAP_SECONDS)
+        self.assertLessEqual(updated_since, started - overlap + timedelta(seconds=1))
+        self.assertGreaterEqual(updated_since, started - overlap)
+
+    def test_search_events_answers_the_hot_window_only(self):
+        results = search_events(np.array([1, 0]), {"since": hours_ago(24), "severity": "High"})
+        self.assertEqual([event_id for event_id, _ in results], ["a"])
+        self.assertIsNone(search_events(np.array([1, 0]), {"since": hours_ago(24 * 30)}))
+        self.assertIsNone(search_events(np.array([1, 0]), {}))
+        self.assertIsNone(search_events(np.array([1, 0, 0]), {"since": hours_ago(24)}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, UTC
+from unittest import mock
+
+import numpy as np
+
+from stubs import stub_database
+
+stub_database()
+
+from api import vector_index, vector_snapshot  # noqa: E402
+from api.event_embeddings import EVENT_EMBEDDING_MODEL, EVENT_EMBEDDING_VERSION  # noqa: E402
+from api.vector_index import EventVectorIndex  # noqa: E402
+from api.vector_snapshot import append_log, load_snapshot, read_log, save_snapshot, snapshot_path  # noqa: E402
+
+EVENT_A = "64b7f0c2a1b2c3d4e5f60718"
+EVENT_B = "64b7f0c2a1b2c3d4e5f60719"
+EVENT_C = "64b7f0c2a1b2c3d4e5f6071a"
+
+
+class VectorSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patch = mock.patch.object(vector_snapshot, "VECTOR_SNAPSHOT_DIR", os.path.join(directory.name, "index"))
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        self.index = EventVectorIndex()
+        self.index.add(EVENT_A, [3, 4], severity="high", event_type="shooting",
+                       timestamp=datetime(2026, 5, 1, 12, tzinfo=UTC))
+        self.index.add(EVENT_B, [0, 1])
+        self.header = {"dim": 2, "model": "m", "version": 1, "loaded_until": "2026-05-01T12:00:00+00:00"}
+
+    def test_snapshot_round_trip(self):
+        save_snapshot(self.index.export(), self.header)
+        header, arrays, log = load_snapshot("m", 1)
+
+        self.assertEqual((header["size"], header["loaded_until"]), (2, self.header["loaded_until"]))
+        self.assertEqual(arrays["ids"], [EVENT_A, EVENT_B])
+        self.assertIsInstance(arrays["matrix"], np.memmap)
+        np.testing.assert_allclose(arrays["matrix"], [[0.6, 0.8], [0, 1]], rtol=1e-6)
+        self.assertEqual(list(arrays["severity"]), [2, 0])
+        self.assertEqual(arrays["event_types"], ["shooting", None])
+        self.assertEqual(len(log), 0)
+
+    def test_snapshot_of_another_model_is_ignored(self):
+        save_snapshot(self.index.export(), self.header)
+        self.assertIsNone(load_snapshot("m", 2))
+        self.assertIsNone(load_snapshot("other", 1))
+
+    def test_no_snapshot(self):
+        self.assertIsNone(load_snapshot("m", 1))
+        self.assertIsNone(append_log([self.index.get_record(EVENT_A)], 2))
+
+    def test_append_log_ignores_a_partial_last_record(self):
+        save_snapshot(self.index.export(), self.header)
+        self.assertEqual(append_log([self.index.get_record(EVENT_A), self.index.get_record(EVENT_B)], 2), 2)
+        with open(snapshot_path("append.log"), "ab") as f:
+            f.write(b"\x00" * 10)
+
+        log = read_log(2)
+        self.assertEqual([record["id"].decode() for record in log], [EVENT_A, EVENT_B])
+        self.assertEqual(log[0]["event_type"], b"shooting")
+        np.testing.assert_allclose(log[0]["vector"], [0.6, 0.8], rtol=1e-6)
+
+    def test_index_is_restored_from_snapshot_and_log(self):
+        patches = [
+            mock.patch.object(vector_index, "index", EventVectorIndex()),
+            mock.patch.object(vector_index, "loaded_until", None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        save_snapshot(self.index.export(), {**self.header, "model": EVENT_EMBEDDING_MODEL,
+                                            "version": EVENT_EMBEDDING_VERSION})
+        self.index.add(EVENT_C, [1, 0], severity="critical", event_type="kidnapping")
+        append_log([self.index.get_record(EVENT_C)], 2)
+
+        self.assertTrue(vector_index.load_from_snapshot())
+        restored = vector_index.index
+        self.assertEqual(restored.ids, [EVENT_A, EVENT_B, EVENT_C])
+        self.assertEqual(restored.search([1, 0], top_k=1, min_severity="critical", event_types=["kidnapping"])[0][0], EVENT_C)
+        self.assertEqual(vector_index.loaded_until, datetime(2026, 5, 1, 12, tzinfo=UTC))
+        # Adds after a memory-mapped load grow into a regular array
+        restored.add("64b7f0c2a1b2c3d4e5f6071b", [1, 1])
+        self.assertEqual(len(restored), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()